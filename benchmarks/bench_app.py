@@ -0,0 +1,338 @@
+"""Offline end-to-end benchmark of the app's flows.
+
+Drives what the three pages do, without Streamlit and without OpenAI: the
+LLM is replaced by `benchmarks.stub_llm.StubTextGenerator`, which answers
+every prompt deterministically after an injected latency. For every dataset
+the stages are timed in page order:
+
+    explore      column profiles of the Data Explorer
+    quality      data quality rules of the Data Prep page
+    summarize    the LIDA summary ("default" or "llm")
+    goals        goal generation
+    render_warm  starting the render workers and loading the dataset in them
+    visualize    visualization code generation and rendering
+    analyses     explain, evaluate and recommend concurrently, recommendations rendered
+    guides       the prep guides
+
+Datasets are the bundled CSVs plus synthetic ones made from
+`--synthetic-base` with the rows and, separately, the columns repeated
+`--scales` times. Each stage reports wall time, CPU time of this process,
+the peak RSS of this process during the stage (sampled from /proc, the
+lifetime peak where there is none), (with --trace-memory) the peak of
+Python allocations during the stage, and the LLM calls and prompt tokens it
+made.
+
+The benchmark runs in a fresh working directory, so every cache under
+`data/` starts cold; `--repeat 2` also measures the warm caches, and
+`--workdir` reuses a directory between invocations.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_app --scales 10,100 --latency 0.5 --output bench.json
+    python -m benchmarks.bench_app --scales 10,100 --latency 0.5 --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# spawned profiling and render workers import `utils` from the repository, whatever the working directory
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from lida import Manager, TextGenerationConfig  # noqa: E402
+from lida.utils import clean_column_names  # noqa: E402
+
+from benchmarks.stub_llm import StubTextGenerator  # noqa: E402
+from utils.data_explorer import dataset_columns, load_profiles  # noqa: E402
+from utils.dataset_store import open_dataset  # noqa: E402
+from utils.llm_pool import DEFAULT_MAX_CONCURRENCY, DEFAULT_TIMEOUT, run_concurrently  # noqa: E402
+from utils.parallel_profiler import default_workers, process_pool  # noqa: E402
+from utils.prep_guide import SHARD_TOKEN_BUDGET, GuideExplorer  # noqa: E402
+from utils.quality import quality_issues  # noqa: E402
+from utils.renderer import RENDER_TIMEOUT, default_render_workers, execute_charts, render_pool  # noqa: E402
+from utils.summary import summarize  # noqa: E402
+from utils.summary_codec import PROMPT_SUMMARY_TOKENS, encode_summary, fit_summary  # noqa: E402
+from utils.tokens import count_tokens  # noqa: E402
+
+BUNDLED_DATASETS = ["datasets/titanic.csv", "datasets/covid_data.csv", "datasets/example-data-bad.csv"]
+# seconds between samples of the resident memory during a stage
+RSS_INTERVAL = 0.01
+
+
+def scaled_datasets(base_path: str, scales: list, directory: str) -> list:
+    """ Write the synthetic datasets: rows repeated, then columns repeated, `scale` times """
+    base = pd.read_csv(base_path)
+    name = os.path.splitext(os.path.basename(base_path))[0]
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for scale in scales:
+        path = os.path.join(directory, f"{name}-rows-x{scale}.csv")
+        if not os.path.exists(path):
+            pd.concat([base] * scale, ignore_index=True).to_csv(path, index=False)
+        paths.append(path)
+
+        path = os.path.join(directory, f"{name}-columns-x{scale}.csv")
+        if not os.path.exists(path):
+            copies = [base.add_suffix(f"_{copy}") if copy else base for copy in range(scale)]
+            pd.concat(copies, axis=1).to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def rss_mb() -> float:
+    """ The current resident memory of this process, None without /proc """
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+
+
+class RssSampler:
+    """ Samples the resident memory in a thread while a stage runs
+
+    `ru_maxrss` is the peak over the process lifetime, so after a large
+    dataset every later stage would report it; the samples give the peak of
+    the stage itself.
+    """
+
+    def __init__(self, interval: float = RSS_INTERVAL) -> None:
+        self.interval = interval
+        self.peak = rss_mb()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def __enter__(self) -> "RssSampler":
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True, name="rss")
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._thread is None:
+            # no /proc, e.g. macOS or Windows
+            self.peak = peak_rss_mb()
+            return
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+class Recorder:
+    """ Times the stages and collects one record per stage """
+
+    def __init__(self, text_gen: StubTextGenerator, meta: dict, trace_memory: bool) -> None:
+        self.text_gen = text_gen
+        self.meta = meta
+        self.trace_memory = trace_memory
+        self.records = []
+
+    def stage(self, name: str, func):
+        calls, tokens = self.text_gen.calls, self.text_gen.prompt_tokens
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        result, error = None, None
+        with RssSampler() as rss:
+            try:
+                result = func()
+            except Exception as exception:
+                error = f"{type(exception).__name__}: {exception}"
+        record = {
+            **self.meta,
+            "stage": name,
+            "wall_s": round(time.perf_counter() - wall, 4),
+            "cpu_s": round(time.process_time() - cpu, 4),
+            "peak_rss_mb": round(rss.peak, 1),
+            "peak_traced_mb": round(tracemalloc.get_traced_memory()[1] / (1 << 20), 1) if self.trace_memory else None,
+            "llm_calls": self.text_gen.calls - calls,
+            "prompt_tokens": self.text_gen.prompt_tokens - tokens,
+            "error": error,
+        }
+        self.records.append(record)
+        print(f"{record['dataset']:<36}{name:<13}{record['wall_s']:>9.3f}{record['cpu_s']:>9.3f}"
+              f"{record['peak_rss_mb']:>10.1f}{record['llm_calls']:>6}{record['prompt_tokens']:>9}"
+              f"  {error or ''}", flush=True)
+        return result
+
+
+def run_dataset(path: str, run: int, args) -> list:
+    dataset = open_dataset(path)
+    data = dataset.load()
+    cleaned = clean_column_names(data)
+    # numeric columns first, the stub plots the first columns
+    numeric = cleaned.select_dtypes("number").columns.tolist()
+    columns = numeric + [column for column in cleaned.columns if column not in numeric]
+    text_gen = StubTextGenerator(columns, latency=args.latency, seconds_per_token=args.seconds_per_token)
+    lida = Manager(text_gen=text_gen)
+    textgen_config = TextGenerationConfig(n=1, temperature=0, model="stub", use_cache=False)
+    viz_config = TextGenerationConfig(n=args.visualizations, temperature=0, model="stub", use_cache=False)
+
+    meta = {"dataset": os.path.basename(path), "rows": len(data), "columns": len(data.columns), "run": run}
+    recorder = Recorder(text_gen, meta, args.trace_memory)
+    stage = recorder.stage
+
+    stage("explore", lambda: load_profiles(dataset, dataset_columns(dataset), workers=args.workers))
+    issues = stage("quality", lambda: quality_issues(dataset))
+    summary = stage("summarize", lambda: summarize(lida, dataset, args.summary_method, textgen_config))
+    goals = stage("goals", lambda: lida.goals(
+        fit_summary(summary, args.summary_tokens, stage="goals"), n=args.goals, textgen_config=textgen_config))
+    stage("render_warm", lambda: render_pool(args.render_workers).warm(dataset))
+
+    viz_summary = fit_summary(summary, args.summary_tokens, stage="visualize") if summary else None
+
+    def visualize():
+        code_specs = lida.vizgen.generate(summary=viz_summary, goal=goals[0], textgen_config=viz_config,
+                                          text_gen=text_gen, library=args.library)
+        return execute_charts(code_specs, dataset, library=args.library, timeout=args.render_timeout,
+                              workers=args.render_workers)
+
+    charts = stage("visualize", visualize)
+
+    def analyses():
+        code = charts[0].code
+        tasks = {
+            "explain": lambda: lida.explain(code=code, textgen_config=textgen_config, library=args.library),
+            "evaluate": lambda: lida.evaluate(code=code, goal=goals[0], textgen_config=textgen_config,
+                                              library=args.library),
+            "recommend": lambda: lida.recommender.generate(code=code, summary=viz_summary, n=2,
+                                                           textgen_config=textgen_config, text_gen=text_gen,
+                                                           library="seaborn"),
+        }
+        results = {}
+        for name, result, error in run_concurrently(tasks, args.max_concurrency, DEFAULT_TIMEOUT):
+            if error is not None:
+                raise error
+            results[name] = result
+        results["recommend"] = execute_charts(results["recommend"], dataset, library="seaborn",
+                                              timeout=args.render_timeout, workers=args.render_workers)
+        return results
+
+    stage("analyses", analyses)
+
+    def guides():
+        explorer = GuideExplorer(summary_tokens=args.summary_tokens, issues=issues)
+        if count_tokens(encode_summary(summary, "full", stage="prep")) > SHARD_TOKEN_BUDGET:
+            return list(explorer.generate_sharded(summary, textgen_config, text_gen=text_gen, n=args.guides))
+        return list(explorer.generate_stream(summary, textgen_config, text_gen=text_gen, n=args.guides))
+
+    stage("guides", guides)
+    return recorder.records
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(records: list, baseline_path: str) -> None:
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    previous = {(record["dataset"], record["stage"], record["run"]): record for record in baseline["results"]}
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit')}), wall time:")
+    print(f"{'dataset':<36}{'stage':<13}{'before':>9}{'after':>9}{'change':>9}")
+    for record in records:
+        before = previous.get((record["dataset"], record["stage"], record["run"]))
+        if before is None or before["error"] or record["error"]:
+            continue
+        change = record["wall_s"] / before["wall_s"] if before["wall_s"] else float("nan")
+        print(f"{record['dataset']:<36}{record['stage']:<13}{before['wall_s']:>9.3f}{record['wall_s']:>9.3f}"
+              f"{change:>8.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--datasets", nargs="*", default=BUNDLED_DATASETS, help="CSV/JSON files to benchmark")
+    parser.add_argument("--synthetic-base", default="datasets/titanic.csv")
+    parser.add_argument("--scales", default="10,100",
+                        help="comma separated row and column repetitions of the synthetic datasets, '' for none")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per stub LLM call")
+    parser.add_argument("--seconds-per-token", type=float, default=0.0, help="stub LLM seconds per prompt token")
+    parser.add_argument("--summary-method", default="default", choices=["default", "llm", "columns"])
+    parser.add_argument("--summary-tokens", type=int, default=PROMPT_SUMMARY_TOKENS)
+    parser.add_argument("--library", default="seaborn", choices=["seaborn", "matplotlib", "plotly"])
+    parser.add_argument("--goals", type=int, default=3)
+    parser.add_argument("--visualizations", type=int, default=4)
+    parser.add_argument("--guides", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=default_workers(), help="profiling processes")
+    parser.add_argument("--render-workers", type=int, default=default_render_workers())
+    parser.add_argument("--render-timeout", type=float, default=RENDER_TIMEOUT)
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per dataset, later runs hit the caches")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="report the peak Python allocations of each stage (slows the stages down)")
+    parser.add_argument("--workdir", help="working directory for data/ caches, a fresh one by default")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare the wall times with")
+    args = parser.parse_args()
+
+    paths = [os.path.abspath(path) for path in args.datasets]
+    # relative to where the benchmark was started, before moving to the working directory
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="lida-bench-"))
+    scales = [int(scale) for scale in args.scales.split(",") if scale.strip()]
+    if scales:
+        paths += scaled_datasets(os.path.abspath(args.synthetic_base), scales, os.path.join(workdir, "synthetic"))
+
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    if args.trace_memory:
+        tracemalloc.start()
+
+    print(f"working directory {workdir}\n")
+    print(f"{'dataset':<36}{'stage':<13}{'wall (s)':>9}{'cpu (s)':>9}{'rss (MB)':>10}{'llm':>6}{'tokens':>9}")
+    records = []
+    try:
+        for path in paths:
+            for run in range(args.repeat):
+                records += run_dataset(path, run, args)
+    finally:
+        render_pool(args.render_workers).shutdown()
+        process_pool(args.workers).shutdown(wait=False, cancel_futures=True)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": records,
+    }
+    if output:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if baseline:
+        compare(records, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Benchmark the column profiling of the Data Explorer.
+
+Compares the original per-cell / per-bin implementation of `explore_column`
+with the vectorized `profile_column` on `datasets/covid_data.csv` repeated
+`--scale` times (1000x by default, ~4.5M rows).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_explore_column --scale 1000
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from utils.profiler import profile_column
+
+
+def legacy_is_numerical(obj) -> bool:
+    return isinstance(obj, float) or isinstance(obj, int) or pd.isna(obj)
+
+
+def legacy_profile_column(data: pd.DataFrame, col: str) -> tuple:
+    """ The original `explore_column` statistics, without the rendering """
+    is_numerical_field = all(data[col].apply(legacy_is_numerical))
+    if is_numerical_field:
+        quantiles = data[col].quantile([0, 0.25, 0.5, 0.75, 1.0]).tolist()
+        quantiles = [round(q, 0) for q in quantiles]
+        missing_count = data[col].isna().sum()
+        unique_count = data[col].nunique()
+        mean = round(data[col].mean(), 2)
+        std_dev = round(data[col].std(), 2)
+        bins_count = unique_count if unique_count <= 5 else 10
+        labels = pd.cut(data[col], bins=bins_count)
+        bin_dict = dict()
+        for label in labels.unique():
+            bin_dict[str(label)] = len(data.loc[labels == label, col].tolist())
+        description = {
+            "id": col,
+            "quantiles": quantiles,
+            "chart_columns": list(bin_dict.keys()),
+            "chart_data": list(bin_dict.values()),
+            "valid": data.shape[0] - missing_count,
+            "missing": missing_count,
+            "mean": mean,
+            "std_dev": std_dev,
+        }
+        return "numerical", description
+    missing_count = data[col].isna().sum()
+    unique_count = data[col].nunique()
+    occurence = data[col].value_counts()
+    most_com_count = occurence.max()
+    most_com = str(occurence[occurence == most_com_count].index.tolist())[1:-1]
+    description = {
+        "id": col,
+        "valid": data.shape[0] - missing_count,
+        "missing": missing_count,
+        "unique": unique_count,
+        "most_com": most_com,
+        "most_com_count": most_com_count,
+    }
+    return "nominal", description
+
+
+def best_of(func, data, col, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(data, col)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", default="datasets/covid_data.csv")
+    parser.add_argument("--scale", type=int, default=1000, help="number of times the rows are repeated")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per column, the best one is reported")
+    parser.add_argument("--skip-legacy", action="store_true", help="only time the vectorized profiler")
+    args = parser.parse_args()
+
+    base = pd.read_csv(args.dataset)
+    data = pd.concat([base] * args.scale, ignore_index=True)
+    print(f"{args.dataset} x{args.scale}: {data.shape[0]:,} rows, {data.shape[1]} columns\n")
+    print(f"{'column':<28}{'type':<11}{'legacy (s)':>12}{'vectorized (s)':>16}{'speedup':>10}")
+
+    total_legacy, total_new = 0.0, 0.0
+    for col in data.columns:
+        new_time, (kind, description) = best_of(profile_column, data, col, args.repeat)
+        total_new += new_time
+        if args.skip_legacy:
+            print(f"{col:<28}{kind:<11}{'-':>12}{new_time:>16.3f}{'-':>10}")
+            continue
+        legacy_time, (legacy_kind, legacy_description) = best_of(legacy_profile_column, data, col, args.repeat)
+        total_legacy += legacy_time
+        if legacy_kind != kind:
+            print(f"  note: {col} was {legacy_kind} in the legacy profiler, now {kind}")
+        elif kind == "numerical" and (legacy_description["quantiles"] != description["quantiles"]
+                                      or sum(legacy_description["chart_data"]) != sum(description["chart_data"])):
+            print(f"  note: {col} statistics differ from the legacy profiler")
+        print(f"{col:<28}{kind:<11}{legacy_time:>12.3f}{new_time:>16.3f}{legacy_time / new_time:>9.1f}x")
+
+    if args.skip_legacy:
+        print(f"\n{'total':<39}{'-':>12}{total_new:>16.3f}")
+    else:
+        print(f"\n{'total':<39}{total_legacy:>12.3f}{total_new:>16.3f}{total_legacy / total_new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
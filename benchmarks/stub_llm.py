@@ -0,0 +1,169 @@
+"""Deterministic stand-in for an llmx text generator, for offline benchmarks.
+
+The stub recognises which LIDA or prep guide prompt it is given and answers
+with a well-formed response built from the dataset columns: goals,
+commentaries, plotting code, explanations, evaluations, recommendations and
+summary annotations. Every call sleeps `latency` seconds plus
+`seconds_per_token` per prompt token to stand in for the API round trip.
+"""
+import ast
+import json
+import threading
+import time
+
+from llmx import TextGenerator
+from llmx.datamodel import Message, TextGenerationConfig, TextGenerationResponse
+
+PLOT_TEMPLATES = {
+    "seaborn": """import seaborn as sns
+import matplotlib.pyplot as plt
+import pandas as pd
+
+def plot(data: pd.DataFrame):
+    sns.histplot(data=data, x={column!r}, bins=20)
+    plt.title('Distribution of {column}', wrap=True)
+    return plt
+
+chart = plot(data)""",
+    "matplotlib": """import matplotlib.pyplot as plt
+import pandas as pd
+
+def plot(data: pd.DataFrame):
+    counts = data[{column!r}].astype(str).value_counts().head(20)
+    plt.bar(counts.index, counts.values)
+    plt.xticks(rotation=45)
+    plt.title('Counts of {column}', wrap=True)
+    return plt
+
+chart = plot(data)""",
+    "plotly": """import plotly.express as px
+import pandas as pd
+
+def plot(data: pd.DataFrame):
+    fig = px.histogram(data, x={column!r}, title='Distribution of {column}')
+    return fig
+
+chart = plot(data)""",
+}
+
+EVALUATION_DIMENSIONS = ["bugs", "transformation", "compliance", "type", "encoding", "aesthetics"]
+
+
+class StubTextGenerator(TextGenerator):
+    """ Text generator answering LIDA prompts locally, without any API call
+
+    Args:
+    ----
+        columns: list
+            The (cleaned) column names of the dataset, used in generated goals and code
+        latency: float
+            Seconds every call takes, on top of the per-token time
+        seconds_per_token: float
+            Seconds per prompt token (4 characters), as a crude model of prompt processing
+    """
+
+    def __init__(self, columns: list, latency: float = 0.0, seconds_per_token: float = 0.0, **kwargs):
+        super().__init__(provider="stub", **kwargs)
+        self.columns = [str(column) for column in columns] or ["value"]
+        self.latency = latency
+        self.seconds_per_token = seconds_per_token
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.lock = threading.Lock()
+
+    def count_tokens(self, text) -> int:
+        return len(str(text)) // 4
+
+    def _column(self, index: int) -> str:
+        return self.columns[index % len(self.columns)]
+
+    def _goals(self, n: int) -> str:
+        return json.dumps([{
+            "index": index,
+            "question": f"What is the distribution of {self._column(index)}?",
+            "visualization": f"histogram of {self._column(index)}",
+            "rationale": f"{self._column(index)} shows how the values are spread.",
+        } for index in range(n)])
+
+    def _guides(self, prompt: str) -> str:
+        n = 5
+        marker = "The number of COMMENTARIES to generate is "
+        if marker in prompt:
+            n = int(prompt.split(marker, 1)[1].split(".", 1)[0])
+        return json.dumps([{
+            "index": index,
+            "question": f"Are there missing or invalid values in {self._column(index)}?",
+            "rationale": f"{self._column(index)} feeds every downstream analysis.",
+            "recommendation": f"Validate {self._column(index)} and impute or drop invalid rows.",
+        } for index in range(n)])
+
+    def _code(self, library: str, index: int) -> str:
+        template = PLOT_TEMPLATES.get(library, PLOT_TEMPLATES["seaborn"])
+        return f"```\n{template.format(column=self._column(index))}\n```"
+
+    @staticmethod
+    def _library(prompt: str) -> str:
+        # the templates of the other libraries import matplotlib too
+        for library in ("plotly", "seaborn", "matplotlib"):
+            if library in prompt:
+                return library
+        return "seaborn"
+
+    def _enriched(self, prompt: str) -> str:
+        try:
+            summary = ast.literal_eval(prompt.split("Only return a JSON object.", 1)[1].strip())
+        except (IndexError, ValueError, SyntaxError):
+            summary = {"fields": [{"column": column, "properties": {}} for column in self.columns]}
+        summary["dataset_description"] = "A benchmark dataset."
+        for field in summary.get("fields", []):
+            field["properties"]["semantic_type"] = "unknown"
+            field["properties"]["description"] = f"The {field['column']} column."
+        return json.dumps(summary, default=str)
+
+    def _answer(self, messages: list, n: int) -> list:
+        system = messages[0]["content"] if messages else ""
+        prompt = "\n".join(str(message["content"]) for message in messages)
+        if "Annotate the dictionary" in prompt:
+            return [self._enriched(prompt)]
+        if "cleanliness of a dataset" in system:
+            return [self._guides(prompt)]
+        if "GOALS about data" in system:
+            goals = 5
+            marker = "The number of GOALS to generate is "
+            if marker in prompt:
+                goals = int(prompt.split(marker, 1)[1].split(".", 1)[0])
+            return [self._goals(goals)]
+        if "structured explanations" in system:
+            return [json.dumps([
+                {"section": section, "code": "None", "explanation": f"The {section} of the chart."}
+                for section in ("accessibility", "transformation", "visualization")])]
+        if "evaluating the quality" in system:
+            return [json.dumps([
+                {"dimension": dimension, "score": 7, "rationale": f"The {dimension} is reasonable."}
+                for dimension in EVALUATION_DIMENSIONS])]
+        library = self._library(prompt)
+        if "recommending a DIVERSE set" in system:
+            count = 2
+            marker = "Recommend "
+            if marker in prompt:
+                count = int(prompt.rsplit(marker, 1)[1].split(" ", 1)[0])
+            return ["\n*****\n".join(self._code(library, index + 1) for index in range(count))]
+        # visualization generation and editing
+        return [self._code(library, index) for index in range(n)]
+
+    def generate(self, messages, config: TextGenerationConfig = TextGenerationConfig(),
+                 **kwargs) -> TextGenerationResponse:
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        prompt_tokens = sum(self.count_tokens(message["content"]) for message in messages)
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+        time.sleep(self.latency + self.seconds_per_token * prompt_tokens)
+
+        contents = self._answer(messages, max(config.n or 1, 1))
+        return TextGenerationResponse(
+            text=[Message(role="assistant", content=content) for content in contents],
+            config=config,
+            usage={"prompt_tokens": prompt_tokens},
+        )
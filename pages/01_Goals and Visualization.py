@@ -1,9 +1,18 @@
 import streamlit as st
-from lida import Manager, TextGenerationConfig, llm
+from lida import TextGenerationConfig
 from lida.datamodel import Goal
 import pandas as pd
 
 from utils.side_bar import side_bar
+from utils.instrumentation import instrumentation_panel, span, start_run, timed
+from utils.llm_registry import get_manager
+from utils.memo import get_memo, memoized, set_memo
+from utils.llm_pool import DEFAULT_MAX_CONCURRENCY, DEFAULT_TIMEOUT, run_concurrently
+from utils.raster_store import chart_png, raster_key, raster_store
+from utils.relationships import relationships, top_pairs, with_relationships
+from utils.renderer import RENDER_TIMEOUT, default_render_workers, execute_charts, render_pool
+from utils.summary import summarize
+from utils.summary_codec import PROMPT_SUMMARY_TOKENS, fit_summary
 
 st.set_page_config(
     page_title="LIDA: Goals and Visualization",
@@ -12,6 +21,8 @@ st.set_page_config(
 
 st.title("Goals and Visualization")
 
+start_run("Goals and Visualization")
+
 openai_key = None
 selected_dataset = None
 selected_method = None
@@ -28,10 +39,50 @@ openai_key, temperature, use_cache, selected_dataset, selected_model, selected_m
     selected_method
 )
 
+def render_explanation(area, explanation):
+    with area.container():
+        for section in explanation[0]:
+            st.write(f"### {section['section']}")
+            st.write(section["explanation"])
+
+
+def render_evaluation(area, evaluation):
+    with area.container():
+        for dimension in evaluation[0]:
+            st.write(f"### {dimension['dimension']}, Score: **{dimension['score']}**")
+            st.write(dimension["rationale"])
+
+
+def render_recommendations(area, recommendations):
+    with area.container():
+        for recommendation in recommendations:
+            st.write(recommendation)
+
+
+def render_charts(area, charts, digest):
+    with area.container():
+        if not charts:
+            st.write("No visualization could be rendered for this goal.")
+        for index, chart in enumerate(charts):
+            png = chart_png(chart, digest)
+            if png:
+                st.image(png, caption=f"Visualization {index + 1}", use_column_width=True)
+
+
+def render_gallery(charts, digest, per_row=5):
+    store = raster_store()
+    for start in range(0, len(charts), per_row):
+        for column, (index, chart) in zip(st.columns(per_row), enumerate(charts[start:start + per_row], start)):
+            chart_png(chart, digest)
+            thumbnail = store.thumbnail(raster_key(chart.code, digest, chart.library))
+            if thumbnail:
+                column.image(thumbnail, caption=f"Visualization {index + 1}", use_column_width=True)
+
+
 def goals_visualizations(openai_key, selected_dataset, selected_method, temperature, selected_model, use_cache):
     # Step 3 - Generate data summary
     if openai_key and selected_dataset and selected_method:
-        lida = Manager(text_gen=llm("openai", api_key=openai_key))
+        lida = get_manager("openai", openai_key, selected_model)
         textgen_config = TextGenerationConfig(
             n=1,
             temperature=temperature,
@@ -43,7 +94,8 @@ def goals_visualizations(openai_key, selected_dataset, selected_method, temperat
         summary = []
         # **** lida.summarize *****
         
-        summary = lida.summarize(
+        summary = summarize(
+            lida,
             selected_dataset,
             summary_method=selected_method,
             textgen_config=textgen_config)
@@ -80,9 +132,33 @@ def goals_visualizations(openai_key, selected_dataset, selected_method, temperat
                 max_value=10,
                 value=3)
             own_goal = st.sidebar.checkbox("Add Your Own Goal")
+            summary_tokens = st.sidebar.number_input(
+                "Summary tokens per prompt",
+                min_value=200,
+                max_value=8000,
+                value=PROMPT_SUMMARY_TOKENS,
+                step=100,
+                help="The summary is sent in the most detailed form that fits")
+
+            relationship_pairs = st.sidebar.number_input(
+                "Column relationships for the goals",
+                min_value=0,
+                max_value=20,
+                value=0,
+                help="Add the strongest correlations and cross-tab associations (see the Data Explorer) to "
+                     "the summary the goals are generated from")
+
+            # prompts get a compact encoding, chart execution still gets the summary itself
+            goals_input = summary
+            if relationship_pairs:
+                goals_input = with_relationships(summary, top_pairs(relationships(selected_dataset),
+                                                                    relationship_pairs))
+            goals_summary = fit_summary(goals_input, summary_tokens, stage="goals", model=selected_model)
+            viz_summary = fit_summary(summary, summary_tokens, stage="visualize", model=selected_model)
 
             # **** lida.goals *****
-            goals = lida.goals(summary, n=num_goals, textgen_config=textgen_config)
+            with span("goals"):
+                goals = lida.goals(goals_summary, n=num_goals, textgen_config=textgen_config)
             st.write(f"## Goals ({len(goals)})")
 
             default_goal = goals[0].question
@@ -126,6 +202,41 @@ def goals_visualizations(openai_key, selected_dataset, selected_method, temperat
                     max_value=10,
                     value=2)
 
+                st.sidebar.write("## Concurrency")
+                max_concurrency = st.sidebar.slider(
+                    "Concurrent LLM calls",
+                    min_value=1,
+                    max_value=8,
+                    value=DEFAULT_MAX_CONCURRENCY)
+                call_timeout = st.sidebar.number_input(
+                    "LLM call timeout (seconds)",
+                    min_value=5,
+                    max_value=600,
+                    value=int(DEFAULT_TIMEOUT))
+                render_timeout = st.sidebar.number_input(
+                    "Chart rendering timeout (seconds)",
+                    min_value=1,
+                    max_value=300,
+                    value=int(RENDER_TIMEOUT))
+                render_workers = st.sidebar.slider(
+                    "Chart rendering processes",
+                    min_value=1,
+                    max_value=16,
+                    value=default_render_workers(),
+                    help="Visualizations are rendered in parallel, one per process")
+
+                # generated code runs in the render worker processes, never in this one
+                render_pool(render_workers).warm_async(selected_dataset)
+
+                def render(code_specs, library=selected_library):
+                    # reruns show the same charts without executing the code again
+                    return memoized(
+                        "render",
+                        (code_specs, selected_dataset.digest, library),
+                        lambda: execute_charts(code_specs, selected_dataset, library=library,
+                                               timeout=render_timeout, workers=render_workers),
+                        run=True)
+
                 textgen_config = TextGenerationConfig(
                     n=num_visualizations, temperature=temperature,
                     model=selected_model,
@@ -134,11 +245,17 @@ def goals_visualizations(openai_key, selected_dataset, selected_method, temperat
                 # viz_button = st.button("Generate Visualizations")
                 # if viz_button:
                 # **** lida.visualize *****
-                visualizations = lida.visualize(
-                    summary=summary,
-                    goal=selected_goal_object,
-                    textgen_config=textgen_config,
-                    library=selected_library)
+                with span("visualize"):
+                    code_specs = lida.vizgen.generate(
+                        summary=viz_summary,
+                        goal=selected_goal_object,
+                        textgen_config=textgen_config,
+                        text_gen=lida.text_gen,
+                        library=selected_library)
+                    visualizations = render(code_specs)
+
+                if len(visualizations) > 1:
+                    render_gallery(visualizations, selected_dataset.digest)
 
                 viz_titles = [f'Visualization {i+1}' for i in range(len(visualizations))]
 
@@ -146,93 +263,148 @@ def goals_visualizations(openai_key, selected_dataset, selected_method, temperat
 
                 selected_viz = visualizations[viz_titles.index(selected_viz_title)]
 
-                if selected_viz.raster:
-                    from PIL import Image
-                    import io
-                    import base64
-
-                    imgdata = base64.b64decode(selected_viz.raster)
-                    img = Image.open(io.BytesIO(imgdata))
-                    st.image(img, caption=selected_viz_title, use_column_width=True)
+                # PNG bytes straight from the raster store, no decoding
+                selected_png = chart_png(selected_viz, selected_dataset.digest)
+                if selected_png:
+                    st.image(selected_png, caption=selected_viz_title, use_column_width=True)
 
                 with st.expander("Show Visualization Code"):
                     st.write("### Visualization Code")
                     st.code(selected_viz.code)
 
                 if visualizations and len(visualizations) > 0:
+                    # results only depend on these, and are computed only when asked for; the
+                    # recommendations and edits are rendered on the dataset, so its hash is part of them
+                    memo_parts = (selected_dataset.digest, viz_summary, selected_viz.code, selected_goal_object,
+                                  selected_library, selected_model, temperature)
+
+                    run_all = st.button(
+                        "Run all analyses",
+                        help="Explain, evaluate and recommend at the same time")
+
                     viz_edit_tab, viz_explain_tab, viz_eval_tab, viz_rec_tab = st.tabs(
                         ["Edit", "Explain", "Evaluate", "Recommend"]
                     )
 
                     with viz_edit_tab:
                         instructions = st.text_input("Give instructions on how to edit the viz")
-                        edited_viz = lida.edit(
-                            code=selected_viz.code, 
-                            instructions=instructions, 
-                            summary=summary,
-                            library=selected_library,
-                            textgen_config=textgen_config
+                        edit_clicked = st.button("Edit visualization", disabled=not instructions)
+                        edited_viz = memoized(
+                            "edit",
+                            memo_parts + (instructions,),
+                            timed("edit", lambda: render(lida.vizeditor.generate(
+                                code=selected_viz.code,
+                                summary=viz_summary,
+                                instructions=[instructions],
+                                textgen_config=textgen_config,
+                                text_gen=lida.text_gen,
+                                library=selected_library))),
+                            run=edit_clicked and bool(instructions)
                         )
-                        
-                        edited_viz = edited_viz[0]
 
-                        if edited_viz.raster:
-                            edit_imgdata = base64.b64decode(edited_viz.raster)
-                            edit_img = Image.open(io.BytesIO(edit_imgdata))
-                            st.image(edit_img, caption="Edited Visualization", use_column_width=True)
+                        if edited_viz:
+                            edited_viz = edited_viz[0]
 
+                            edited_png = chart_png(edited_viz, selected_dataset.digest)
+                            if edited_png:
+                                st.image(edited_png, caption="Edited Visualization", use_column_width=True)
 
-                            with st.expander("Show Edited Visualization Code"):
-                                st.write("### Edited Visualization Code")
-                                st.code(edited_viz.code)
 
-    
+                                with st.expander("Show Edited Visualization Code"):
+                                    st.write("### Edited Visualization Code")
+                                    st.code(edited_viz.code)
+                        elif edited_viz is not None:
+                            st.write("The edited visualization could not be rendered.")
 
                     with viz_explain_tab:
-                        explanation = lida.explain(
-                            code=selected_viz.code,
-                        )
-                        explanation = explanation[0]
-
-                        for section in explanation:
-                            section_name = section["section"]
-                            section_explanation = section["explanation"]
-
-                            st.write(f"### {section_name}")
-                            st.write(section_explanation)
-
-                        
+                        explain_clicked = st.button("Explain visualization")
+                        explain_area = st.empty()
 
                     with viz_eval_tab:
-                        evaluation = lida.evaluate(
-                            code=selected_viz.code,
-                            goal=selected_goal_object,
-                            library=selected_library
-                        )
-
-                        evaluation = evaluation[0]
-
-                        for dimension in evaluation:
-                            dimension_name = dimension["dimension"]
-                            dimension_score = dimension["score"]
-                            dimension_rationale = dimension["rationale"]
-
-                            st.write(f"### {dimension_name}, Score: **{dimension_score}**")
-                            st.write(dimension_rationale)
-
+                        eval_clicked = st.button("Evaluate visualization")
+                        eval_area = st.empty()
 
                     with viz_rec_tab:
-                        recommendations = lida.recommend(
-                            code = selected_viz.code,
-                            summary=summary,
-                            n = 2, 
-                            textgen_config=textgen_config
-                        )
-
-                        for recommendation in recommendations:
-                            st.write(recommendation)
-
-
-                        
-
-goals_visualizations(openai_key, selected_dataset, selected_method, temperature, selected_model, use_cache)
\ No newline at end of file
+                        rec_clicked = st.button("Recommend visualizations")
+                        rec_area = st.empty()
+
+                    # only the LLM calls run in threads, charts are rendered by the render pool
+                    analyses = {
+                        "explain": (explain_clicked, explain_area, render_explanation,
+                                    lambda: lida.explain(code=selected_viz.code)),
+                        "evaluate": (eval_clicked, eval_area, render_evaluation,
+                                     lambda: lida.evaluate(
+                                         code=selected_viz.code,
+                                         goal=selected_goal_object,
+                                         library=selected_library)),
+                        "recommend": (rec_clicked, rec_area, render_recommendations,
+                                      lambda: lida.recommender.generate(
+                                          code=selected_viz.code,
+                                          summary=viz_summary,
+                                          n=2,
+                                          textgen_config=textgen_config,
+                                          text_gen=lida.text_gen,
+                                          library="seaborn")),
+                    }
+
+                    tasks = {}
+                    for name, (clicked, area, show, compute) in analyses.items():
+                        result = get_memo(name, memo_parts)
+                        if result is not None:
+                            show(area, result)
+                        elif clicked or run_all:
+                            area.info("Waiting for the model...")
+                            tasks[name] = timed(name, compute)
+
+                    for name, result, error in run_concurrently(tasks, max_concurrency, call_timeout):
+                        _, area, show, _ = analyses[name]
+                        if error is not None:
+                            area.warning(f"Could not {name} the visualization: {error}")
+                            continue
+                        if name == "recommend":
+                            result = render(result, library="seaborn")
+                        set_memo(name, memo_parts, result)
+                        show(area, result)
+
+                # Step 6 - Visualize other goals side by side
+                other_goals = [question for question in goal_questions if question != selected_goal]
+                compared_goals = st.multiselect("Visualize more goals", options=other_goals)
+                if compared_goals:
+                    visualize_clicked = st.button("Visualize selected goals")
+                    goal_areas = {}
+                    tasks = {}
+
+                    def goal_parts(goal):
+                        # the charts are generated from the summary and rendered on the dataset
+                        return (selected_dataset.digest, viz_summary, goal, selected_library, num_visualizations,
+                                selected_model, temperature)
+
+                    for question in compared_goals:
+                        goal = goals[goal_questions.index(question)]
+                        st.write(f"### {question}")
+                        goal_areas[question] = st.empty()
+                        charts = get_memo("visualize", goal_parts(goal))
+                        if charts is not None:
+                            render_charts(goal_areas[question], charts, selected_dataset.digest)
+                        elif visualize_clicked:
+                            goal_areas[question].info("Waiting for the model...")
+                            tasks[question] = timed("visualize", lambda goal=goal: lida.vizgen.generate(
+                                summary=viz_summary,
+                                goal=goal,
+                                textgen_config=textgen_config,
+                                text_gen=lida.text_gen,
+                                library=selected_library))
+
+                    for question, code_specs, error in run_concurrently(tasks, max_concurrency, call_timeout):
+                        if error is not None:
+                            goal_areas[question].warning(f"Could not visualize this goal: {error}")
+                            continue
+                        goal = goals[goal_questions.index(question)]
+                        charts = render(code_specs)
+                        set_memo("visualize", goal_parts(goal), charts)
+                        render_charts(goal_areas[question], charts, selected_dataset.digest)
+
+
+goals_visualizations(openai_key, selected_dataset, selected_method, temperature, selected_model, use_cache)
+
+instrumentation_panel()
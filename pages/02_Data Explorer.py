@@ -1,8 +1,8 @@
 import streamlit as st
-import pandas as pd
 
+from utils.instrumentation import instrumentation_panel, start_run
 from utils.side_bar import side_bar
-from utils.data_explorer import explore
+from utils.data_explorer import explore, relationship_view
 
 st.set_page_config(
     page_title="LIDA: Data Explorer",
@@ -11,6 +11,8 @@ st.set_page_config(
 
 st.title("Data Explorer")
 
+start_run("Data Explorer")
+
 openai_key = None
 selected_dataset = None
 selected_method = None
@@ -29,5 +31,7 @@ openai_key, temperature, use_cache, selected_dataset, selected_model, selected_m
 
 
 if selected_dataset is not None:
-    data = pd.read_csv(str(selected_dataset))   
-    explore(data)
\ No newline at end of file
+    explore(selected_dataset)
+    relationship_view(selected_dataset)
+
+instrumentation_panel()
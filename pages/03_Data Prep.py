@@ -1,9 +1,15 @@
 import streamlit as st
 import pandas as pd
 
-from lida import Manager, TextGenerationConfig, llm
+from lida import TextGenerationConfig
 from utils.side_bar import side_bar
-from utils.prep_guide import GuideExplorer
+from utils.instrumentation import instrumentation_panel, span, start_run
+from utils.llm_registry import get_manager
+from utils.summary import summarize
+from utils.prep_guide import SHARD_TOKEN_BUDGET, GuideExplorer
+from utils.quality import quality_issues
+from utils.summary_codec import PROMPT_SUMMARY_TOKENS, encode_summary
+from utils.tokens import count_tokens
 
 st.set_page_config(
     page_title="LIDA: Data Preprocessing Guide",
@@ -12,6 +18,8 @@ st.set_page_config(
 
 st.title("Data Preprocessing Guide")
 
+start_run("Data Prep")
+
 openai_key = None
 selected_dataset = None
 selected_method = None
@@ -29,9 +37,22 @@ openai_key, temperature, use_cache, selected_dataset, selected_model, selected_m
 )
 
 
+issues = []
+if selected_dataset:
+    # exact checks, shown before (and without) any LLM call
+    with span("quality"):
+        issues = quality_issues(selected_dataset)
+    st.write(f"## Detected issues ({len(issues)})")
+    if issues:
+        st.dataframe(
+            pd.DataFrame(issues)[["rule", "column", "count", "share", "message", "examples"]],
+            hide_index=True)
+    else:
+        st.write("The automated checks found no issues.")
+
 
 if openai_key and selected_dataset and selected_method:
-    lida = Manager(text_gen=llm("openai", api_key=openai_key))
+    lida = get_manager("openai", openai_key, selected_model)
     textgen_config = TextGenerationConfig(
         n=1,
         temperature=temperature,
@@ -39,7 +60,8 @@ if openai_key and selected_dataset and selected_method:
         use_cache=use_cache
     )
 
-    summary = lida.summarize(
+    summary = summarize(
+        lida,
         selected_dataset,
         summary_method=selected_method,
         textgen_config=textgen_config
@@ -47,18 +69,39 @@ if openai_key and selected_dataset and selected_method:
 
     num_guides = st.slider("Number of Guides", min_value=1, max_value=10, value=3)
 
-    explorer = GuideExplorer()
+    summary_tokens = st.sidebar.number_input(
+        "Summary tokens per prompt",
+        min_value=200,
+        max_value=8000,
+        value=PROMPT_SUMMARY_TOKENS,
+        step=100,
+        help="The summary is sent in the most detailed form that fits")
 
-    guides = explorer.generate(
-        summary, 
-        textgen_config,
-        text_gen=lida.text_gen,
-        n=num_guides
-    )
+    st.write("## Guides")
+    explorer = GuideExplorer(summary_tokens=summary_tokens, issues=issues)
 
+    if count_tokens(encode_summary(summary, "full", stage="prep"), selected_model) > SHARD_TOKEN_BUDGET:
+        # wide dataset: column groups are prompted concurrently instead of one huge prompt
+        guides = explorer.generate_sharded(
+            summary,
+            textgen_config,
+            text_gen=lida.text_gen,
+            n=num_guides
+        )
+    else:
+        guides = explorer.generate_stream(
+            summary, 
+            textgen_config,
+            text_gen=lida.text_gen,
+            n=num_guides
+        )
+
+    # each guide is rendered as soon as the model has finished writing it
     for guide in guides:
-        st.write("**Index**: ", guide["index"])
-        st.write("**Question** ❓: ", guide["question"])
-        st.write("**Rationale** 📖: ", guide["rationale"])
-        st.write("**Recommendation** 🧾: ", guide["recommendation"])
-        st.write("____________________")
\ No newline at end of file
+        st.write("**Index**: ", guide.get("index"))
+        st.write("**Question** ❓: ", guide.get("question"))
+        st.write("**Rationale** 📖: ", guide.get("rationale"))
+        st.write("**Recommendation** 🧾: ", guide.get("recommendation"))
+        st.write("____________________")
+
+instrumentation_panel()
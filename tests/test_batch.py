@@ -0,0 +1,96 @@
+import argparse
+import base64
+import json
+import os
+import threading
+import time
+
+import pytest
+from lida.datamodel import ChartExecutorResponse, Goal
+
+from utils import batch
+from utils.batch import BoundedTextGenerator, DatasetJob
+from utils.dataset_store import Dataset
+from utils.llm_pool import run_concurrently
+from utils.summary_codec import PROMPT_SUMMARY_TOKENS
+
+
+class SleepingTextGenerator:
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+
+    def generate(self, *args, **kwargs):
+        time.sleep(self.seconds)
+        return "done"
+
+
+def test_the_wait_for_a_slot_is_not_counted_in_the_timeout():
+    semaphore = threading.Semaphore(1)
+    bounded = BoundedTextGenerator(SleepingTextGenerator(0.1), semaphore)
+    # another dataset of the batch holds the only slot for longer than the timeout
+    semaphore.acquire()
+    threading.Timer(1.0, semaphore.release).start()
+    results = list(run_concurrently({"shard": bounded.generate}, timeout=0.5))
+    assert results == [("shard", "done", None)]
+
+
+def test_a_slow_call_still_times_out():
+    bounded = BoundedTextGenerator(SleepingTextGenerator(2.0), threading.Semaphore(1))
+    [(name, result, error)] = run_concurrently({"shard": bounded.generate}, timeout=0.3)
+    assert result is None and isinstance(error, TimeoutError)
+
+
+class FakePool:
+    """ Renders the snippets with the given outcomes, one per call """
+
+    def __init__(self, outcomes: list) -> None:
+        self.outcomes = outcomes
+
+    def render(self, code_specs, dataset, **kwargs):
+        error = self.outcomes.pop(0)
+        return [ChartExecutorResponse(spec=None, status=error is None, raster=None if error else PNG,
+                                      code=code, library="seaborn", error=error) for code in code_specs]
+
+
+PNG = base64.b64encode(b"png").decode("ascii")
+SUMMARY = {"name": "points", "file_name": "points.csv", "dataset_description": "", "field_names": ["x"],
+           "fields": [{"column": "x", "properties": {"dtype": "number", "samples": [1, 2], "num_unique_values": 2}}]}
+
+
+@pytest.fixture
+def job(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "points.csv").write_text("x\n1\n2\n")
+    args = argparse.Namespace(
+        output=str(tmp_path / "reports"), model="stub", temperature=0.0, summary_method="default",
+        summary_tokens=PROMPT_SUMMARY_TOKENS, library="seaborn", goals=1, visualizations=1, guides=1,
+        relationships=0, render_workers=1, render_timeout=1.0, no_cache=True, force=False)
+    job = DatasetJob(Dataset(str(tmp_path / "points.csv")), SleepingTextGenerator(0), args)
+    monkeypatch.setattr(job.lida.vizgen, "generate", lambda **kwargs: ["chart = plot(data)"])
+    return job
+
+
+def _render_charts(job, monkeypatch, outcomes: list) -> None:
+    monkeypatch.setattr(batch, "render_pool", lambda workers: FakePool(outcomes))
+    job._step("charts goal-00", job.charts, SUMMARY, Goal(question="q", visualization="v", rationale="r"), 0)
+
+
+def test_a_goal_with_transient_render_errors_is_retried(job, monkeypatch):
+    marker = os.path.join(job.directory, "charts", "goal-00", "charts.json")
+    _render_charts(job, monkeypatch, [{"message": "Rendering did not finish within 1s", "traceback": "",
+                                       "transient": True}])
+    assert not os.path.exists(marker)
+    assert "retried on the next run" in job.errors["charts goal-00"]
+
+    job.errors = {}
+    _render_charts(job, monkeypatch, [None])
+    assert os.path.exists(marker) and not job.errors
+
+
+def test_a_goal_whose_snippet_raised_is_done(job, monkeypatch):
+    _render_charts(job, monkeypatch, [{"message": "KeyError: 'y'", "traceback": "..."}])
+    with open(os.path.join(job.directory, "charts", "goal-00", "charts.json")) as file:
+        assert json.load(file)["charts"][0]["error"] == "KeyError: 'y'"
+    # done: the next run does not render it again, the pool has nothing left to render
+    _render_charts(job, monkeypatch, [])
+    assert not job.errors
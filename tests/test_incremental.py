@@ -0,0 +1,93 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import dataset_store, incremental
+from utils.compaction import compact_frame
+from utils.dataset_store import Dataset, appended_base, columnar_path, read_source
+from utils.incremental import column_sketches, extends_sketches, incremental_profiles
+
+HEADER = "id,city,price,sold\n"
+
+
+def _rows(start: int, stop: int) -> str:
+    cities = ["Paris", "Lyon", "Nice"]
+    return "".join(f"{number},{cities[number % 3]},{number * 1.5},{number % 2 == 0}\n"
+                   for number in range(start, stop))
+
+
+@pytest.fixture
+def path(tmp_path, monkeypatch):
+    # the columnar copies, versions and sketches live under the working directory, and the
+    # in-memory caches are keyed by content, which is the same in every test
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dataset_store, "_frames", OrderedDict())
+    monkeypatch.setattr(incremental, "_states", {})
+    monkeypatch.setattr(incremental, "_extends", {})
+    path = tmp_path / "sales.csv"
+    path.write_text(HEADER + _rows(0, 300))
+    return str(path)
+
+
+def _append(path: str, text: str) -> None:
+    with open(path, "a") as file:
+        file.write(text)
+
+
+def _has_columnar(digest: str) -> bool:
+    return os.path.exists(columnar_path(digest))
+
+
+def test_appended_rows_extend_the_earlier_version(path, monkeypatch):
+    first = Dataset(path)
+    first_digest = first.digest
+    assert len(first.load()) == 300
+
+    _append(path, _rows(300, 420))
+    appended = Dataset(path)
+    base = appended_base(appended, usable=_has_columnar)
+    assert base is not None and (base["digest"], base["rows"]) == (first_digest, 300)
+
+    expected = compact_frame(read_source(path))
+
+    def no_full_parse(path):
+        raise AssertionError("the file was parsed again")
+
+    monkeypatch.setattr(dataset_store, "read_source", no_full_parse)
+    pd.testing.assert_frame_equal(appended.load(), expected)
+
+
+def test_rows_that_change_a_dtype_are_parsed_again(path):
+    Dataset(path).load()
+    _append(path, "300,Paris,unknown,True\n")
+    data = Dataset(path).load()
+    pd.testing.assert_frame_equal(data, compact_frame(read_source(path)))
+    assert not pd.api.types.is_numeric_dtype(data["price"])
+
+
+def test_a_rewritten_file_is_not_an_append(path):
+    Dataset(path).load()
+    with open(path, "w") as file:
+        file.write(HEADER + _rows(1, 400))
+    assert appended_base(Dataset(path), usable=_has_columnar) is None
+
+
+def test_profiles_come_from_sketches_only_for_appended_files(path):
+    dataset = Dataset(path)
+    assert not extends_sketches(dataset)
+    column_sketches(dataset)
+
+    _append(path, _rows(300, 420))
+    appended = Dataset(path)
+    assert extends_sketches(appended)
+    profiles = incremental_profiles(appended, ["id", "city", "price"])
+    full = read_source(path)
+    _, price = profiles["price"]
+    assert price["valid"] == 420 and price["min"] == 0 and price["max"] == full["price"].max()
+    assert price["mean"] == pytest.approx(full["price"].mean(), abs=0.01)
+    _, city = profiles["city"]
+    assert city["unique"] == 3 and city["valid"] == 420
+    assert np.isclose(profiles["id"][1]["unique"], 420, rtol=0.05)
@@ -0,0 +1,42 @@
+from utils.json_stream import JSONObjectStream, parse_objects
+
+
+def test_parses_a_complete_list():
+    text = '[{"index": 0, "question": "a"}, {"index": 1, "question": "b"}]'
+    assert parse_objects(text) == [{"index": 0, "question": "a"}, {"index": 1, "question": "b"}]
+
+
+def test_keeps_the_complete_objects_of_a_truncated_list():
+    text = '```json\n[{"index": 0, "fields": ["age"]}, {"index": 1, "fie'
+    assert parse_objects(text) == [{"index": 0, "fields": ["age"]}]
+
+
+def test_braces_and_quotes_inside_strings_are_not_counted():
+    text = '[{"code": "df.groupby({\\"a\\": 1})", "note": "}{"}]'
+    assert parse_objects(text) == [{"code": 'df.groupby({"a": 1})', "note": "}{"}]
+
+
+def test_nested_objects_are_part_of_their_parent():
+    assert parse_objects('[{"a": {"b": {"c": 1}}}]') == [{"a": {"b": {"c": 1}}}]
+
+
+def test_skips_an_invalid_object():
+    assert parse_objects('[{"a": 1,}, {"b": 2}]') == [{"b": 2}]
+
+
+def test_streamed_chunks_give_the_objects_as_they_complete():
+    text = 'Here: [{"index": 0, "text": "x{y"}, {"index": 1}]'
+    stream = JSONObjectStream()
+    completed = [stream.feed(char) for char in text]
+    objects = [obj for chunk in completed for obj in chunk]
+    assert objects == parse_objects(text)
+    # each object is returned by the chunk holding its closing brace
+    assert [position for position, chunk in enumerate(completed) if chunk] == [
+        text.index("}"), len(text) - 2]
+    assert stream.pending == ""
+
+
+def test_pending_holds_the_open_object():
+    stream = JSONObjectStream()
+    assert stream.feed('[{"index": 0}, {"ind') == [{"index": 0}]
+    assert stream.pending == '{"ind'
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import dataset_store, quality
+from utils.dataset_store import Dataset
+from utils.quality import check_quality, describe_issues, quality_issues, top_issues
+
+
+def _findings(issues: list) -> dict:
+    return {(issue["rule"], issue["column"]): issue for issue in issues}
+
+
+@pytest.fixture
+def data() -> pd.DataFrame:
+    rows = 200
+    numbers = np.arange(rows, dtype="float64") % 50
+    data = pd.DataFrame({
+        "price": numbers,
+        "age": np.where(np.arange(rows) == 7, "unknown", (numbers + 20).astype(int).astype(str)),
+        "joined": pd.date_range("2020-01-01", periods=rows, freq="D").strftime("%Y-%m-%d"),
+        "city": np.tile(["Paris", "Lyon", "Nice", "Lille"], rows // 4),
+        "tags": np.tile(["a;b", "c;d"], rows // 2),
+        "flag": np.tile([True, False], rows // 2),
+    })
+    data.loc[3, "price"] = -4.0
+    data.loc[5, "price"] = 10_000.0
+    data.loc[11, "joined"] = "someday"
+    data.loc[[20, 21], "city"] = ["paris", "PARIS "]
+    data.loc[[30, 31], "city"] = [None, "  "]
+    return data
+
+
+def test_every_rule_finds_its_issue(data):
+    findings = _findings(check_quality(data))
+    assert findings[("out_of_range", "price")]["count"] == 1
+    assert findings[("outliers", "price")]["examples"][0] == "10000"
+    assert findings[("mixed_types", "age")]["examples"] == ["unknown"]
+    assert findings[("unparseable_dates", "joined")]["examples"] == ["someday"]
+    # the 50 Paris rows, one of them now "paris", and a Lyon row now "PARIS "
+    assert findings[("inconsistent_categories", "city")]["count"] == 51
+    assert findings[("missing_values", "city")]["count"] == 2
+    assert ("wrong_delimiter", "tags") in findings
+    assert not [key for key in findings if key[1] == "flag"]
+
+
+def test_duplicate_rows_are_counted_once(data):
+    doubled = pd.concat([data, data.head(10)], ignore_index=True)
+    assert _findings(check_quality(doubled))[("duplicate_rows", None)]["count"] == 10
+
+
+def test_unhashable_cells_are_checked_as_text():
+    data = pd.DataFrame({"tags": [["a"], ["a"], ["b"]], "value": [1, 1, 2]})
+    assert _findings(check_quality(data))[("duplicate_rows", None)]["count"] == 1
+
+
+def test_findings_are_ranked_by_score(data):
+    issues = check_quality(data)
+    assert [issue["score"] for issue in issues] == sorted((issue["score"] for issue in issues), reverse=True)
+    assert issues[0]["rule"] == "wrong_delimiter"
+    assert all(issue["column"] in (None, "city") for issue in top_issues(issues, ["city"]))
+    assert describe_issues(issues[:1]).startswith("- wrong_delimiter in tags:")
+
+
+def test_compacted_columns_get_the_same_findings(data, tmp_path, monkeypatch):
+    # compacted text columns are categoricals, the rules run on the plain dtypes
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dataset_store, "_frames", OrderedDict())
+    monkeypatch.setattr(quality, "_findings", {})
+    path = tmp_path / "people.csv"
+    data.to_csv(path, index=False)
+    expected = check_quality(pd.read_csv(path))
+    assert quality_issues(Dataset(str(path))) == expected
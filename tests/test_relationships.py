@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.relationships import compute_relationships, contingency_tables, correlation_matrix, top_pairs
+
+
+@pytest.fixture
+def numeric() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    base = rng.normal(size=(500, 3))
+    data = pd.DataFrame({
+        "a": base[:, 0],
+        "b": base[:, 0] * 2 + rng.normal(scale=0.5, size=500),
+        "c": -base[:, 1],
+        "d": base[:, 1] + base[:, 2],
+        "e": rng.integers(0, 5, size=500).astype("float64"),
+    })
+    # missing values differ per column, each pair uses its own rows
+    for number, column in enumerate(data.columns):
+        data.loc[data.sample(frac=0.1 * number, random_state=number).index, column] = np.nan
+    return data
+
+
+@pytest.mark.parametrize("tile", [1, 2, 64])
+def test_correlation_matrix_matches_pandas(numeric, tile):
+    pd.testing.assert_frame_equal(correlation_matrix(numeric, tile=tile), numeric.corr(), atol=1e-9)
+
+
+def test_constant_and_sparse_pairs_are_missing():
+    data = pd.DataFrame({"x": [1.0, 2.0, 3.0, 4.0], "constant": [5.0] * 4, "sparse": [1.0, np.nan, np.nan, 2.0]})
+    matrix = correlation_matrix(data)
+    assert np.isnan(matrix.loc["x", "constant"])
+    assert np.isnan(matrix.loc["x", "sparse"])
+    assert matrix.loc["x", "x"] == pytest.approx(1.0)
+
+
+def _cramers_v(a: pd.Series, b: pd.Series) -> float:
+    observed = pd.crosstab(a, b).to_numpy(dtype="float64")
+    total = observed.sum()
+    expected = observed.sum(axis=1, keepdims=True) * observed.sum(axis=0, keepdims=True) / total
+    chi2 = ((observed - expected) ** 2 / expected).sum()
+    return np.sqrt(chi2 / (total * (min(observed.shape) - 1)))
+
+
+@pytest.fixture
+def categorical() -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    sex = rng.choice(["female", "male"], size=800)
+    data = pd.DataFrame({
+        "sex": sex,
+        "survived": np.where(sex == "female", rng.random(800) < 0.75, rng.random(800) < 0.2).astype(int),
+        "pclass": rng.integers(1, 4, size=800),
+        "port": rng.choice(["C", "Q", "S"], size=800, p=[0.2, 0.1, 0.7]),
+    })
+    data.loc[data.sample(80, random_state=2).index, "port"] = None
+    return data
+
+
+@pytest.mark.parametrize("tile, block_rows", [(1, 800), (3, 97), (8, 100_000)])
+def test_contingency_tables_match_pandas(categorical, tile, block_rows):
+    association, crosstabs = contingency_tables(categorical, tile=tile, block_rows=block_rows)
+    columns = categorical.columns.tolist()
+    # every pair once, its columns in the frame's order
+    assert sorted(crosstabs) == sorted((a, b) for i, a in enumerate(columns) for b in columns[i + 1:])
+    for (a, b), table in crosstabs.items():
+        expected = pd.crosstab(categorical[a], categorical[b])
+        np.testing.assert_array_equal(table.to_numpy(), expected.to_numpy())
+        assert table.index.tolist() == expected.index.tolist()
+        assert table.columns.tolist() == expected.columns.tolist()
+        assert association.loc[a, b] == pytest.approx(_cramers_v(categorical[a], categorical[b]))
+        assert association.loc[b, a] == association.loc[a, b]
+
+
+def test_top_pairs_lists_the_strongest_pair_first(numeric, categorical):
+    association, _ = contingency_tables(categorical)
+    pairs = top_pairs({"correlation": correlation_matrix(numeric), "association": association}, k=3)
+    assert pairs[0]["columns"] == ["a", "b"] and pairs[0]["measure"] == "correlation"
+    assert len(pairs) == 3
+    assert [abs(pair["value"]) for pair in pairs] == sorted((abs(pair["value"]) for pair in pairs), reverse=True)
+
+
+def test_unhashable_columns_are_compared_as_text():
+    data = pd.DataFrame({
+        "tags": [["a"], ["b"], ["a"], ["b"]] * 5,
+        "group": ["x", "y", "x", "y"] * 5,
+        "value": np.arange(20.0),
+    })
+    result = compute_relationships(data)
+    assert result["association"].loc["tags", "group"] == pytest.approx(1.0)
+    assert list(result["correlation"].columns) == ["value"]
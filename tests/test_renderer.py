@@ -0,0 +1,66 @@
+import os
+
+import pandas as pd
+import pytest
+
+from utils.dataset_store import Dataset
+from utils.renderer import RenderPool
+
+# fails unless the worker renders the frame of the version it was asked for
+ROWS_CODE = """
+import matplotlib.pyplot as plt
+def plot(data):
+    assert len(data) == {rows}, len(data)
+    plt.plot(data["x"], data["y"])
+    return plt
+chart = plot(data)
+"""
+
+SLOW_CODE = """
+import time
+import matplotlib.pyplot as plt
+def plot(data):
+    time.sleep(30)
+    return plt
+chart = plot(data)
+"""
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    # the dataset and raster caches live under the working directory
+    monkeypatch.chdir(tmp_path)
+    pool = RenderPool(1)
+    yield pool
+    pool.shutdown()
+
+
+def _write(path, rows: int) -> None:
+    pd.DataFrame({"x": range(rows), "y": range(rows)}).to_csv(path, index=False)
+    # a rewrite within the same clock tick still gets a new modification time
+    os.utime(path, ns=(rows * 10**9, rows * 10**9))
+
+
+def test_a_file_changed_in_place_is_rendered_again(pool, tmp_path):
+    path = str(tmp_path / "points.csv")
+    _write(path, 3)
+    dataset = Dataset(path)
+    pool.warm(dataset)
+    [chart] = pool.render([ROWS_CODE.format(rows=3)], dataset, "matplotlib", return_error=True)
+    assert chart.status, chart.error
+
+    _write(path, 5)
+    pool.warm(dataset)
+    [chart] = pool.render([ROWS_CODE.format(rows=5)], dataset, "matplotlib", return_error=True)
+    assert chart.status, chart.error
+
+
+def test_a_snippet_over_the_timeout_fails_alone(pool, tmp_path):
+    path = str(tmp_path / "points.csv")
+    _write(path, 3)
+    dataset = Dataset(path)
+    slow, fast = pool.render([SLOW_CODE, ROWS_CODE.format(rows=3)], dataset, "matplotlib", timeout=5,
+                             return_error=True)
+    assert not slow.status and "did not finish within 5s" in slow.error["message"]
+    # the worker was replaced, the next snippet still renders
+    assert fast.status, fast.error
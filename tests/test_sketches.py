@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.sketches import FrequentItems, HyperLogLog, KLLSketch, Moments
+from utils.streaming_profiler import ColumnSketch
+
+FRACTIONS = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+def _chunks(values: np.ndarray, size: int) -> list:
+    return [values[start:start + size] for start in range(0, len(values), size)]
+
+
+@pytest.fixture
+def values() -> np.ndarray:
+    return np.random.default_rng(0).lognormal(size=200_000)
+
+
+def _rank(values: np.ndarray, quantile: float) -> float:
+    return np.searchsorted(np.sort(values), quantile, side="left") / len(values)
+
+
+def test_moments_match_numpy_across_chunks(values):
+    moments = Moments()
+    for chunk in _chunks(values, 30_000):
+        moments.update(chunk)
+    assert moments.count == len(values)
+    assert moments.mean == pytest.approx(values.mean())
+    assert moments.std == pytest.approx(values.std(ddof=1))
+    assert (moments.min, moments.max) == (values.min(), values.max())
+
+
+def test_kll_quantiles_are_within_the_rank_error(values):
+    sketch = KLLSketch()
+    for chunk in _chunks(values, 10_000):
+        sketch.update(chunk)
+    assert sketch.count == len(values)
+    for fraction, quantile in zip(FRACTIONS, sketch.quantiles(FRACTIONS)):
+        assert abs(_rank(values, quantile) - fraction) <= sketch.rank_error
+
+
+def test_merged_kll_sketches_are_within_the_rank_error(values):
+    merged = KLLSketch()
+    for number, chunk in enumerate(_chunks(values, 50_000)):
+        sketch = KLLSketch(seed=number)
+        sketch.update(chunk)
+        merged.merge(sketch)
+    assert merged.count == len(values)
+    for fraction, quantile in zip(FRACTIONS, merged.quantiles(FRACTIONS)):
+        assert abs(_rank(values, quantile) - fraction) <= merged.rank_error
+    points = np.quantile(values, FRACTIONS)
+    exact = np.searchsorted(np.sort(values), points, side="left") / len(values)
+    assert np.abs(merged.cdf(points) - exact).max() <= merged.rank_error
+
+
+@pytest.mark.parametrize("distinct", [10, 1_000, 100_000])
+def test_hyperloglog_estimate_is_within_three_standard_errors(distinct):
+    values = np.random.default_rng(1).integers(0, distinct, size=300_000)
+    exact = len(np.unique(values))
+    hll = HyperLogLog()
+    for chunk in _chunks(values, 40_000):
+        hll.update(chunk)
+    assert abs(hll.estimate() - exact) <= 3 * hll.relative_error * exact
+
+
+def test_merged_hyperloglogs_count_the_union():
+    a, b = HyperLogLog(), HyperLogLog()
+    a.update(np.arange(0, 60_000))
+    b.update(np.arange(40_000, 100_000))
+    a.merge(b)
+    assert abs(a.estimate() - 100_000) <= 3 * a.relative_error * 100_000
+
+
+def test_frequent_items_underestimate_by_at_most_the_error():
+    rng = np.random.default_rng(2)
+    # a few heavy hitters in a long tail of rare values
+    values = pd.Series(np.concatenate([rng.zipf(1.5, size=100_000), np.full(20_000, -1)]))
+    values = values.sample(frac=1, random_state=0)
+    sketch = FrequentItems(k=64)
+    for chunk in _chunks(values, 7_000):
+        sketch.update(chunk)
+    exact = values.value_counts()
+    assert sketch.error <= len(values) / (sketch.k + 1)
+    for value, count in sketch.counters.items():
+        assert exact[value] - sketch.error <= count <= exact[value]
+    top, top_count = sketch.most_common()
+    assert top == [-1] or exact[top[0]] >= exact.iloc[0] - sketch.error
+    assert exact.iloc[0] - sketch.error <= top_count <= exact.iloc[0]
+
+
+def test_column_sketch_describe_is_within_its_error_entries(values):
+    series = pd.Series(np.round(values, 2))
+    series[::50] = np.nan
+    sketch = ColumnSketch("x")
+    for chunk in _chunks(series, 25_000):
+        sketch.update(chunk)
+    dtype, description = sketch.describe()
+    valid = series.dropna()
+    assert dtype == "numerical"
+    assert (description["valid"], description["missing"]) == (len(valid), series.isna().sum())
+    assert description["mean"] == pytest.approx(valid.mean(), abs=0.01)
+    assert abs(description["unique"] - valid.nunique()) <= 3 * description["error"]["unique"]
+    assert description["unique"] <= description["valid"]
+    exact, _ = np.histogram(valid, bins=len(description["chart_data"]), range=(valid.min(), valid.max()))
+    assert np.abs(np.asarray(description["chart_data"]) - exact).max() <= description["error"]["histogram_count"]
+
+
+def test_column_sketch_unique_never_exceeds_the_values():
+    sketch = ColumnSketch("id")
+    sketch.update(pd.Series([f"id-{number}" for number in range(50)]))
+    _, description = sketch.describe()
+    assert description["unique"] <= 50
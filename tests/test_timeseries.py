@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.timeseries import date_format, downsample_time_series, is_time_series, minmax_rows
+
+
+@pytest.fixture
+def series() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    days = pd.date_range("2020-01-01", periods=2_000, freq="D")
+    data = pd.DataFrame({
+        "date": np.repeat(days.strftime("%Y-%m-%d"), 10),
+        "cases": rng.poisson(100, size=20_000).astype("float64"),
+        "deaths": rng.poisson(5, size=20_000),
+        "country": rng.choice(["FR", "DE", "IT"], size=20_000),
+    })
+    # a few spikes a plain sample would most likely miss
+    data.loc[[1_234, 9_876, 15_000], "cases"] = [50_000.0, -3_000.0, 80_000.0]
+    data.loc[4_321, "deaths"] = 9_999
+    return data
+
+
+@pytest.mark.parametrize("max_rows", [500, 4_500])
+def test_downsampled_rows_are_bounded_and_keep_the_extremes(series, max_rows):
+    sample = downsample_time_series(series, "date", max_rows)
+    assert len(sample) <= max_rows
+    assert not sample.index.duplicated().any()
+    for column in ("cases", "deaths"):
+        assert sample[column].max() == series[column].max()
+        assert sample[column].min() == series[column].min()
+    assert sample["date"].iloc[0] == series["date"].min()
+    assert sample["date"].iloc[-1] == series["date"].max()
+    assert sample["date"].is_monotonic_increasing
+
+
+def test_downsampled_distributions_stay_close(series):
+    sample = downsample_time_series(series, "date", 4_500)
+    assert sample["deaths"].median() == series["deaths"].median()
+    assert sample["country"].value_counts(normalize=True).sub(
+        series["country"].value_counts(normalize=True)).abs().max() < 0.05
+
+
+def test_small_frames_are_returned_as_they_are(series):
+    small = series.head(100)
+    assert downsample_time_series(small, "date", 500) is small
+
+
+def test_few_distinct_times_get_a_random_sample(series):
+    data = series.assign(date=np.where(np.arange(len(series)) % 2, "2020-01-01", "2020-01-02"))
+    sample = downsample_time_series(data, "date", 500)
+    assert len(sample) == 500
+
+
+def test_minmax_rows_keeps_every_bucket_extreme():
+    times = pd.Series(pd.date_range("2021-01-01", periods=100, freq="h"))
+    values = pd.DataFrame({"v": np.arange(100.0)})
+    rows = minmax_rows(times, values, buckets=4)
+    # first and last of each bucket of 25 hours hold its min and max
+    assert set(rows) == {0, 24, 25, 49, 50, 74, 75, 99}
+
+
+@pytest.mark.parametrize("values, expected", [
+    (["2020-01-31", "2020-02-29"], "%Y-%m-%d"),
+    (["31/01/2020", "29/02/2020"], "%d/%m/%Y"),
+    (["Jan", "Feb"], None),
+    (["10:30", "11:45"], None),
+    (["2020/2021", "2021/2022"], None),
+    (["2020-01-31", "soon"], None),
+])
+def test_date_format_only_takes_full_dates(values, expected):
+    assert date_format(pd.Series(values)) == expected
+
+
+def test_years_are_not_time_series():
+    assert not is_time_series(pd.Series([2019, 2020, 2021]))
+    assert is_time_series(pd.Series(pd.date_range("2020-01-01", periods=3)))
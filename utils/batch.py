@@ -0,0 +1,361 @@
+"""Headless batch generation of summaries, goals, charts and prep guides.
+
+Runs what the Goals and Visualization and the Data Prep pages do, for every
+dataset of a directory or manifest, without Streamlit:
+
+    summary.json       the LIDA summary (the same cache as the app)
+    goals.json         the generated goals
+    charts/goal-NN/    code and PNG of the visualizations of each goal, and charts.json
+    guides.json        the data preprocessing guides
+    status.json        written last, with the errors of the steps that failed
+
+Artifacts go to `<output>/<dataset>-<content hash>-<config hash>/`, so a
+changed dataset or a different model, library or count gets its own
+directory. Every artifact is written atomically and skipped when it already
+exists, so an interrupted run picks up where it stopped; `--force`
+regenerates everything. A goal with charts that timed out or lost their
+render worker gets no charts.json, so the next run renders it again.
+
+Datasets are processed `--jobs` at a time and at most `--max-concurrency`
+LLM calls are in flight across all of them. Charts are rendered by the
+shared render pool.
+
+Run from the repository root:
+
+    python -m utils.batch datasets/ --output reports
+    python -m utils.batch --manifest datasets.txt --output reports --jobs 8 --max-concurrency 8
+
+A manifest has one dataset path per line, or JSON lines with "path" and an
+optional "label"; relative paths are relative to the manifest.
+"""
+import argparse
+import base64
+import dataclasses
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from lida import Manager, TextGenerationConfig
+from lida.datamodel import Goal
+
+from utils.dataset_store import Dataset, is_source_file, open_dataset
+from utils.instrumentation import export_run, span, start_run
+from utils.llm_pool import DEFAULT_MAX_CONCURRENCY, waiting
+from utils.llm_registry import get_text_generator
+from utils.memo import memo_key
+from utils.prep_guide import SHARD_TOKEN_BUDGET, GuideExplorer
+from utils.quality import quality_issues
+from utils.relationships import relationships, top_pairs, with_relationships
+from utils.renderer import RASTER_LIBRARIES, RENDER_TIMEOUT, default_render_workers, render_pool
+from utils.summary import summarize
+from utils.summary_codec import PROMPT_SUMMARY_TOKENS, encode_summary, fit_summary
+from utils.tokens import count_tokens
+
+logger = logging.getLogger("lida")
+
+DEFAULT_JOBS = 4
+STATUS_FILE = "status.json"
+
+
+class BoundedTextGenerator:
+    """ A text generator letting at most `semaphore` calls run at the same time
+
+    Every dataset of a batch gets one, all sharing the semaphore and the
+    underlying text generator. The wait for a slot does not count in the
+    timeout of a `run_concurrently` call, e.g. of a guide shard.
+    """
+
+    def __init__(self, text_gen, semaphore: threading.Semaphore) -> None:
+        self._text_gen = text_gen
+        self._semaphore = semaphore
+
+    def generate(self, *args, **kwargs):
+        with waiting():
+            self._semaphore.acquire()
+        try:
+            return self._text_gen.generate(*args, **kwargs)
+        finally:
+            self._semaphore.release()
+
+    def __getattr__(self, name):
+        return getattr(self._text_gen, name)
+
+
+def read_manifest(path: str) -> list:
+    """ The (path, label) of the datasets listed in a manifest, one path or JSON object per line """
+    base = os.path.dirname(os.path.abspath(path))
+    entries = []
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+                entries.append((os.path.join(base, entry["path"]), entry.get("label")))
+            else:
+                entries.append((os.path.join(base, line), None))
+    return entries
+
+
+def find_datasets(paths: list) -> list:
+    """ The (path, label) of the dataset files given directly or found in the given directories
+
+    Directories are searched for the formats `read_source` supports (CSV,
+    JSON, JSON Lines, Parquet, gzip or zstd compressed).
+    """
+    entries = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                entries += [(os.path.join(root, name), None) for name in sorted(files) if is_source_file(name)]
+        else:
+            entries.append((path, None))
+    return entries
+
+
+def config_key(args) -> str:
+    """ Hash of the options the artifacts depend on """
+    return memo_key(args.model, args.temperature, args.summary_method, args.summary_tokens, args.library,
+                    args.goals, args.visualizations, args.guides, args.relationships)
+
+
+def output_dir(dataset: Dataset, args) -> str:
+    return os.path.join(args.output, f"{dataset.label}-{dataset.digest[:12]}-{config_key(args)[:8]}")
+
+
+def _write(path: str, content) -> None:
+    """ Write bytes, a string or JSON atomically, so a killed run never leaves half an artifact """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if isinstance(content, bytes):
+        with open(tmp_path, "wb") as file:
+            file.write(content)
+    else:
+        with open(tmp_path, "w") as file:
+            if isinstance(content, str):
+                file.write(content)
+            else:
+                json.dump(content, file, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str):
+    with open(path) as file:
+        return json.load(file)
+
+
+class DatasetJob:
+    """ Generates the artifacts of one dataset, skipping those already in its output directory
+
+    Args:
+    ----
+        dataset: Dataset
+            The dataset handle
+        text_gen: BoundedTextGenerator
+            The text generator, shared by all the jobs
+        args: argparse.Namespace
+            The command line options
+    """
+
+    def __init__(self, dataset: Dataset, text_gen: BoundedTextGenerator, args) -> None:
+        self.dataset = dataset
+        self.text_gen = text_gen
+        self.args = args
+        self.directory = output_dir(dataset, args)
+        self.lida = Manager(text_gen=text_gen)
+        self.textgen_config = TextGenerationConfig(
+            n=1, temperature=args.temperature, model=args.model, use_cache=not args.no_cache)
+        self.errors = {}
+
+    def _path(self, *parts) -> str:
+        return os.path.join(self.directory, *parts)
+
+    def _done(self, *parts) -> bool:
+        return not self.args.force and os.path.exists(self._path(*parts))
+
+    def summary(self) -> dict:
+        if self._done("summary.json"):
+            return _read_json(self._path("summary.json"))
+        summary = summarize(self.lida, self.dataset, self.args.summary_method, self.textgen_config)
+        _write(self._path("summary.json"), summary)
+        return summary
+
+    def goals(self, summary: dict) -> list:
+        if self._done("goals.json"):
+            return [Goal(**goal) for goal in _read_json(self._path("goals.json"))]
+        if self.args.relationships:
+            summary = with_relationships(summary, top_pairs(relationships(self.dataset), self.args.relationships))
+        goals_summary = fit_summary(summary, self.args.summary_tokens, stage="goals", model=self.args.model)
+        with span("goals"):
+            goals = self.lida.goals(goals_summary, n=self.args.goals, textgen_config=self.textgen_config)
+        _write(self._path("goals.json"), [dataclasses.asdict(goal) for goal in goals])
+        return goals
+
+    def charts(self, summary: dict, goal: Goal, number: int) -> None:
+        directory = f"goal-{number:02d}"
+        if self._done("charts", directory, "charts.json"):
+            return
+        viz_summary = fit_summary(summary, self.args.summary_tokens, stage="visualize", model=self.args.model)
+        viz_config = TextGenerationConfig(
+            n=self.args.visualizations, temperature=self.args.temperature, model=self.args.model,
+            use_cache=not self.args.no_cache)
+        with span("visualize"):
+            code_specs = self.lida.vizgen.generate(
+                summary=viz_summary, goal=goal, textgen_config=viz_config, text_gen=self.text_gen,
+                library=self.args.library)
+            charts = render_pool(self.args.render_workers).render(
+                code_specs, self.dataset, library=self.args.library, timeout=self.args.render_timeout,
+                return_error=True)
+
+        index = []
+        transient = []
+        for chart_number, chart in enumerate(charts):
+            name = f"viz-{chart_number:02d}"
+            _write(self._path("charts", directory, f"{name}.py"), chart.code)
+            entry = {"code": f"{name}.py", "png": None, "error": None}
+            if chart.status:
+                _write(self._path("charts", directory, f"{name}.png"), base64.b64decode(chart.raster))
+                entry["png"] = f"{name}.png"
+            else:
+                entry["error"] = chart.error["message"]
+                if chart.error.get("transient"):
+                    transient.append(chart.error["message"])
+            index.append(entry)
+        if transient:
+            # no marker: the next run renders the goal again, e.g. after a timeout
+            raise RuntimeError(f"{len(transient)} chart(s) could not be rendered, retried on the next run: "
+                               f"{transient[0]}")
+        # written last: its presence marks the goal as done
+        _write(self._path("charts", directory, "charts.json"), {"goal": dataclasses.asdict(goal), "charts": index})
+
+    def guides(self, summary: dict) -> None:
+        if self._done("guides.json"):
+            return
+        explorer = GuideExplorer(summary_tokens=self.args.summary_tokens, issues=quality_issues(self.dataset))
+        if count_tokens(encode_summary(summary, "full", stage="prep"), self.args.model) > SHARD_TOKEN_BUDGET:
+            guides = list(explorer.generate_sharded(summary, self.textgen_config, self.text_gen, n=self.args.guides))
+        else:
+            guides = explorer.generate(summary, self.textgen_config, self.text_gen, n=self.args.guides)
+        _write(self._path("guides.json"), guides)
+
+    def _step(self, name: str, func, *args):
+        try:
+            return func(*args)
+        except Exception as error:
+            logger.warning(f"{self.dataset.path}: {name} failed: {error}")
+            self.errors[name] = f"{type(error).__name__}: {error}"
+            return None
+
+    def run(self) -> dict:
+        """ Generate the missing artifacts
+
+        Returns:
+        -------
+            dict: The status of the dataset, also written to `status.json`
+        """
+        run = start_run(f"batch {self.dataset.label}")
+        summary = self._step("summary", self.summary)
+        if summary is not None:
+            goals = self._step("goals", self.goals, summary) or []
+            for number, goal in enumerate(goals):
+                self._step(f"charts goal-{number:02d}", self.charts, summary, goal, number)
+            self._step("guides", self.guides, summary)
+
+        status = {"dataset": self.dataset.path, "digest": self.dataset.digest, "output": self.directory,
+                  "errors": self.errors}
+        _write(self._path(STATUS_FILE), status)
+        export_run(run)
+        return status
+
+
+def _run_entry(path: str, label: str, text_gen: BoundedTextGenerator, args) -> dict:
+    # opened in the worker, so a missing or unreadable file fails its own entry rather than the batch
+    return DatasetJob(open_dataset(path, label=label), text_gen, args).run()
+
+
+def run_batch(entries: list, args) -> list:
+    """ Process the datasets `args.jobs` at a time
+
+    Args:
+    ----
+        entries: list
+            (path, label) of the datasets
+        args: argparse.Namespace
+            The command line options
+
+    Returns:
+    -------
+        list: The status of every dataset, in completion order
+    """
+    text_gen = get_text_generator(args.provider, args.api_key, args.model)
+    bounded = BoundedTextGenerator(text_gen, threading.Semaphore(max(args.max_concurrency, 1)))
+
+    statuses = []
+    with ThreadPoolExecutor(max_workers=max(args.jobs, 1), thread_name_prefix="batch") as executor:
+        futures = {}
+        for path, label in entries:
+            futures[executor.submit(_run_entry, path, label, bounded, args)] = path
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                status = future.result()
+            except Exception as error:
+                # e.g. a missing or unreadable file, the other datasets go on
+                status = {"dataset": futures[future], "errors": {"dataset": f"{type(error).__name__}: {error}"}}
+            statuses.append(status)
+            outcome = "ok" if not status["errors"] else f"{len(status['errors'])} failed step(s)"
+            print(f"[{done}/{len(futures)}] {status['dataset']}: {outcome}", flush=True)
+    return statuses
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="dataset files or directories searched for them")
+    parser.add_argument("--manifest", help="file listing the datasets, one per line")
+    parser.add_argument("--output", default="reports", help="directory of the generated artifacts")
+    parser.add_argument("--provider", default="openai", help="llmx provider")
+    parser.add_argument("--api-key", default=os.getenv("OPENAI_API_KEY"), help="defaults to $OPENAI_API_KEY")
+    parser.add_argument("--model", default="gpt-3.5-turbo-0125")
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--no-cache", action="store_true", help="don't use the LLM and summary caches")
+    parser.add_argument("--summary-method", default="default", choices=["default", "llm", "columns"])
+    parser.add_argument("--summary-tokens", type=int, default=PROMPT_SUMMARY_TOKENS)
+    parser.add_argument("--library", default="seaborn", choices=RASTER_LIBRARIES)
+    parser.add_argument("--goals", type=int, default=5)
+    parser.add_argument("--relationships", type=int, default=0,
+                        help="strongest column pairs added to the summary the goals are generated from")
+    parser.add_argument("--visualizations", type=int, default=1, help="visualizations per goal")
+    parser.add_argument("--guides", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="datasets processed at the same time")
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help="LLM calls in flight across all datasets")
+    parser.add_argument("--render-workers", type=int, default=default_render_workers())
+    parser.add_argument("--render-timeout", type=float, default=RENDER_TIMEOUT)
+    parser.add_argument("--force", action="store_true", help="regenerate the artifacts that already exist")
+    args = parser.parse_args(argv)
+
+    entries = find_datasets(args.paths)
+    if args.manifest:
+        entries += read_manifest(args.manifest)
+    if not entries:
+        parser.error("no dataset given, pass files, directories or --manifest")
+    if args.provider == "openai" and not args.api_key:
+        parser.error("set OPENAI_API_KEY or pass --api-key")
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    try:
+        statuses = run_batch(entries, args)
+    finally:
+        render_pool(args.render_workers).shutdown()
+
+    _write(os.path.join(args.output, "index.json"), statuses)
+    failed = sum(1 for status in statuses if status["errors"])
+    print(f"{len(statuses) - failed} datasets done, {failed} with errors, see {args.output}/index.json")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
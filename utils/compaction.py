@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+
+# a string column becomes categorical when it has at most this share of distinct values...
+CATEGORY_MAX_SHARE = 0.5
+# ... and at most this many of them
+CATEGORY_MAX_UNIQUE = 10_000
+# string values read as booleans, case-insensitively
+BOOLEAN_STRINGS = {"true": True, "false": False}
+
+try:
+    # the default string dtype of pandas 3, missing values stay NaN
+    ARROW_STRING = pd.StringDtype("pyarrow", na_value=np.nan)
+except TypeError:
+    ARROW_STRING = pd.StringDtype("pyarrow")
+
+
+def _is_text(series: pd.Series) -> bool:
+    return pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype)
+
+
+def _compact_integers(series: pd.Series) -> pd.Series:
+    nullable = isinstance(series.dtype, pd.api.extensions.ExtensionDtype) or series.isna().any()
+    valid = series.dropna()
+    if valid.empty:
+        return series
+    low, high = int(valid.min()), int(valid.max())
+    candidates = ("uint8", "uint16", "uint32", "uint64") if low >= 0 else ("int8", "int16", "int32", "int64")
+    for dtype in candidates:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            if nullable:
+                # pandas' nullable integers: "UInt8", "Int16", ...
+                dtype = dtype[0].upper() + dtype[1:] if dtype[0] == "i" else "U" + dtype[1:].capitalize()
+            return series.astype(dtype)
+    return series
+
+
+def _compact_floats(series: pd.Series) -> pd.Series:
+    valid = series.dropna()
+    if valid.empty:
+        return series
+    array = valid.to_numpy(dtype="float64")
+    if np.isfinite(array).all() and (array == np.round(array)).all() and np.abs(array).max() < 2 ** 53:
+        # whole numbers, floats e.g. because of missing values in a column of counts
+        return _compact_integers(series.astype("Int64" if series.hasnans else "int64"))
+    # float32 only when every value survives the round trip
+    if np.array_equal(array.astype("float32").astype("float64"), array, equal_nan=True):
+        return series.astype("float32")
+    return series
+
+
+def _compact_text(series: pd.Series) -> pd.Series:
+    valid = series.dropna()
+    if valid.empty:
+        return series
+    if pd.api.types.is_object_dtype(series.dtype):
+        inferred = pd.api.types.infer_dtype(valid, skipna=True)
+        if inferred == "boolean":
+            return series.astype("boolean")
+        if inferred not in ("string", "empty"):
+            # mixed types stay as they are, the data quality checks report them
+            return series
+    lowered = valid.str.lower()
+    if lowered.isin(BOOLEAN_STRINGS.keys()).all():
+        return series.str.lower().map(BOOLEAN_STRINGS).astype("boolean")
+    unique = valid.nunique()
+    if unique <= CATEGORY_MAX_UNIQUE and unique <= CATEGORY_MAX_SHARE * len(series):
+        return series.astype("category")
+    if isinstance(series.dtype, pd.StringDtype) and series.dtype.storage == "pyarrow":
+        return series
+    # Arrow-backed strings: one buffer instead of a Python object per value
+    return series.astype(ARROW_STRING)
+
+
+def compact_series(series: pd.Series) -> pd.Series:
+    """ The column with the smallest dtype holding its values exactly
+
+    Integers are downcast to the smallest (nullable if needed) integer type,
+    floats to integers when they are whole numbers or to float32 when that is
+    lossless, true/false columns become nullable booleans, low-cardinality
+    strings categoricals and the other strings Arrow-backed strings. Dates and
+    mixed-type columns are kept.
+
+    Args:
+    ----
+        series: pd.Series
+            The column
+
+    Returns:
+    -------
+        pd.Series: The compacted column, the same values
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(dtype):
+        return series
+    if pd.api.types.is_integer_dtype(dtype):
+        return _compact_integers(series)
+    if pd.api.types.is_float_dtype(dtype):
+        return _compact_floats(series)
+    if _is_text(series):
+        return _compact_text(series)
+    return series
+
+
+def _compact_or_keep(series: pd.Series) -> pd.Series:
+    compacted = compact_series(series)
+    if compacted is not series and compacted.memory_usage(index=False, deep=True) >= series.memory_usage(
+            index=False, deep=True):
+        # e.g. nullable integers, whose mask outweighs the narrower values
+        return series
+    return compacted
+
+
+def compact_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """ The frame with every column compacted by `compact_series` """
+    return pd.DataFrame({column: _compact_or_keep(data[column]) for column in data.columns}, index=data.index)
+
+
+def plain_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """ The frame with the dtypes `pd.read_csv` would have given, for code written against those
+
+    Generated visualization code may e.g. fill missing values of a
+    categorical with a new category, pass nullable integers to numpy or
+    subtract from unsigned integers, which fail or wrap around on compacted
+    columns. Arrow strings are kept.
+    """
+    columns = {}
+    for column in data.columns:
+        series = data[column]
+        dtype = series.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            series = series.astype(dtype.categories.dtype)
+        elif isinstance(dtype, pd.BooleanDtype):
+            series = series.astype(object if series.hasnans else bool)
+        elif pd.api.types.is_integer_dtype(dtype):
+            series = series.astype("float64" if series.hasnans else "int64")
+        elif pd.api.types.is_float_dtype(dtype):
+            series = series.astype("float64")
+        columns[column] = series
+    return pd.DataFrame(columns, index=data.index)
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> list:
+    """ The memory of every column before and after compaction
+
+    Returns:
+    -------
+        list: Dicts with column, dtypes and bytes before and after, the whole frame first
+    """
+    bytes_before = before.memory_usage(index=False, deep=True)
+    bytes_after = after.memory_usage(index=False, deep=True)
+    rows = [{
+        "column": "(all columns)",
+        "dtype_before": "",
+        "dtype_after": "",
+        "bytes_before": int(bytes_before.sum()),
+        "bytes_after": int(bytes_after.sum()),
+    }]
+    for column in before.columns:
+        rows.append({
+            "column": str(column),
+            "dtype_before": str(before[column].dtype),
+            "dtype_after": str(after[column].dtype),
+            "bytes_before": int(bytes_before[column]),
+            "bytes_after": int(bytes_after[column]),
+        })
+    for row in rows:
+        row["saved"] = round(1 - row["bytes_after"] / row["bytes_before"], 3) if row["bytes_before"] else 0.0
+    return rows
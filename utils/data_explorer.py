@@ -1,20 +1,39 @@
 import streamlit as st
+import altair as alt
+import math
+import os
+import threading
+import numpy as np
 import pandas as pd
+from typing import Iterator
 
-# data = pd.read_csv("datasets/titanic.csv")
+from lida.utils import clean_column_name
 
-def is_numerical(obj) -> bool:
-    """ Check if the object is numerical
+from utils.dataset_store import Dataset, lida_frame
+from utils.incremental import extends_sketches, incremental_profiles, use_incremental
+from utils.instrumentation import instrumented, note, note_cache
+from utils.profile_store import profile_store
+from utils.relationships import SAMPLE_ROWS, relationships, top_pairs
+from utils.parallel_profiler import default_workers, profile_columns_parallel
+from utils.profiler import PROFILER_VERSION, is_numerical_series, profile_column
+from utils.timeseries import is_time_series
+from utils.streaming_profiler import STREAMING_MIN_BYTES, source_columns, stream_profiles
 
-    Args:
-    ----
-        obj: Any object
+# columns listed per page of the column picker
+PICKER_PAGE_SIZE = 50
+# profiled and displayed columns per page of the results
+RESULTS_PAGE_SIZE = 10
 
-    Returns:
-    -------
-        bool: True if the object is numerical, False otherwise
-    """
-    return isinstance(obj, float) or isinstance(obj, int) or pd.isna(obj)
+# columns of a relationship heatmap, the most related ones, so the chart stays readable and small
+HEATMAP_COLUMNS = 40
+# pairs listed under the heatmaps
+TOP_PAIRS = 10
+
+# (dataset hash, columns) -> thread profiling them ahead of time
+_prefetches = {}
+_prefetches_lock = threading.Lock()
+
+# data = pd.read_csv("datasets/titanic.csv")
 
 def display(description: dict, type: str, layout: list):
     """ Display the description of the column
@@ -123,6 +142,7 @@ def display(description: dict, type: str, layout: list):
                         """
                 )
 
+@instrumented("explore_column")
 def explore_column(data: pd.DataFrame, col: str):
     """ Explore the column
 
@@ -139,66 +159,429 @@ def explore_column(data: pd.DataFrame, col: str):
     """
     layout = [8, 4, 2, 2]
 
-    is_numerical_field = all(data[col].apply(is_numerical))
-    if is_numerical_field:
-        type = "numerical"
-        quantiles = data[col].quantile([0, 0.25, 0.5, 0.75, 1.0]).tolist()
-        quantiles = [round(q, 0) for q in quantiles]
-        missing_count = data[col].isna().sum()
-        unique_count = data[col].nunique()
-        mean = round(data[col].mean(), 2)
-        std_dev = round(data[col].std(), 2)
-        bins_count = unique_count if unique_count <= 5 else 10
-        labels = pd.cut(data[col], bins=bins_count)
-        bin_dict = dict()
-        for label in labels.unique():
-            bin_dict[str(label)] = len(data.loc[labels == label, col].tolist())
-        description = {
-            "id": col,
-            "quantiles": quantiles,
-            "chart_columns": list(bin_dict.keys()),
-            "chart_data": list(bin_dict.values()),
-            "valid": data.shape[0] - missing_count,
-            "missing": missing_count,
-            "mean": mean,
-            "std_dev": std_dev,
-        }
-        display(description, type, layout)
-    else:
-        type = "nominal"
-        missing_count = data[col].isna().sum()
-        unique_count = data[col].nunique()
-        occurence = data[col].value_counts()
-        most_com_count = occurence.max()
-        most_com = str(occurence[occurence == most_com_count].index.tolist())[1:-1]
-        description = {
-            "id": col,
-            "valid": data.shape[0] - missing_count,
-            "missing": missing_count,
-            "unique": unique_count,
-            "most_com": most_com,
-            "most_com_count": most_com_count,
-        }
+    note(bytes=int(data[col].memory_usage(index=False, deep=True)))
+    type, description = profile_column(data, col)
+    display(description, type, layout)
+
+
+def dataset_columns(dataset: Dataset) -> list:
+    """ The columns of the dataset, read from the profile store when the dataset was seen before """
+    store = profile_store(dataset.digest, PROFILER_VERSION)
+    if store.columns is None:
+        store.columns = dataset.load().columns.tolist()
+        store.save()
+    return store.columns
+
+
+@instrumented("profiles")
+def iter_profiles(dataset: Dataset, columns: list, workers: int = 1) -> Iterator[tuple]:
+    """ Get the profiles of the columns, computing only the missing or stale ones
+
+    Args:
+    ----
+        dataset: Dataset
+            The dataset handle
+        columns: list
+            The columns to profile
+        workers: int
+            The number of processes computing the missing profiles
+
+    Returns:
+    -------
+        Iterator[tuple]: (column, (type, description)) in the order of `columns`
+    """
+    store = profile_store(dataset.digest, PROFILER_VERSION)
+    missing = store.missing(columns)
+    note_cache(hit=True, count=len(columns) - len(missing))
+    note_cache(hit=False, count=len(missing))
+    if not missing:
+        for column in columns:
+            yield column, store.get(column)
+        return
+
+    note(bytes=os.path.getsize(dataset.path))
+    computed = profile_columns_parallel(dataset, missing, workers)
+    try:
+        for column in columns:
+            if column in missing:
+                _, profile = next(computed)
+                store.put(column, *profile)
+            yield column, store.get(column)
+    finally:
+        computed.close()
+        store.save()
+
+
+def load_profiles(dataset: Dataset, columns: list, workers: int = 1) -> dict:
+    """ Get the profiles of the columns as a dict column -> (type, description) """
+    return dict(iter_profiles(dataset, columns, workers))
+
+
+def prefetch_profiles(dataset: Dataset, columns: list, workers: int = 1) -> None:
+    """ Compute the missing profiles of the columns in a background thread, e.g. those of the next page """
+    key = (dataset.digest, tuple(columns))
+    if not profile_store(dataset.digest, PROFILER_VERSION).missing(columns):
+        return
+    with _prefetches_lock:
+        if key in _prefetches:
+            return
+        thread = threading.Thread(target=_prefetch, args=(dataset, columns, workers, key), daemon=True,
+                                  name="profile-prefetch")
+        _prefetches[key] = thread
+    thread.start()
+
+
+def _prefetch(dataset: Dataset, columns: list, workers: int, key: tuple) -> None:
+    try:
+        load_profiles(dataset, columns, workers)
+    except Exception:
+        # the page profiles them again and shows the error
+        pass
+    finally:
+        with _prefetches_lock:
+            _prefetches.pop(key, None)
+
+
+def wait_for_prefetch(dataset: Dataset, columns: list) -> None:
+    """ Wait for the background profiling of these columns, if any, instead of profiling them twice """
+    with _prefetches_lock:
+        thread = _prefetches.get((dataset.digest, tuple(columns)))
+    if thread is not None:
+        thread.join()
+
+
+def display_time_series(dataset: Dataset, column: str):
+    """ Plot a numeric column over a date column, from the (time-downsampled) frame chart code gets
+
+    Args:
+    ----
+        dataset: Dataset
+            The dataset handle
+        column: str
+            The date column
+
+    Returns:
+    -------
+        None
+    """
+    data = lida_frame(dataset)
+    time = clean_column_name(column)
+    if time not in data.columns or not is_time_series(data[time]):
+        return
+    numeric = [name for name in data.columns if name != time and is_numerical_series(data[name])]
+    if not numeric:
+        return
+    value = st.selectbox("Plot over time", options=numeric, key=f"time_series_{dataset.digest}_{column}")
+    points = pd.DataFrame({time: pd.to_datetime(data[time], errors="coerce"), value: data[value]}).dropna()
+    st.line_chart(points.sort_values(time, kind="stable"), x=time, y=value)
+    st.caption(f"{len(points):,} points: a random sample plus the extremes of each time bucket"
+               if len(data) < len(dataset.load()) else f"{len(points):,} points")
+
+
+def display_error_bounds(description: dict):
+    """ Caption the error bounds of an approximate (streamed) description """
+    error = description.get("error")
+    if not error:
+        return
+    bounds = [f"unique ±{error['unique']}"]
+    if "quantile_rank" in error:
+        bounds.append(f"quantiles ±{round(error['quantile_rank'] * 100, 2)}% rank")
+        bounds.append(f"bins ±{error['histogram_count']}")
+    if "most_com_count" in error:
+        bounds.append(f"most common count -0/+{error['most_com_count']}")
+    st.caption("Approximate: " + ", ".join(bounds))
+
+
+def stream_explore(dataset: Dataset, columns: list, layout: list):
+    """ Profile the columns chunk by chunk, updating the display after every chunk
+
+    Args:
+    ----
+        dataset: Dataset
+            The dataset handle
+        columns: list
+            The columns to profile
+        layout: list
+            The layout of the display
+
+    Returns:
+    -------
+        None
+    """
+    # approximate profiles are kept apart from the exact ones
+    store = profile_store(f"{dataset.digest}-streaming", PROFILER_VERSION)
+    missing = store.missing(columns)
+
+    placeholders = {}
+    for column in columns:
+        st.write(column)
+        placeholders[column] = st.empty()
+        if column not in missing:
+            with placeholders[column].container():
+                type, description = store.get(column)
+                display(description, type, layout)
+                display_error_bounds(description)
+    if not missing:
+        return
+
+    progress = st.empty()
+    profiles = {}
+    for rows, profiles in stream_profiles(dataset.path, missing):
+        progress.caption(f"Profiled {rows:,} rows...")
+        for column, (type, description) in profiles.items():
+            with placeholders[column].container():
+                display(description, type, layout)
+                display_error_bounds(description)
+    progress.empty()
+
+    for column, (type, description) in profiles.items():
+        store.put(column, type, description)
+    store.save()
+
+
+def incremental_explore(dataset: Dataset, columns: list, layout: list):
+    """ Display the profiles of the columns from the column sketches, extended with the appended rows
+
+    Args:
+    ----
+        dataset: Dataset
+            The dataset handle
+        columns: list
+            The columns to display
+        layout: list
+            The layout of the display
+
+    Returns:
+    -------
+        None
+    """
+    with st.spinner("Profiling the new rows..."):
+        profiles = incremental_profiles(dataset, columns)
+    for column in columns:
+        st.write(column)
+        type, description = profiles[column]
         display(description, type, layout)
+        display_error_bounds(description)
 
 
-def explore(data):
-    columns = data.columns.tolist()
-    options = []
-    with st.popover("Select columns to explore"):
-        st.write("Select columns to explore")
-        check_all = st.checkbox("Select all", key="Select all")
-        for column  in columns:
-            option1 = st.checkbox(column, key=column)
-            if option1:
-                options.append(column)
-        if check_all:
-            options = columns
+def display_memory_report(dataset: Dataset):
+    """ Show the memory of the columns with pandas' default dtypes and with the compact ones
 
-    # st.write("Selected:", options)
-    for column in options:
+    Args:
+    ----
+        dataset: Dataset
+            The dataset handle
+
+    Returns:
+    -------
+        None
+    """
+    report = dataset.memory_report()
+    if report is None:
+        # made when the source is parsed
+        dataset.load()
+        report = dataset.memory_report()
+    with st.expander("Memory usage"):
+        if report is None:
+            st.write("The dataset is loaded with pandas' default dtypes (`LIDA_COMPACT_DTYPES=0`).")
+            return
+        total = report[0]
+        st.write(f"**{total['bytes_before'] / 2**20:.2f} MB** with the default dtypes, "
+                 f"**{total['bytes_after'] / 2**20:.2f} MB** with compact dtypes "
+                 f"({total['saved']:.0%} saved)")
+        st.dataframe(pd.DataFrame(report[1:]), hide_index=True)
+
+
+def heatmap(matrix: pd.DataFrame, title: str, domain: list):
+    """ Show a square matrix of column pairs as a heatmap, limited to its `HEATMAP_COLUMNS` most related columns """
+    if matrix.empty:
+        st.write(f"No {title.lower()} to show: too few suitable columns.")
+        return
+    strength = matrix.abs().where(~np.eye(len(matrix), dtype=bool)).max().fillna(0)
+    columns = strength.sort_values(ascending=False, kind="stable").index[:HEATMAP_COLUMNS]
+    matrix = matrix.loc[columns, columns]
+    cells = matrix.rename_axis(index="row", columns="column").stack().rename("value").reset_index()
+    cells[["row", "column"]] = cells[["row", "column"]].astype(str)
+    order = [str(column) for column in columns]
+    chart = alt.Chart(cells).mark_rect().encode(
+        x=alt.X("column:N", sort=order, title=None),
+        y=alt.Y("row:N", sort=order, title=None),
+        color=alt.Color("value:Q", scale=alt.Scale(scheme="redblue", domain=domain, reverse=True), title=title),
+        tooltip=["row", "column", alt.Tooltip("value:Q", format=".3f")],
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+
+def relationship_view(dataset: Dataset):
+    """ Show the correlations and cross-tab associations between the columns, and the strongest pairs
+
+    Args:
+    ----
+        dataset: Dataset
+            The dataset handle
+
+    Returns:
+    -------
+        None
+    """
+    st.write("## Relationships")
+    if not st.toggle("Show relationships between columns", key=f"relationships_{dataset.digest}"):
+        return
+    sample = st.checkbox(f"Use a sample of {SAMPLE_ROWS:,} rows", value=True,
+                         help="Larger datasets are sampled, the result is cached per dataset and sample")
+    with st.spinner("Computing relationships..."):
+        result = relationships(dataset, SAMPLE_ROWS if sample else None)
+    if result["rows"] < result["total_rows"]:
+        st.caption(f"Computed on {result['rows']:,} of {result['total_rows']:,} rows")
+
+    correlation, association = st.tabs(["Correlation", "Association (Cramér's V)"])
+    with correlation:
+        heatmap(result["correlation"], "Pearson r", [-1, 1])
+    with association:
+        heatmap(result["association"], "Cramér's V", [0, 1])
+
+    pairs = top_pairs(result, TOP_PAIRS)
+    if pairs:
+        st.write("### Strongest pairs")
+        st.dataframe(pd.DataFrame([{"column A": pair["columns"][0], "column B": pair["columns"][1],
+                                    "measure": pair["measure"], "value": pair["value"]} for pair in pairs]),
+                     hide_index=True)
+
+    if result["crosstabs"]:
+        st.write("### Cross-tab")
+        # the strongest associated pairs first
+        order = result["association"]
+        pairs = sorted(result["crosstabs"], key=lambda pair: -np.nan_to_num(order.loc[pair[0], pair[1]]))
+        pair = st.selectbox("Columns", options=pairs, format_func=lambda pair: f"{pair[0]} × {pair[1]}")
+        st.dataframe(result["crosstabs"][pair])
+
+
+def page_of(items: list, page_size: int, key: str, label: str) -> list:
+    """ Let the user pick a page of `items` and return it
+
+    Args:
+    ----
+        items: list
+            The items to paginate
+        page_size: int
+            The number of items per page
+        key: str
+            The widget key of the page number
+        label: str
+            What the items are, e.g. "columns"
+
+    Returns:
+    -------
+        list: The items of the selected page
+    """
+    pages = max(math.ceil(len(items) / page_size), 1)
+    if st.session_state.get(key, 1) > pages:
+        # e.g. a narrower search, back to the last page there is
+        st.session_state[key] = pages
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages}, {len(items)} {label})", min_value=1, max_value=pages, key=key)
+    return items[(page - 1) * page_size:page * page_size]
+
+
+def pick_columns(dataset: Dataset, columns: list) -> list:
+    """ Searchable, paginated column picker; the selection outlives pages and searches
+
+    Returns:
+    -------
+        list: The selected columns, in the order of `columns`
+    """
+    selected = st.session_state.setdefault(f"explore_selected_{dataset.digest}", set())
+
+    def toggle(column):
+        selected.symmetric_difference_update({column})
+
+    with st.popover(f"Select columns to explore ({len(selected)} selected)"):
+        search = st.text_input("Search columns", key=f"explore_search_{dataset.digest}")
+        matching = [column for column in columns if search.lower() in str(column).lower()]
+        select_all, clear = st.columns(2)
+        select_all.button(f"Select all {len(matching)} matching", on_click=selected.update, args=(matching,))
+        clear.button("Clear selection", on_click=selected.clear)
+        # only the checkboxes of one page exist at a time
+        for column in page_of(matching, PICKER_PAGE_SIZE, f"explore_picker_page_{dataset.digest}", "columns"):
+            key = f"explore_pick_{dataset.digest}_{column}"
+            # the checkbox shows the selection, also after "Select all" or a page change
+            st.session_state[key] = column in selected
+            st.checkbox(str(column), key=key, on_change=toggle, args=(column,))
+    return [column for column in columns if column in selected]
+
+
+def explore_page(dataset: Dataset, columns: list, next_columns: list, workers: int, layout: list):
+    """ Display the profiles of one page of columns, each as soon as it is ready
+
+    Every column gets a placeholder first; cached profiles are shown at
+    once, the others as they are computed. The profiles of the next page
+    are then computed in the background.
+    """
+    wait_for_prefetch(dataset, columns)
+    store = profile_store(dataset.digest, PROFILER_VERSION)
+    missing = set(store.missing(columns))
+    placeholders = {}
+    for column in columns:
         st.write(column)
-        explore_column(data, column)
+        placeholders[column] = st.empty()
+        if column in missing:
+            placeholders[column].caption("Profiling...")
+
+    for column, (type, description) in iter_profiles(dataset, columns, workers):
+        with placeholders[column].container():
+            display(description, type, layout)
+            if description.get("dtype") == "date":
+                display_time_series(dataset, column)
+
+    if next_columns:
+        prefetch_profiles(dataset, next_columns, workers)
+
+
+def explore(dataset: Dataset):
+    """ Let the user pick columns of the dataset and display their profiles, a page at a time
+
+    Args:
+    ----
+        dataset: Dataset
+            The dataset handle
+
+    Returns:
+    -------
+        None
+    """
+    layout = [8, 4, 2, 2]
+    streaming = st.sidebar.toggle(
+        "Streaming profiling",
+        value=os.path.getsize(dataset.path) > STREAMING_MIN_BYTES,
+        help="Profile the file in chunks with bounded memory. Statistics are approximate.")
+    workers = st.sidebar.number_input(
+        "Profiling workers",
+        min_value=1,
+        max_value=default_workers(),
+        value=default_workers(),
+        help="Number of processes profiling the selected columns in parallel")
+    incremental = st.sidebar.toggle(
+        "Incremental profiling",
+        value=extends_sketches(dataset),
+        disabled=not use_incremental(dataset),
+        help="Profile only the rows appended since the file was last profiled and merge them into its column "
+             "sketches. Statistics are approximate. Uncompressed CSV and JSON Lines files only.")
+    columns = source_columns(dataset.path) if streaming or incremental else dataset_columns(dataset)
+    options = pick_columns(dataset, columns)
+
+    # st.write("Selected:", options)
+    page = page_of(options, RESULTS_PAGE_SIZE, f"explore_results_page_{dataset.digest}", "selected columns")
+    if incremental:
+        incremental_explore(dataset, page, layout)
+        return
+    if streaming:
+        stream_explore(dataset, page, layout)
+        return
+
+    display_memory_report(dataset)
+    position = options.index(page[0]) + len(page) if page else 0
+    explore_page(dataset, page, options[position:position + RESULTS_PAGE_SIZE], workers, layout)
 
 
 # explore(data)
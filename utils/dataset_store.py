@@ -0,0 +1,462 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterator
+
+import pandas as pd
+import pyarrow.feather as feather
+from lida.utils import clean_column_names
+
+from utils.compaction import compact_frame, memory_report, plain_frame
+from utils.instrumentation import instrumented, note, note_cache
+from utils.timeseries import downsample_time_series, time_column
+
+logger = logging.getLogger("lida")
+
+DATA_DIR = "data"
+COLUMNAR_DIR = os.path.join(DATA_DIR, "columnar")
+# load with compact dtypes (categoricals, narrow numbers, Arrow strings), "0" keeps pandas' defaults
+COMPACT_DTYPES = os.getenv("LIDA_COMPACT_DTYPES", "1") != "0"
+MAX_CACHED_FRAMES = 8
+LIDA_MAX_ROWS = 4500
+HASH_BLOCK_SIZE = 1 << 20
+
+# (absolute path, size, mtime) -> content hash, so reruns don't re-hash unchanged files
+_digests = {}
+_digests_lock = threading.Lock()
+
+# content hash -> DataFrame, least recently used first
+_frames = OrderedDict()
+_frames_lock = threading.Lock()
+# content hash -> lock held while the source is parsed, so concurrent loads parse it once
+_parse_locks = {}
+# content hash -> the frame given to LIDA and to chart code, least recently used first
+_lida_frames = OrderedDict()
+
+# compression suffixes of source files, pandas decompresses them while parsing
+COMPRESSIONS = {".gz": "gzip", ".zst": "zstd"}
+SOURCE_FORMATS = {".csv": "csv", ".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet"}
+# formats whose new rows can be read from the byte offset where the previous version ended
+APPENDABLE_FORMATS = ("csv", "jsonl")
+
+# dataset path -> recent versions {"digest", "size", "rows"}, oldest first, for reusing work on appended files
+VERSIONS_PATH = os.path.join(DATA_DIR, "versions.json")
+MAX_VERSIONS = 8
+_versions_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """ Hash the content of a file
+
+    Args:
+    ----
+        path: str
+            The path to the file
+
+    Returns:
+    -------
+        str: The sha256 hex digest of the file content
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        if key in _digests:
+            return _digests[key]
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            sha.update(block)
+    digest = sha.hexdigest()
+
+    with _digests_lock:
+        _digests[key] = digest
+    return digest
+
+
+def remember_digest(path: str, digest: str) -> None:
+    """ Record the content hash of a file that was hashed while it was written """
+    stat = os.stat(path)
+    with _digests_lock:
+        _digests[(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)] = digest
+
+
+def _source_extension(path: str) -> tuple:
+    root, extension = os.path.splitext(path.lower())
+    compression = COMPRESSIONS.get(extension)
+    if compression is not None:
+        extension = os.path.splitext(root)[1]
+    return extension, compression
+
+
+def is_source_file(path: str) -> bool:
+    """ Whether the file has a supported format, e.g. data.csv or data.jsonl.gz """
+    return _source_extension(path)[0] in SOURCE_FORMATS
+
+
+def source_format(path: str) -> tuple:
+    """ The format and compression of a source file from its extensions
+
+    Returns:
+    -------
+        tuple: (format, compression), e.g. ("csv", "gzip") for data.csv.gz;
+        unknown extensions are read as CSV
+    """
+    extension, compression = _source_extension(path)
+    return SOURCE_FORMATS.get(extension, "csv"), compression
+
+
+def read_source(path: str) -> pd.DataFrame:
+    """ Parse a CSV, JSON, JSON Lines or Parquet file, gzip or zstd compressed or not
+
+    Args:
+    ----
+        path: str
+            The path to the file
+
+    Returns:
+    -------
+        pd.DataFrame: The parsed data
+    """
+    format, compression = source_format(path)
+    if format == "parquet":
+        return pd.read_parquet(path)
+    if format == "jsonl":
+        return pd.read_json(path, lines=True, compression=compression)
+    if format == "json":
+        return pd.read_json(path, compression=compression)
+    return pd.read_csv(path, compression=compression)
+
+
+def is_appendable(path: str) -> bool:
+    """ Whether rows appended to the file can be read on their own: uncompressed CSV and JSON Lines """
+    format, compression = source_format(path)
+    return compression is None and format in APPENDABLE_FORMATS
+
+
+def columnar_path(digest: str) -> str:
+    """ The path of the columnar copy of the dataset version with this content hash """
+    suffix = ".compact" if COMPACT_DTYPES else ""
+    return os.path.join(COLUMNAR_DIR, f"{digest}{suffix}.feather")
+
+
+def memory_report_path(digest: str) -> str:
+    """ The path of the memory report of the dataset version with this content hash """
+    return os.path.join(COLUMNAR_DIR, f"{digest}.memory.json")
+
+
+def read_memory_report(digest: str) -> list:
+    """ The memory report of the dataset version with this content hash, see `Dataset.memory_report` """
+    try:
+        with open(memory_report_path(digest)) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _read_versions() -> dict:
+    try:
+        with open(VERSIONS_PATH) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def file_versions(path: str) -> list:
+    """ The recorded versions of the file, oldest first, as dicts with digest, size and rows """
+    with _versions_lock:
+        return _read_versions().get(os.path.abspath(path), [])
+
+
+def record_version(path: str, digest: str, size: int, rows: int) -> None:
+    """ Remember a version of the file that was parsed or profiled, with its size in bytes and its rows """
+    path = os.path.abspath(path)
+    with _versions_lock:
+        index = _read_versions()
+        versions = [version for version in index.get(path, []) if version["digest"] != digest]
+        versions.append({"digest": digest, "size": size, "rows": rows})
+        index[path] = versions[-MAX_VERSIONS:]
+        os.makedirs(DATA_DIR, exist_ok=True)
+        tmp_path = f"{VERSIONS_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(index, file)
+        os.replace(tmp_path, VERSIONS_PATH)
+
+
+def _prefix_digest(path: str, size: int) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        while size > 0:
+            block = file.read(min(HASH_BLOCK_SIZE, size))
+            if not block:
+                break
+            sha.update(block)
+            size -= len(block)
+    return sha.hexdigest()
+
+
+def appended_base(dataset: "Dataset", usable: Callable[[str], bool]) -> dict:
+    """ The latest recorded version the file is an append of, among those `usable` accepts
+
+    A version is a base when the file is longer, the version ended with a
+    newline and the first `size` bytes of the file hash to its digest, i.e.
+    rows were only added at the end. Only candidates `usable` accepts (e.g.
+    those with a columnar copy) are hashed.
+
+    Args:
+    ----
+        dataset: Dataset
+            The dataset handle
+        usable: Callable[[str], bool]
+            Whether the work saved for the version with this digest is still there
+
+    Returns:
+    -------
+        dict: The version, with digest, size and rows, or None
+    """
+    if not is_appendable(dataset.path):
+        return None
+    size = os.path.getsize(dataset.path)
+    for version in reversed(file_versions(dataset.path)):
+        if not 0 < version["size"] < size or not usable(version["digest"]):
+            continue
+        with open(dataset.path, "rb") as file:
+            file.seek(version["size"] - 1)
+            ends_with_newline = file.read(1) == b"\n"
+        if ends_with_newline and _prefix_digest(dataset.path, version["size"]) == version["digest"]:
+            return version
+    return None
+
+
+def read_appended(path: str, offset: int, columns: list, chunksize: int = 100_000,
+                  dtypes: dict = None) -> Iterator[pd.DataFrame]:
+    """ Read the rows of a CSV or JSON Lines file that start at byte `offset`
+
+    Args:
+    ----
+        path: str
+            The path to the file
+        offset: int
+            Where the rows start, the size of the version they were appended to
+        columns: list
+            The columns of the file; JSON keys not among them are dropped
+        chunksize: int
+            The number of rows per chunk
+        dtypes: dict
+            The dtypes of (some of) the columns, e.g. those of the earlier
+            rows, instead of inferring them from the new rows only
+
+    Returns:
+    -------
+        Iterator[pd.DataFrame]: The new rows, in chunks
+    """
+    with open(path, "rb") as file:
+        file.seek(offset)
+        if source_format(path)[0] == "jsonl":
+            with pd.read_json(file, lines=True, chunksize=chunksize, dtype=dtypes or True) as reader:
+                for chunk in reader:
+                    yield chunk.reindex(columns=columns)
+        else:
+            with pd.read_csv(file, header=None, names=columns, chunksize=chunksize, dtype=dtypes) as reader:
+                yield from reader
+
+
+class Dataset:
+    """ Handle to a dataset file, identified by the hash of its content
+
+    The file is parsed at most once per process. Parsed frames are kept in a
+    bounded in-memory LRU shared by all pages and sessions, and a columnar
+    (Feather) copy is written under `data/columnar/` so that later processes
+    memory-map it instead of parsing the source again.
+
+    Args:
+    ----
+        path: str
+            The path to the CSV or JSON file
+        label: str
+            The name shown for the dataset, defaults to the file name
+    """
+
+    def __init__(self, path: str, label: str = None) -> None:
+        self.path = path
+        self.file_name = os.path.basename(path)
+        self.label = label or os.path.splitext(self.file_name)[0]
+
+    def __str__(self) -> str:
+        return self.path
+
+    def __repr__(self) -> str:
+        return f"Dataset({self.path!r})"
+
+    @property
+    def digest(self) -> str:
+        return file_digest(self.path)
+
+    @property
+    def columnar_path(self) -> str:
+        return columnar_path(self.digest)
+
+    @property
+    def memory_report_path(self) -> str:
+        return memory_report_path(self.digest)
+
+    def memory_report(self) -> list:
+        """ The memory of the columns with the default and the compact dtypes, see `compaction.memory_report`
+
+        Returns:
+        -------
+            list: The report made when the source was parsed, None if it was not compacted
+        """
+        return read_memory_report(self.digest)
+
+    @instrumented("load")
+    def load(self) -> pd.DataFrame:
+        """ Load the dataset
+
+        Returns:
+        -------
+            pd.DataFrame: A shallow copy of the cached frame, so adding or
+            replacing columns does not leak into the cache
+        """
+        digest = self.digest
+        with _frames_lock:
+            if digest in _frames:
+                _frames.move_to_end(digest)
+                note_cache(hit=True)
+                return _frames[digest].copy(deep=False)
+            parse_lock = _parse_locks.setdefault(digest, threading.Lock())
+
+        with parse_lock:
+            with _frames_lock:
+                if digest in _frames:
+                    # loaded by another thread, e.g. the background conversion of an upload
+                    note_cache(hit=True)
+                    return _frames[digest].copy(deep=False)
+
+            if os.path.exists(self.columnar_path):
+                note_cache(hit=True)
+                data = feather.read_table(self.columnar_path, memory_map=True).to_pandas()
+            else:
+                note_cache(hit=False)
+                size = os.path.getsize(self.path)
+                base = appended_base(self, usable=lambda digest: os.path.exists(columnar_path(digest)))
+                # rows were appended to a version with a columnar copy: parse only the new ones
+                data = self._extend(base) if base is not None else None
+                if data is None:
+                    note(bytes=size)
+                    data = read_source(self.path)
+                if COMPACT_DTYPES:
+                    compacted = compact_frame(data)
+                    self._write_memory_report(memory_report(data, compacted))
+                    data = compacted
+                self._write_columnar(data)
+                record_version(self.path, digest, size, len(data))
+
+            with _frames_lock:
+                _frames[digest] = data
+                _frames.move_to_end(digest)
+                while len(_frames) > MAX_CACHED_FRAMES:
+                    _frames.popitem(last=False)
+                _parse_locks.pop(digest, None)
+        return data.copy(deep=False)
+
+    def _extend(self, base: dict) -> pd.DataFrame:
+        """ The base version's frame with the appended rows, or None when they don't parse like a full parse would
+
+        The new rows are parsed with the dtypes of the earlier ones; a value
+        that doesn't fit them (e.g. text in a column of numbers) changes the
+        dtype of the whole column, so the file is parsed again instead.
+        """
+        previous = feather.read_table(columnar_path(base["digest"]), memory_map=True).to_pandas()
+        if len(previous) != base["rows"]:
+            return None
+        if COMPACT_DTYPES:
+            # back to the dtypes of the parse, which the memory report recorded
+            report = read_memory_report(base["digest"])
+            if report is None:
+                return None
+            try:
+                previous = plain_frame(previous).astype({row["column"]: row["dtype_before"] for row in report[1:]})
+            except (ValueError, TypeError, KeyError):
+                return None
+        note(bytes=os.path.getsize(self.path) - base["size"])
+        columns = previous.columns.tolist()
+        # object columns stay inferred, reading them as object would turn numbers and booleans into text
+        dtypes = {column: dtype for column, dtype in previous.dtypes.items() if dtype != object}
+        try:
+            appended = list(read_appended(self.path, base["size"], columns, dtypes=dtypes))
+        except (ValueError, TypeError, OverflowError):
+            return None
+        if any(not chunk.dtypes.equals(previous.dtypes) for chunk in appended):
+            return None
+        return pd.concat([previous, *appended], ignore_index=True)
+
+    def _write_memory_report(self, report: list) -> None:
+        os.makedirs(COLUMNAR_DIR, exist_ok=True)
+        tmp_path = f"{self.memory_report_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(report, file)
+        os.replace(tmp_path, self.memory_report_path)
+
+    def _write_columnar(self, data: pd.DataFrame) -> None:
+        os.makedirs(COLUMNAR_DIR, exist_ok=True)
+        tmp_path = f"{self.columnar_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            data.to_feather(tmp_path)
+            os.replace(tmp_path, self.columnar_path)
+        except Exception as error:
+            # e.g. object columns mixing numbers and strings, keep parsing the source instead
+            logger.info(f"Could not write a columnar copy of {self.path}: {error}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def open_dataset(path: str, label: str = None) -> Dataset:
+    """ Get a handle to the dataset at `path`, or None if there is no path """
+    if not path:
+        return None
+    return Dataset(path, label=label)
+
+
+def lida_frame(dataset: Dataset) -> pd.DataFrame:
+    """ Prepare the dataset the way `lida.utils.read_dataframe` does
+
+    Column names are cleaned and the rows sampled down to 4500, but the frame
+    comes from the dataset cache and the source file is never rewritten.
+    Compacted columns get back the dtypes generated code expects. The sample
+    of a time series also keeps the extremes of every numeric column per
+    time bucket (`downsample_time_series`), so its charts still show their
+    spikes.
+
+    Args:
+    ----
+        dataset: Dataset
+            The dataset handle
+
+    Returns:
+    -------
+        pd.DataFrame: The frame to pass to `lida.summarize`
+    """
+    digest = dataset.digest
+    with _frames_lock:
+        if digest in _lida_frames:
+            _lida_frames.move_to_end(digest)
+            return _lida_frames[digest].copy(deep=False)
+
+    data = clean_column_names(dataset.load())
+    if len(data) > LIDA_MAX_ROWS:
+        column = time_column(data)
+        if column is not None:
+            data = downsample_time_series(data, column, LIDA_MAX_ROWS)
+        else:
+            data = data.sample(LIDA_MAX_ROWS, random_state=42)
+    data = plain_frame(data)
+
+    with _frames_lock:
+        _lida_frames[digest] = data
+        while len(_lida_frames) > MAX_CACHED_FRAMES:
+            _lida_frames.popitem(last=False)
+    return data.copy(deep=False)
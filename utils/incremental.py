@@ -0,0 +1,163 @@
+import logging
+import os
+import pickle
+import threading
+
+from utils.dataset_store import DATA_DIR, Dataset, appended_base, is_appendable, read_appended, record_version
+from utils.instrumentation import instrumented, note, note_cache
+from utils.streaming_profiler import STREAMING_CHUNKSIZE, ColumnSketch, read_chunks
+
+logger = logging.getLogger("lida")
+
+SKETCHES_DIR = os.path.join(DATA_DIR, "sketches")
+# profile appendable files (CSV, JSON Lines) from column sketches extended with the appended rows, "0" disables it
+INCREMENTAL_PROFILES = os.getenv("LIDA_INCREMENTAL_PROFILES", "1") != "0"
+
+# dataset hash -> {"size", "rows", "sketches"}, so reruns don't unpickle the sketches again
+_states = {}
+_states_lock = threading.Lock()
+# dataset hash -> lock held while its sketches are computed
+_sketch_locks = {}
+# dataset hashes whose sketches are being (or were) made in the background
+_sketching = set()
+# dataset hash -> whether an earlier version of the file has sketches, so reruns don't hash its prefix again
+_extends = {}
+
+
+def _sketch_path(digest: str) -> str:
+    return os.path.join(SKETCHES_DIR, f"{digest}.pkl")
+
+
+def _read_state(digest: str) -> dict:
+    try:
+        with open(_sketch_path(digest), "rb") as file:
+            return pickle.load(file)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def _write_state(digest: str, state: dict) -> None:
+    os.makedirs(SKETCHES_DIR, exist_ok=True)
+    path = _sketch_path(digest)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as file:
+        pickle.dump(state, file)
+    os.replace(tmp_path, path)
+
+
+def use_incremental(dataset: Dataset) -> bool:
+    """ Whether the dataset is profiled incrementally, see `column_sketches` """
+    return INCREMENTAL_PROFILES and is_appendable(dataset.path)
+
+
+def extends_sketches(dataset: Dataset) -> bool:
+    """ Whether the file is an earlier sketched version with rows appended, see `column_sketches`
+
+    Only then are profiles worth taking from the (approximate) sketches; a
+    file seen for the first time gets the exact profiles.
+    """
+    if not use_incremental(dataset):
+        return False
+    digest = dataset.digest
+    with _states_lock:
+        if digest in _extends:
+            return _extends[digest]
+    extends = appended_base(dataset, usable=lambda version: os.path.exists(_sketch_path(version))) is not None
+    with _states_lock:
+        _extends[digest] = extends
+    return extends
+
+
+def sketch_in_background(dataset: Dataset) -> None:
+    """ Make the sketches of an appendable file in a background thread, for when rows are appended to it later """
+    if not use_incremental(dataset):
+        return
+    digest = dataset.digest
+    with _states_lock:
+        if digest in _sketching or digest in _states or os.path.exists(_sketch_path(digest)):
+            return
+        _sketching.add(digest)
+
+    def sketch():
+        try:
+            column_sketches(dataset)
+        except Exception as error:
+            # profiles come from the exact profiler meanwhile, the next append is profiled in full
+            logger.info(f"Could not sketch {dataset.path}: {error}")
+            with _states_lock:
+                _sketching.discard(digest)
+
+    threading.Thread(target=sketch, daemon=True, name="sketch").start()
+
+
+@instrumented("sketches")
+def column_sketches(dataset: Dataset) -> dict:
+    """ Mergeable sketches of every column of the dataset, see `ColumnSketch`
+
+    The sketches are persisted under `data/sketches/<dataset hash>.pkl`.
+    When the file is an earlier sketched version with rows appended (same
+    prefix hash, see `appended_base`), only the new rows are read and folded
+    into that version's sketches, so the cost of a refresh follows the size
+    of the appended rows rather than the size of the file.
+
+    Args:
+    ----
+        dataset: Dataset
+            The dataset handle, an uncompressed CSV or JSON Lines file
+
+    Returns:
+    -------
+        dict: column -> ColumnSketch, shared, not to be updated
+    """
+    digest = dataset.digest
+    with _states_lock:
+        if digest in _states:
+            note_cache(hit=True)
+            return _states[digest]["sketches"]
+        sketch_lock = _sketch_locks.setdefault(digest, threading.Lock())
+
+    with sketch_lock:
+        with _states_lock:
+            if digest in _states:
+                note_cache(hit=True)
+                return _states[digest]["sketches"]
+
+        state = _read_state(digest)
+        note_cache(hit=state is not None)
+        if state is None:
+            size = os.path.getsize(dataset.path)
+            base = appended_base(dataset, usable=lambda version: os.path.exists(_sketch_path(version)))
+            # a fresh copy of the base version's sketches, its cached one stays as it is
+            state = _read_state(base["digest"]) if base is not None else None
+            if state is not None and state["rows"] == base["rows"]:
+                chunks = read_appended(dataset.path, state["size"], list(state["sketches"]), STREAMING_CHUNKSIZE)
+            else:
+                state = {"size": 0, "rows": 0, "sketches": {}}
+                chunks = read_chunks(dataset.path)
+            note(bytes=size - state["size"])
+            sketches = state["sketches"]
+            for chunk in chunks:
+                for column in chunk.columns:
+                    if column not in sketches:
+                        sketches[column] = ColumnSketch(column)
+                    sketches[column].update(chunk[column])
+                state["rows"] += len(chunk)
+            state["size"] = size
+            _write_state(digest, state)
+            record_version(dataset.path, digest, size, state["rows"])
+
+        with _states_lock:
+            _states[digest] = state
+            _sketch_locks.pop(digest, None)
+    return state["sketches"]
+
+
+def incremental_profiles(dataset: Dataset, columns: list) -> dict:
+    """ The approximate profiles of the columns from their sketches, with an `error` entry
+
+    Returns:
+    -------
+        dict: column -> (type, description), shaped like `profile_column`
+    """
+    sketches = column_sketches(dataset)
+    return {column: sketches[column].describe() for column in columns}
@@ -0,0 +1,98 @@
+import hashlib
+import logging
+import os
+import threading
+
+from utils.dataset_store import COMPRESSIONS, DATA_DIR, SOURCE_FORMATS, Dataset, is_source_file, remember_digest
+
+logger = logging.getLogger("lida")
+
+UPLOADS_DIR = os.path.join(DATA_DIR, "uploads")
+# extensions accepted by the uploader, compressed files end with .gz or .zst
+UPLOAD_TYPES = sorted({extension.lstrip(".") for extension in [*SOURCE_FORMATS, *COMPRESSIONS]})
+COPY_CHUNK_SIZE = 1 << 20
+
+# paths whose columnar copy is being (or was) made in the background
+_converting = set()
+_converting_lock = threading.Lock()
+
+
+def check_upload_name(name: str) -> None:
+    """ Raise ValueError unless the file name has a supported format, e.g. data.csv or data.jsonl.gz """
+    if not is_source_file(name):
+        supported = ", ".join(sorted(SOURCE_FORMATS))
+        raise ValueError(f"Unsupported file {name}: use {supported}, optionally compressed with gzip (.gz) or "
+                         f"zstd (.zst)")
+
+
+def _digest(file) -> str:
+    sha = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(COPY_CHUNK_SIZE), b""):
+        sha.update(block)
+    return sha.hexdigest()
+
+
+def _stored_file(directory: str) -> str:
+    if not os.path.isdir(directory):
+        return None
+    for name in os.listdir(directory):
+        if not name.endswith(".tmp"):
+            return os.path.join(directory, name)
+    return None
+
+
+def convert_in_background(path: str) -> None:
+    """ Parse the file once in a background thread, leaving its columnar copy for every later load """
+    with _converting_lock:
+        if path in _converting:
+            return
+        _converting.add(path)
+
+    def convert():
+        try:
+            Dataset(path).load()
+        except Exception as error:
+            # the page parsing it reports the error to the user
+            logger.info(f"Could not convert {path}: {error}")
+            with _converting_lock:
+                _converting.discard(path)
+
+    threading.Thread(target=convert, daemon=True, name="ingest").start()
+
+
+def ingest_upload(file) -> str:
+    """ Store an uploaded file under `data/uploads/<content hash>/`, once per content
+
+    The upload is hashed and, unless a file with the same content was
+    uploaded before, copied to disk in chunks as it is, compressed or not;
+    uploads with the same name but different content don't overwrite each
+    other. Its columnar copy is then made in the background.
+
+    Args:
+    ----
+        file: BinaryIO
+            The uploaded file (Streamlit's UploadedFile), with a `name`
+
+    Returns:
+    -------
+        str: The path of the stored file
+    """
+    name = os.path.basename(file.name)
+    check_upload_name(name)
+    digest = _digest(file)
+    directory = os.path.join(UPLOADS_DIR, digest)
+    path = _stored_file(directory)
+    if path is None:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        file.seek(0)
+        with open(tmp_path, "wb") as out:
+            for block in iter(lambda: file.read(COPY_CHUNK_SIZE), b""):
+                out.write(block)
+        os.replace(tmp_path, path)
+    # the directory is named by the hash, loading the dataset doesn't read the file again to hash it
+    remember_digest(path, digest)
+    convert_in_background(path)
+    return path
@@ -0,0 +1,303 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+# where the JSON lines log and the Prometheus textfile are written, "" disables the export
+METRICS_DIR = os.getenv("LIDA_METRICS_DIR", os.path.join("data", "metrics"))
+# comma separated: "jsonl", "prometheus"
+METRICS_FORMATS = os.getenv("LIDA_METRICS_FORMATS", "jsonl,prometheus")
+SPANS_LOG = "spans.jsonl"
+PROMETHEUS_FILE = "lida.prom"
+
+# the run (page rerun) and the span the current code is executing in; threads started
+# through utils.llm_pool copy the context, so their spans land in the same run
+_current_run = contextvars.ContextVar("instrumentation_run", default=None)
+_current_span = contextvars.ContextVar("instrumentation_span", default=None)
+
+# stage -> totals since the process started, for the Prometheus textfile
+_totals = {}
+_export_lock = threading.Lock()
+
+TOTAL_FIELDS = ("calls", "seconds", "prompt_tokens", "completion_tokens", "cache_hits", "cache_misses", "bytes",
+                "errors")
+
+
+class Run:
+    """ The spans recorded during one rerun of a page """
+
+    def __init__(self, page: str) -> None:
+        self.id = uuid.uuid4().hex
+        self.page = page
+        self.started = time.time()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def add(self, span: dict) -> None:
+        with self.lock:
+            self.spans.append(span)
+
+
+def start_run(page: str) -> Run:
+    """ Start recording the spans of this rerun of `page` """
+    run = Run(page)
+    _current_run.set(run)
+    _current_span.set(None)
+    return run
+
+
+def current_run() -> Run:
+    return _current_run.get()
+
+
+def _new_record(stage: str, fields: dict) -> dict:
+    parent = _current_span.get()
+    return {
+        "stage": stage,
+        "parent": parent["stage"] if parent else None,
+        "seconds": 0.0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "bytes": 0,
+        "error": None,
+        **fields,
+    }
+
+
+def _finish(record: dict, start: float) -> None:
+    record["seconds"] = round(time.perf_counter() - start, 4)
+    run = _current_run.get()
+    if run is not None:
+        run.add(record)
+
+
+@contextmanager
+def span(stage: str, **fields):
+    """ Time a stage and record it in the current run
+
+    The yielded dict can be annotated while the stage runs; `note`,
+    `note_cache` and the instrumented text generator add bytes, cache hits
+    and token counts to the innermost span.
+
+    Args:
+    ----
+        stage: str
+            The name of the stage, e.g. "summarize"
+        fields:
+            Extra fields of the record, e.g. the model
+    """
+    record = _new_record(stage, fields)
+    token = _current_span.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as error:
+        record["error"] = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(record, start)
+
+
+def _span_generator(stage: str, items: Iterator) -> Iterator:
+    """ Record a generator as one span, from its creation until it is exhausted or closed
+
+    The span is the current one only while the generator computes its next
+    item, so the consumer's own work between items is not attributed to it.
+    """
+    record = _new_record(stage, {})
+    start = time.perf_counter()
+    try:
+        while True:
+            token = _current_span.set(record)
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            except BaseException as error:
+                record["error"] = f"{type(error).__name__}: {error}"
+                raise
+            finally:
+                _current_span.reset(token)
+            yield item
+    finally:
+        items.close()
+        _finish(record, start)
+
+
+def note(**fields) -> None:
+    """ Add to the numeric fields (or set the others) of the innermost span, if any """
+    record = _current_span.get()
+    if record is None:
+        return
+    for key, value in fields.items():
+        if isinstance(value, (int, float)) and isinstance(record.get(key), (int, float)):
+            record[key] += value
+        else:
+            record[key] = value
+
+
+def note_cache(hit: bool, count: int = 1) -> None:
+    note(**({"cache_hits": count} if hit else {"cache_misses": count}))
+
+
+def instrumented(stage: str) -> Callable:
+    """ Decorator recording every call of the function as a span, generators while they are iterated """
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                return _span_generator(stage, func(*args, **kwargs))
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def timed(stage: str, func: Callable) -> Callable:
+    """ `func` wrapped in a span, for callables handed to threads """
+    return instrumented(stage)(func)
+
+
+class _CacheProbe:
+    """ Proxy of an llmx (diskcache) cache counting hits and misses of `cache_request`
+
+    `cache_request` reads the entry on a hit and writes it after a miss.
+    """
+
+    def __init__(self, cache) -> None:
+        self._cache = cache
+
+    def __contains__(self, key) -> bool:
+        return key in self._cache
+
+    def __getitem__(self, key):
+        note_cache(hit=True)
+        return self._cache[key]
+
+    def __setitem__(self, key, value) -> None:
+        note_cache(hit=False)
+        self._cache[key] = value
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+
+def _usage(response, key: str) -> int:
+    usage = getattr(response, "usage", None)
+    if isinstance(usage, dict):
+        return int(usage.get(key) or 0)
+    return int(getattr(usage, key, 0) or 0)
+
+
+def instrument_text_generator(text_gen):
+    """ Record every `generate` call of the text generator as an "llm" span
+
+    The spans carry the model, the prompt and completion tokens reported by
+    the provider (counted locally when it doesn't report them) and whether the
+    llmx cache answered. Returns the same text generator.
+    """
+    if getattr(text_gen, "_instrumented", False):
+        return text_gen
+    from utils.tokens import count_tokens
+
+    generate = text_gen.generate
+    if getattr(text_gen, "cache", None) is not None:
+        text_gen.cache = _CacheProbe(text_gen.cache)
+
+    @functools.wraps(generate)
+    def instrumented_generate(messages, config=None, **kwargs):
+        model = getattr(config, "model", None) or getattr(text_gen, "model_name", None)
+        with span("llm", model=model) as record:
+            response = generate(messages, config=config, **kwargs) if config is not None else generate(
+                messages, **kwargs)
+            texts = [message["content"] for message in response.text]
+            record["prompt_tokens"] = _usage(response, "prompt_tokens") or count_tokens(
+                " ".join(str(message.get("content", "")) for message in messages) if isinstance(messages, list)
+                else str(messages))
+            record["completion_tokens"] = _usage(response, "completion_tokens") or sum(
+                count_tokens(text) for text in texts)
+            return response
+
+    text_gen.generate = instrumented_generate
+    text_gen._instrumented = True
+    return text_gen
+
+
+def _prometheus_lines() -> list:
+    lines = []
+    for field in TOTAL_FIELDS:
+        name = f"lida_stage_{field}_total"
+        lines.append(f"# TYPE {name} counter")
+        for stage, totals in sorted(_totals.items()):
+            lines.append(f'{name}{{stage="{stage}"}} {totals[field]:.10g}')
+    return lines
+
+
+def export_run(run: Run) -> None:
+    """ Append the spans of the run to the JSON lines log and rewrite the Prometheus textfile """
+    if not METRICS_DIR or not run.spans:
+        return
+    formats = {part.strip() for part in METRICS_FORMATS.split(",")}
+    with run.lock:
+        spans = list(run.spans)
+    with _export_lock:
+        for record in spans:
+            totals = _totals.setdefault(record["stage"], dict.fromkeys(TOTAL_FIELDS, 0))
+            totals["calls"] += 1
+            totals["errors"] += record["error"] is not None
+            for field in TOTAL_FIELDS[1:-1]:
+                totals[field] += record[field]
+
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        if "jsonl" in formats:
+            with open(os.path.join(METRICS_DIR, SPANS_LOG), "a") as file:
+                for record in spans:
+                    file.write(json.dumps({"run": run.id, "page": run.page, "time": run.started, **record},
+                                          default=str) + "\n")
+        if "prometheus" in formats:
+            # written to a temporary file and renamed, so node_exporter never reads half a file
+            path = os.path.join(METRICS_DIR, PROMETHEUS_FILE)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as file:
+                file.write("\n".join(_prometheus_lines()) + "\n")
+            os.replace(tmp_path, path)
+
+
+def instrumentation_panel(run: Run = None) -> None:
+    """ Show the spans of this rerun in a collapsible sidebar panel and export them
+
+    Call it at the end of the page, after every instrumented stage ran.
+    """
+    import pandas as pd
+    import streamlit as st
+
+    run = run or current_run()
+    if run is None:
+        return
+    export_run(run)
+    with st.sidebar.expander("Instrumentation", expanded=False):
+        if not run.spans:
+            st.write("Nothing was recorded in this run.")
+            return
+        spans = pd.DataFrame(run.spans)
+        top_level = spans[spans["parent"].isna()]
+        st.write(f"**{len(spans)} spans**, {top_level['seconds'].sum():.2f}s in top-level stages")
+        totals = spans.groupby("stage")[list(TOTAL_FIELDS[1:-1])].sum()
+        totals.insert(0, "calls", spans.groupby("stage").size())
+        st.dataframe(totals.sort_values("seconds", ascending=False))
+        st.dataframe(spans, hide_index=True)
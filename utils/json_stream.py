@@ -0,0 +1,69 @@
+import json
+
+
+class JSONObjectStream:
+    """ Incremental parser for a streamed list of JSON objects
+
+    Text is fed as it arrives; every top-level `{...}` object is returned as
+    soon as its closing brace is seen. Brackets, code fences and other text
+    around the objects are ignored, and braces inside strings are not counted.
+    An object that is complete but not valid JSON is skipped.
+    """
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.current = []
+
+    def feed(self, text: str) -> list:
+        """ Parse the next piece of text
+
+        Args:
+        ----
+            text: str
+                The next chunk of the response
+
+        Returns:
+        -------
+            list: The objects completed by this chunk
+        """
+        objects = []
+        for char in text:
+            if self.depth == 0:
+                if char == "{":
+                    self.depth = 1
+                    self.current = [char]
+                continue
+
+            self.current.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        objects.append(json.loads("".join(self.current)))
+                    except json.decoder.JSONDecodeError:
+                        pass
+                    self.current = []
+        return objects
+
+    @property
+    def pending(self) -> str:
+        """ The text of the object that is still open, if any """
+        return "".join(self.current)
+
+
+def parse_objects(text: str) -> list:
+    """ All the complete JSON objects in `text`, e.g. a truncated JSON list """
+    return JSONObjectStream().feed(text)
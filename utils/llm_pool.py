@@ -0,0 +1,101 @@
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 60.0
+
+# the waits of the `run_concurrently` call the current thread runs, not counted in its timeout
+_call_waits = contextvars.ContextVar("call_waits", default=None)
+
+
+class _Waits:
+    """ Time a call spent in `waiting` blocks, the current one included """
+
+    def __init__(self) -> None:
+        self.total = 0.0
+        self.since = None
+
+    def waited(self, now: float) -> float:
+        since = self.since
+        return self.total + (now - since if since is not None else 0.0)
+
+
+@contextmanager
+def waiting():
+    """ Leave the time spent in the block out of the timeout of the `run_concurrently` call running it
+
+    For waits that are not the call's own work, e.g. for a slot of a
+    semaphore shared with other calls.
+    """
+    waits = _call_waits.get()
+    if waits is None:
+        yield
+        return
+    waits.since = time.monotonic()
+    try:
+        yield
+    finally:
+        waits.total += time.monotonic() - waits.since
+        waits.since = None
+
+
+def run_concurrently(tasks: dict[str, Callable], max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                     timeout: float = DEFAULT_TIMEOUT) -> Iterator[tuple]:
+    """ Run independent (LLM) calls in threads and yield them as they finish
+
+    At most `max_concurrency` calls run at once. A call that runs longer than
+    `timeout` seconds is reported as timed out and gives its slot to the next
+    call; its thread is left to finish in the background since threads can't
+    be killed.
+
+    Args:
+    ----
+        tasks: dict[str, Callable]
+            Name -> function without arguments
+        max_concurrency: int
+            The number of calls in flight at the same time
+        timeout: float
+            The timeout of each call in seconds, counted from when it starts,
+            without the time it spends in `waiting` blocks
+
+    Returns:
+    -------
+        Iterator[tuple]: (name, result, error) in completion order, `error` is
+        None on success and `result` is None on failure
+    """
+    if not tasks:
+        return
+    queue = list(tasks.items())
+    running = {}
+    executor = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="llm")
+    try:
+        while queue or running:
+            while queue and len(running) < max(max_concurrency, 1):
+                name, task = queue.pop(0)
+                # the task sees the caller's context, e.g. the instrumentation run of the rerun
+                context = contextvars.copy_context()
+                waits = _Waits()
+                context.run(_call_waits.set, waits)
+                running[executor.submit(context.run, task)] = (name, time.monotonic(), waits)
+
+            now = time.monotonic()
+            next_deadline = min(start + waits.waited(now) for _, start, waits in running.values()) + timeout
+            done, _ = wait(running, timeout=max(next_deadline - now, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                name, _, _ = running.pop(future)
+                try:
+                    yield name, future.result(), None
+                except Exception as error:
+                    yield name, None, error
+
+            now = time.monotonic()
+            for future, (name, start, waits) in list(running.items()):
+                if now - start - waits.waited(now) >= timeout:
+                    del running[future]
+                    future.cancel()
+                    yield name, None, TimeoutError(f"{name} did not finish within {timeout:g}s")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
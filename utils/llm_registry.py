@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import threading
+import time
+
+import streamlit as st
+from lida import Manager, llm
+from llmx import TextGenerator
+
+from utils.instrumentation import instrument_text_generator
+
+logger = logging.getLogger("lida")
+
+# text generators unused for this long are closed and dropped
+IDLE_SECONDS = 30 * 60
+
+# (provider, api key hash, model) -> [text generator, last used]
+_text_generators = {}
+_registry_lock = threading.Lock()
+
+
+def registry_key(provider: str, api_key: str, model: str) -> tuple:
+    """ Registry key, the API key itself is never kept in it """
+    key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+    return provider, key_hash, model
+
+
+def _close(text_gen: TextGenerator) -> None:
+    client = getattr(text_gen, "client", None)
+    try:
+        if client is not None and hasattr(client, "close"):
+            client.close()
+        text_gen.cache.close()
+    except Exception as error:
+        logger.info(f"Error closing an idle text generator: {error}")
+
+
+def evict_idle(now: float = None) -> None:
+    """ Close the text generators that were not used for `IDLE_SECONDS` """
+    now = now or time.monotonic()
+    with _registry_lock:
+        idle = [key for key, (_, last_used) in _text_generators.items() if now - last_used > IDLE_SECONDS]
+        evicted = [_text_generators.pop(key)[0] for key in idle]
+    for text_gen in evicted:
+        _close(text_gen)
+
+
+def get_text_generator(provider: str, api_key: str, model: str) -> TextGenerator:
+    """ The process-wide text generator for (provider, API key, model)
+
+    The generator owns the HTTP client (and its connection pool) and the llmx
+    cache handle, so reusing it avoids paying client setup, TLS handshakes and
+    cache opening on every rerun.
+
+    Args:
+    ----
+        provider: str
+            The llmx provider, e.g. "openai"
+        api_key: str
+            The provider API key
+        model: str
+            The model name
+
+    Returns:
+    -------
+        TextGenerator: The shared text generator
+    """
+    evict_idle()
+    key = registry_key(provider, api_key, model)
+    with _registry_lock:
+        entry = _text_generators.get(key)
+        if entry is None:
+            entry = [instrument_text_generator(llm(provider, api_key=api_key, model=model)), 0.0]
+            _text_generators[key] = entry
+        entry[1] = time.monotonic()
+        return entry[0]
+
+
+def get_manager(provider: str, api_key: str, model: str) -> Manager:
+    """ The LIDA manager of this session for (provider, API key, model)
+
+    Managers are cheap but hold the dataset of the last summary in `.data`, so
+    each session keeps its own, all of them sharing the process-wide text
+    generator.
+
+    Args:
+    ----
+        provider: str
+            The llmx provider, e.g. "openai"
+        api_key: str
+            The provider API key
+        model: str
+            The model name
+
+    Returns:
+    -------
+        Manager: The session's manager
+    """
+    text_gen = get_text_generator(provider, api_key, model)
+    managers = st.session_state.setdefault("lida_managers", {})
+    key = registry_key(provider, api_key, model)
+    manager = managers.get(key)
+    if manager is None or manager.text_gen is not text_gen:
+        manager = Manager(text_gen=text_gen)
+        managers[key] = manager
+    return manager
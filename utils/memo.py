@@ -0,0 +1,63 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Callable
+
+import streamlit as st
+
+MAX_MEMO_ENTRIES = 256
+
+
+def memo_key(*parts) -> str:
+    """ Stable hash of the parts identifying a result (code, goal, library, ...) """
+    serialized = json.dumps(parts, default=str, sort_keys=True)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def _memo() -> OrderedDict:
+    if "memo" not in st.session_state:
+        st.session_state["memo"] = OrderedDict()
+    return st.session_state["memo"]
+
+
+def get_memo(namespace: str, key_parts: tuple) -> Any:
+    """ A previously stored result, or None """
+    memo = _memo()
+    key = (namespace, memo_key(*key_parts))
+    if key in memo:
+        memo.move_to_end(key)
+    return memo.get(key)
+
+
+def set_memo(namespace: str, key_parts: tuple, value: Any) -> None:
+    """ Store a result computed outside of `memoized`, e.g. concurrently """
+    memo = _memo()
+    memo[(namespace, memo_key(*key_parts))] = value
+    while len(memo) > MAX_MEMO_ENTRIES:
+        memo.popitem(last=False)
+
+
+def memoized(namespace: str, key_parts: tuple, compute: Callable[[], Any], run: bool) -> Any:
+    """ Session-scoped memo for results that are only computed on request
+
+    Args:
+    ----
+        namespace: str
+            The kind of result, e.g. "explain"
+        key_parts: tuple
+            What the result depends on
+        compute: Callable
+            Computes the result
+        run: bool
+            Whether the user asked for the result on this rerun; when False only
+            a previously computed result is returned
+
+    Returns:
+    -------
+        Any: The result, or None if it was never requested
+    """
+    result = get_memo(namespace, key_parts)
+    if result is None and run:
+        result = compute()
+        set_memo(namespace, key_parts, result)
+    return result
@@ -0,0 +1,66 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator
+
+from utils.dataset_store import Dataset
+from utils.profiler import profile_column, profile_columnar
+
+# one pool per process, recreated when the worker count changes
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """ Get the shared profiling process pool with `workers` processes """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False, cancel_futures=True)
+            # spawn: the Streamlit server is multi-threaded, forking it is unsafe
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _executor_workers = workers
+        return _executor
+
+
+def profile_columns_parallel(dataset: Dataset, columns: list, workers: int) -> Iterator[tuple]:
+    """ Profile columns across the process pool
+
+    Args:
+    ----
+        dataset: Dataset
+            The dataset handle
+        columns: list
+            The columns to profile
+        workers: int
+            The number of worker processes
+
+    Returns:
+    -------
+        Iterator[tuple]: (column, (type, description)) in the order of `columns`,
+        each yielded as soon as it and the columns before it are done
+    """
+    if not os.path.exists(dataset.columnar_path):
+        # writes the columnar copy if the dataset was never parsed in this process
+        dataset.load()
+    if workers <= 1 or len(columns) <= 1 or not os.path.exists(dataset.columnar_path):
+        data = dataset.load()
+        for column in columns:
+            yield column, profile_column(data, column)
+        return
+
+    executor = process_pool(workers)
+    futures: list[Future] = [executor.submit(profile_columnar, dataset.columnar_path, column) for column in columns]
+    try:
+        for column, future in zip(columns, futures):
+            yield column, future.result()
+    finally:
+        for future in futures:
+            future.cancel()
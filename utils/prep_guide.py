@@ -1,9 +1,23 @@
 import json
 import logging
+import math
+import re
+from dataclasses import asdict
+from difflib import SequenceMatcher
+from typing import Iterator
 from lida.utils import clean_code_snippet
 from llmx import TextGenerator
+from llmx.datamodel import Message, TextGenerationResponse
+from llmx.utils import cache_request, num_tokens_from_messages
 from lida.datamodel import Goal, TextGenerationConfig, Persona
 
+from utils.instrumentation import instrumented, note
+from utils.json_stream import JSONObjectStream, parse_objects
+from utils.quality import describe_issues, top_issues
+from utils.llm_pool import DEFAULT_MAX_CONCURRENCY, DEFAULT_TIMEOUT, run_concurrently
+from utils.summary_codec import PROMPT_SUMMARY_TOKENS, encode_field, fit_summary
+from utils.tokens import count_tokens
+
 
 SYSTEM_INSTRUCTIONS = """
 You are a an experienced data analyst who can generate a given number of insightful GOALS about data, 
@@ -45,45 +59,252 @@ THE OUTPUT SHOULD ONLY USE THE JSON FORMAT ABOVE.
 
 logger = logging.getLogger("lida")
 
+# follow-up requests made to fill in commentaries lost to a truncated or malformed response
+MAX_CONTINUATIONS = 2
+
+
+# summaries above this many tokens are split into shards of at most this size
+SHARD_TOKEN_BUDGET = 2000
+# questions about the same fields that are this similar are duplicates
+DUPLICATE_SIMILARITY = 0.8
+
+
+def shard_summary(summary: dict, token_budget: int = SHARD_TOKEN_BUDGET) -> list:
+    """Split the summary fields into summaries of consecutive column groups under the token budget"""
+
+    fields = summary.get("fields", [])
+    shards, shard, shard_tokens = [], [], 0
+    for field in fields:
+        field_tokens = count_tokens(encode_field(field, "full", stage="prep"))
+        if shard and shard_tokens + field_tokens > token_budget:
+            shards.append(shard)
+            shard, shard_tokens = [], 0
+        shard.append(field)
+        shard_tokens += field_tokens
+    if shard:
+        shards.append(shard)
+
+    return [{**summary,
+             "fields": shard,
+             "field_names": [field["column"] for field in shard]} for shard in shards] or [summary]
+
+
+def mentioned_fields(guide: dict, field_names: list) -> frozenset:
+    """The dataset fields a commentary talks about"""
+    text = " ".join(str(guide.get(key, "")) for key in ("question", "rationale", "recommendation"))
+    return frozenset(name for name in field_names
+                     if re.search(rf"(?<!\w){re.escape(str(name))}(?!\w)", text))
+
+
+def is_duplicate(guide: dict, fields: frozenset, kept: list) -> bool:
+    """Whether a commentary repeats one of the `kept` (guide, fields) pairs"""
+    question = str(guide.get("question", "")).lower()
+    for other, other_fields in kept:
+        if fields == other_fields and SequenceMatcher(
+                None, question, str(other.get("question", "")).lower()).ratio() >= DUPLICATE_SIMILARITY:
+            return True
+    return False
+
+
+def next_index(guides: list) -> int:
+    """The index following the last commentary in `guides`"""
+    last = guides[-1].get("index") if guides else -1
+    return last + 1 if isinstance(last, int) else len(guides)
+
 
 class GuideExplorer():
     """Generat goals given a summary of data"""
 
-    def __init__(self) -> None:
-        pass
+    def __init__(self, summary_tokens: int = PROMPT_SUMMARY_TOKENS, issues: list = None) -> None:
+        # token budget of the encoded summary in each prompt
+        self.summary_tokens = summary_tokens
+        # ranked findings of utils.quality, the top ones about the prompted fields are included
+        self.issues = issues or []
 
-    def generate(self, summary: dict, textgen_config: TextGenerationConfig,
-                 text_gen: TextGenerator, n=5, persona: Persona = None) -> list[Goal]:
-        """Generate goals given a summary of data"""
+    def build_messages(self, summary: dict, n: int, persona: Persona = None,
+                       generated: list = None) -> list:
+        """Build the prompt asking for n commentaries about the summary, after the `generated` ones"""
 
+        encoded_summary = fit_summary(summary, self.summary_tokens, stage="prep")
         user_prompt = f"""The number of COMMENTARIES to generate is {n}. The commentaries should be based on the data summary below, \n\n .
-        {summary} \n\n"""
+        {encoded_summary} \n\n"""
 
         if not persona:
             persona = Persona(
                 persona="A highly skilled data analyst who can come up with strict, critical commentary about data",
                 rationale="")
 
+        issues = top_issues(self.issues, summary.get("field_names"))
+        if issues:
+            user_prompt += f"""\n These data quality issues were DETECTED EXACTLY by automated checks, build the commentaries on them and do not contradict them: \n{describe_issues(issues)} \n"""
+
         user_prompt += f"""\n The generated commentaries SHOULD BE FOCUSED ON THE INTERESTS AND PERSPECTIVE of a '{persona.persona} persona, who is insterested in strict, critical commentaries about the data. \n"""
 
-        messages = [
+        if generated:
+            # only the questions, the full objects would cost as many tokens as generating them again
+            questions = [guide.get("question") for guide in generated]
+            user_prompt += f"""\n The following commentaries were ALREADY GENERATED, DO NOT REPEAT THEM: {questions}. Continue from index {next_index(generated)}. \n"""
+
+        return [
             {"role": "system", "content": SYSTEM_INSTRUCTIONS},
             {"role": "assistant",
              "content":
              f"{user_prompt}\n\n {FORMAT_INSTRUCTIONS} \n\n. The generated {n} commentaries are: \n "}]
 
+    def complete(self, guides: list, summary: dict, textgen_config: TextGenerationConfig,
+                 text_gen: TextGenerator, n=5, persona: Persona = None) -> list:
+        """Ask only for the commentaries missing from `guides` and merge them in"""
+
+        guides = list(guides)
+        for _ in range(MAX_CONTINUATIONS):
+            missing = n - len(guides)
+            if missing <= 0:
+                break
+            messages = self.build_messages(summary, missing, persona, generated=guides)
+            response = text_gen.generate(messages=messages, config=textgen_config)
+            extra = parse_objects(response.text[0]["content"])
+            if not extra:
+                break
+            start = next_index(guides)
+            for offset, guide in enumerate(extra[:missing]):
+                guide["index"] = start + offset
+            guides += extra[:missing]
+        return guides[:n]
+
+    @instrumented("guides")
+    def generate(self, summary: dict, textgen_config: TextGenerationConfig,
+                 text_gen: TextGenerator, n=5, persona: Persona = None) -> list[Goal]:
+        """Generate goals given a summary of data"""
+
+        messages = self.build_messages(summary, n, persona)
+
         result: list[Goal] = text_gen.generate(messages=messages, config=textgen_config)
+        content = result.text[0]["content"]
 
         try:
-            json_string = clean_code_snippet(result.text[0]["content"])
+            json_string = clean_code_snippet(content)
             result = json.loads(json_string)
             # cast each item in the list to a Goal object
             if isinstance(result, dict):
                 result = [result]
             # result = [Goal(**x) for x in result]
         except json.decoder.JSONDecodeError:
-            logger.info(f"Error decoding JSON: {result.text[0]['content']}")
-            print(f"Error decoding JSON: {result.text[0]['content']}")
-            raise ValueError(
-                "The model did not return a valid JSON object while attempting generate goals. Consider using a larger model or a model with higher max token length.")
-        return result
\ No newline at end of file
+            logger.info(f"Error decoding JSON, salvaging complete objects: {content}")
+            # keep every commentary that was fully written, then ask only for the rest
+            result = self.complete(parse_objects(content), summary, textgen_config, text_gen, n=n, persona=persona)
+            if not result:
+                raise ValueError(
+                    "The model did not return a valid JSON object while attempting generate goals. Consider using a larger model or a model with higher max token length.")
+        return result
+
+    @instrumented("guides_stream")
+    def generate_stream(self, summary: dict, textgen_config: TextGenerationConfig,
+                        text_gen: TextGenerator, n=5, persona: Persona = None) -> Iterator[dict]:
+        """Generate commentaries, yielding each one as soon as the model has written it
+
+        OpenAI text generators are streamed token by token and share the llmx
+        cache with `generate`; other providers fall back to `generate`.
+        """
+
+        messages = self.build_messages(summary, n, persona)
+        client = getattr(text_gen, "client", None)
+        if client is None or not hasattr(client, "chat"):
+            yield from self.generate(summary, textgen_config, text_gen, n=n, persona=persona)
+            return
+
+        # same request, and so the same cache key, as OpenAITextGenerator.generate
+        model = textgen_config.model or text_gen.model_name
+        prompt_tokens = num_tokens_from_messages(messages)
+        oai_config = {
+            "model": model,
+            "temperature": textgen_config.temperature,
+            "max_tokens": max(text_gen.model_max_token_dict.get(model, 4096) - prompt_tokens - 10, 200),
+            "top_p": textgen_config.top_p,
+            "frequency_penalty": textgen_config.frequency_penalty,
+            "presence_penalty": textgen_config.presence_penalty,
+            "n": 1,
+            "messages": messages,
+        }
+
+        if textgen_config.use_cache:
+            cached = cache_request(cache=text_gen.cache, params=oai_config)
+            if cached:
+                guides = parse_objects(TextGenerationResponse(**cached).text[0]["content"])
+                yield from guides
+                if len(guides) < n:
+                    # a truncated response is cached as it was streamed, top it up like the first time
+                    completed = self.complete(guides, summary, textgen_config, text_gen, n=n, persona=persona)
+                    yield from completed[len(guides):]
+                return
+
+        parser = JSONObjectStream()
+        content = []
+        guides = []
+        stream = client.chat.completions.create(**oai_config, stream=True)
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            content.append(delta)
+            for guide in parser.feed(delta):
+                guides.append(guide)
+                yield guide
+
+        if len(guides) < n:
+            # truncated or malformed: keep what was streamed and ask only for the rest
+            completed = self.complete(guides, summary, textgen_config, text_gen, n=n, persona=persona)
+            yield from completed[len(guides):]
+
+        note(prompt_tokens=prompt_tokens, completion_tokens=count_tokens("".join(content), model))
+        response = TextGenerationResponse(
+            text=[Message(role="assistant", content="".join(content))],
+            logprobs=[],
+            config=oai_config,
+            usage={"prompt_tokens": prompt_tokens},
+        )
+        cache_request(cache=text_gen.cache, params=oai_config, values=asdict(response))
+
+    @instrumented("guides_sharded")
+    def generate_sharded(self, summary: dict, textgen_config: TextGenerationConfig,
+                         text_gen: TextGenerator, n=5, persona: Persona = None,
+                         token_budget: int = SHARD_TOKEN_BUDGET,
+                         max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                         timeout: float = DEFAULT_TIMEOUT) -> Iterator[dict]:
+        """Generate commentaries for column groups of a wide summary concurrently
+
+        Each shard asks for a share of the n commentaries proportional to its
+        number of fields. Commentaries are yielded as their shard finishes,
+        skipping those that repeat a kept one (same fields, similar question),
+        and re-indexed in yield order. Failed shards are skipped; when every
+        shard fails, a ValueError is raised after their errors are logged.
+        """
+
+        shards = shard_summary(summary, token_budget)
+        total_fields = max(sum(len(shard.get("fields", [])) for shard in shards), 1)
+        field_names = summary.get("field_names", [])
+
+        tasks = {}
+        for number, shard in enumerate(shards):
+            shard_n = max(math.ceil(n * len(shard.get("fields", [])) / total_fields), 1)
+            tasks[f"shard {number}"] = (lambda shard=shard, shard_n=shard_n: self.generate(
+                shard, textgen_config, text_gen, n=shard_n, persona=persona))
+
+        kept = []
+        failed, last_error = 0, None
+        for name, guides, error in run_concurrently(tasks, max_concurrency, timeout):
+            if error is not None:
+                logger.info(f"Guide generation failed for {name}: {error}")
+                failed, last_error = failed + 1, error
+                continue
+            for guide in guides:
+                fields = mentioned_fields(guide, field_names)
+                if is_duplicate(guide, fields, kept):
+                    continue
+                guide["index"] = len(kept)
+                kept.append((guide, fields))
+                yield guide
+                if len(kept) >= n:
+                    return
+        if tasks and failed == len(tasks):
+            # like `generate`, no commentaries at all is an error rather than an empty list
+            raise ValueError(f"Guide generation failed for every column group: {last_error}") from last_error
@@ -0,0 +1,73 @@
+import json
+import os
+import threading
+
+from utils.dataset_store import DATA_DIR
+
+PROFILES_DIR = os.path.join(DATA_DIR, "profiles")
+
+# dataset hash -> ProfileStore, so reruns don't re-read the sidecar file
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class ProfileStore:
+    """ Column profiles of one dataset, persisted to `data/profiles/<dataset hash>.json`
+
+    Every profile records the profiler version that computed it; a profile
+    from another version is treated as stale and reported as missing.
+
+    Args:
+    ----
+        digest: str
+            The content hash of the dataset
+        version: int
+            The current profiler version
+    """
+
+    def __init__(self, digest: str, version: int) -> None:
+        self.digest = digest
+        self.version = version
+        self.path = os.path.join(PROFILES_DIR, f"{digest}.json")
+        self.columns = None
+        self.profiles = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                content = json.load(file)
+            self.columns = content.get("columns")
+            self.profiles = content.get("profiles", {})
+
+    def get(self, col: str):
+        """ Get the (type, description) of a column, or None if it is missing or stale """
+        entry = self.profiles.get(str(col))
+        if entry is None or entry["version"] != self.version:
+            return None
+        return entry["type"], entry["description"]
+
+    def put(self, col: str, type: str, description: dict) -> None:
+        with self._lock:
+            self.profiles[str(col)] = {"version": self.version, "type": type, "description": description}
+
+    def missing(self, columns: list) -> list:
+        """ The columns among `columns` that have to be (re)computed """
+        return [col for col in columns if self.get(col) is None]
+
+    def save(self) -> None:
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        with self._lock:
+            content = {"columns": self.columns, "profiles": self.profiles}
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(content, file, default=str)
+            os.replace(tmp_path, self.path)
+
+
+def profile_store(digest: str, version: int) -> ProfileStore:
+    """ Get the process-wide profile store of a dataset """
+    with _stores_lock:
+        store = _stores.get(digest)
+        if store is None or store.version != version:
+            store = ProfileStore(digest, version)
+            _stores[digest] = store
+        return store
@@ -0,0 +1,217 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+# bump whenever the content of a description changes, stored profiles of other versions are recomputed
+PROFILER_VERSION = 2
+
+QUANTILES = [0, 0.25, 0.5, 0.75, 1.0]
+N_SAMPLES = 3
+
+
+def is_numerical_series(series: pd.Series) -> bool:
+    """ Check if the column is numerical from its dtype
+
+    Args:
+    ----
+        series: pd.Series
+            The column to check
+
+    Returns:
+    -------
+        bool: True if the column holds numbers (or only missing values), False otherwise
+    """
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return False
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return True
+    if series.dtype == object:
+        # mixed python ints/floats/NaN end up as object, infer_dtype scans them in C
+        inferred = pd.api.types.infer_dtype(series, skipna=True)
+        return inferred in ("integer", "floating", "mixed-integer-float", "decimal", "empty")
+    return False
+
+
+def histogram_labels(edges: np.ndarray) -> list:
+    """ Build np.histogram-style labels, the last bin is closed on both sides """
+    labels = [f"[{round(float(lo), 3)}, {round(float(hi), 3)})" for lo, hi in zip(edges[:-1], edges[1:])]
+    if labels:
+        labels[-1] = labels[-1][:-1] + "]"
+    return labels
+
+
+def profile_numerical(series: pd.Series) -> dict:
+    """ Profile a numerical column
+
+    The valid values are sorted once; quantiles, the unique count and the
+    histogram are all read off the sorted array, so no step goes back to the
+    rows of the DataFrame.
+
+    Args:
+    ----
+        series: pd.Series
+            The column to profile
+
+    Returns:
+    -------
+        dict: The description used by `display`
+    """
+    values = pd.to_numeric(series, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    missing_count = int(np.isnan(values).sum())
+    valid_values = np.sort(values[~np.isnan(values)])
+    valid_count = valid_values.size
+
+    if valid_count == 0:
+        return {
+            "id": series.name,
+            "quantiles": [np.nan] * len(QUANTILES),
+            "chart_columns": [],
+            "chart_data": [],
+            "valid": 0,
+            "missing": missing_count,
+            "mean": np.nan,
+            "std_dev": np.nan,
+            "dtype": "number",
+            "unique": 0,
+            "min": np.nan,
+            "max": np.nan,
+            "samples": [],
+        }
+
+    # linear interpolation, same as pd.Series.quantile
+    positions = np.asarray(QUANTILES) * (valid_count - 1)
+    lower = np.floor(positions).astype(int)
+    upper = np.ceil(positions).astype(int)
+    quantiles = valid_values[lower] + (valid_values[upper] - valid_values[lower]) * (positions - lower)
+
+    is_new_value = np.empty(valid_count, dtype=bool)
+    is_new_value[0] = True
+    np.not_equal(valid_values[1:], valid_values[:-1], out=is_new_value[1:])
+    unique_values = valid_values[is_new_value]
+    unique_count = unique_values.size
+    bins_count = unique_count if unique_count <= 5 else 10
+    low, high = valid_values[0], valid_values[-1]
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    edges = np.linspace(low, high, bins_count + 1)
+    # counts per bin straight from the sorted values, the last bin includes the max
+    positions = np.searchsorted(valid_values, edges, side="left")
+    positions[-1] = valid_count
+    counts = np.diff(positions)
+
+    as_python = int if pd.api.types.is_integer_dtype(series.dtype) else float
+    samples = pd.Series(unique_values).sample(min(N_SAMPLES, unique_count), random_state=42)
+
+    return {
+        "id": series.name,
+        "quantiles": [round(float(q), 0) for q in quantiles],
+        "chart_columns": histogram_labels(edges),
+        "chart_data": counts.tolist(),
+        "valid": valid_count,
+        "missing": missing_count,
+        "mean": round(float(valid_values.mean()), 2),
+        "std_dev": round(float(valid_values.std(ddof=1)), 2) if valid_count > 1 else np.nan,
+        "dtype": "number",
+        "unique": unique_count,
+        "min": as_python(valid_values[0]),
+        "max": as_python(valid_values[-1]),
+        "samples": [as_python(sample) for sample in samples],
+    }
+
+
+def profile_nominal(series: pd.Series) -> dict:
+    """ Profile a nominal column
+
+    A single hash-based `value_counts` gives the unique count and the most
+    common values.
+
+    Args:
+    ----
+        series: pd.Series
+            The column to profile
+
+    Returns:
+    -------
+        dict: The description used by `display`
+    """
+    missing_count = int(series.isna().sum())
+    occurence = series.value_counts(dropna=True, sort=False)
+    most_com_count = int(occurence.max()) if len(occurence) else 0
+    most_com = str(occurence[occurence == most_com_count].index.tolist())[1:-1] if len(occurence) else ""
+    samples = pd.Series(occurence.index).sample(min(N_SAMPLES, len(occurence)), random_state=42)
+    return {
+        "id": series.name,
+        "valid": len(series) - missing_count,
+        "missing": missing_count,
+        "unique": len(occurence),
+        "most_com": most_com,
+        "most_com_count": most_com_count,
+        "dtype": summary_dtype(series, occurence),
+        "samples": samples.tolist(),
+    }
+
+
+def summary_dtype(series: pd.Series, occurence: pd.Series) -> str:
+    """ The LIDA summary dtype of a nominal column
+
+    Args:
+    ----
+        series: pd.Series
+            The column
+        occurence: pd.Series
+            The value counts of the column
+
+    Returns:
+    -------
+        str: "boolean", "date", "category" or "string", as in LIDA's default summary
+    """
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return "boolean"
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return "date"
+    try:
+        # the distinct values are enough to tell if the column parses as dates
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            pd.to_datetime(pd.Series(occurence.index), errors="raise")
+        if len(occurence):
+            return "date"
+    except (ValueError, TypeError, OverflowError):
+        pass
+    if len(series) and len(occurence) / len(series) < 0.5:
+        return "category"
+    return "string"
+
+
+def profile_column(data: pd.DataFrame, col: str) -> tuple:
+    """ Profile the column without rendering it
+
+    Args:
+    ----
+        data: pd.DataFrame
+            The dataset
+        col: str
+            The column to profile
+
+    Returns:
+    -------
+        tuple: The column type ("numerical" or "nominal") and its description
+    """
+    series = data[col]
+    if is_numerical_series(series):
+        return "numerical", profile_numerical(series)
+    return "nominal", profile_nominal(series)
+
+
+def profile_columnar(columnar_path: str, column: str) -> tuple:
+    """ Profile one column of a Feather file (runs in a worker process)
+
+    Kept in this module so that worker processes only import numpy, pandas
+    and pyarrow. The file is memory-mapped and only the requested column is
+    read, so the workers share the page cache instead of each receiving a
+    pickled copy of the DataFrame.
+    """
+    table = feather.read_table(columnar_path, columns=[column], memory_map=True)
+    return profile_column(table.to_pandas(), column)
@@ -0,0 +1,266 @@
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+from lida.utils import clean_column_name
+
+from utils.compaction import plain_frame
+from utils.dataset_store import Dataset
+
+# bump whenever a rule changes, cached findings of other versions are recomputed
+QUALITY_VERSION = 2
+
+# number of findings passed on to the prep guide prompt
+TOP_ISSUES = 8
+MAX_EXAMPLES = 3
+
+# a text column is "mostly numbers" or "mostly dates" above this share of parsed values
+PARSED_MIN_SHARE = 0.5
+# values beyond this many interquartile ranges from the quartiles are outliers
+OUTLIER_IQR_FACTOR = 3.0
+# a column with at least this share of non-negative values should have no negative ones
+NON_NEGATIVE_MIN_SHARE = 0.95
+# text columns with at least this share of numbers are also checked for outliers
+NUMERIC_CHECK_MIN_SHARE = 0.9
+# text columns with at most this many distinct values are treated as categories
+MAX_CATEGORIES = 100
+DELIMITERS = ("\t", ";", "|")
+DATE_NAME_HINTS = ("date", "time", "day", "timestamp")
+
+# how much a finding matters, multiplied by how much of the column it affects
+RULE_WEIGHTS = {
+    "wrong_delimiter": 1.0,
+    "mixed_types": 0.9,
+    "unparseable_dates": 0.8,
+    "duplicate_rows": 0.7,
+    "out_of_range": 0.7,
+    "inconsistent_categories": 0.6,
+    "missing_values": 0.6,
+    "outliers": 0.5,
+}
+
+# (dataset hash, version) -> findings, shared by all pages and sessions
+_findings = {}
+_lock = threading.Lock()
+
+
+def _issue(rule: str, column, count: int, total: int, message: str, examples=()) -> dict:
+    share = count / total if total else 0.0
+    return {
+        "rule": rule,
+        "column": column,
+        "count": int(count),
+        "share": round(float(share), 4),
+        # even a single bad value is worth reporting, so the share only scales part of the score
+        "score": round(RULE_WEIGHTS[rule] * (0.25 + 0.75 * share), 4),
+        "message": message,
+        "examples": [str(example)[:60] for example in list(examples)[:MAX_EXAMPLES]],
+    }
+
+
+def _is_text(series: pd.Series) -> bool:
+    dtype = series.dtype
+    return pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)
+
+
+def _parse_dates(text: pd.Series) -> pd.Series:
+    parsed = pd.to_datetime(text, errors="coerce", format="ISO8601")
+    if parsed.notna().mean() < PARSED_MIN_SHARE:
+        with warnings.catch_warnings():
+            # "could not infer format" is expected for non-date columns
+            warnings.simplefilter("ignore")
+            parsed = pd.to_datetime(text, errors="coerce")
+    return parsed
+
+
+def _extremes(array: np.ndarray, center: float) -> list:
+    """ The distinct values furthest from `center`, formatted """
+    values = np.unique(array)
+    values = values[np.argsort(-np.abs(values - center), kind="stable")]
+    return [f"{value:.6g}" for value in values[:MAX_EXAMPLES]]
+
+
+def _numeric_issues(column, values: pd.Series, total: int) -> list:
+    issues = []
+    valid = values.dropna()
+    if len(valid) < 8:
+        return issues
+    array = valid.to_numpy(dtype="float64")
+
+    negative = array < 0
+    negative_count = int(negative.sum())
+    if 0 < negative_count <= (1 - NON_NEGATIVE_MIN_SHARE) * len(array):
+        issues.append(_issue(
+            "out_of_range", column, negative_count, total,
+            f"{negative_count} negative values in a column that is otherwise non-negative",
+            _extremes(array[negative], 0.0)))
+
+    q1, q3 = np.percentile(array, [25, 75])
+    iqr = q3 - q1
+    if iqr > 0:
+        low, high = q1 - OUTLIER_IQR_FACTOR * iqr, q3 + OUTLIER_IQR_FACTOR * iqr
+        outside = (array < low) | (array > high)
+        outlier_count = int(outside.sum())
+        if outlier_count:
+            issues.append(_issue(
+                "outliers", column, outlier_count, total,
+                f"{outlier_count} values outside [{low:.4g}, {high:.4g}] "
+                f"({OUTLIER_IQR_FACTOR:g} interquartile ranges beyond the quartiles)",
+                _extremes(array[outside], float(np.median(array)))))
+    return issues
+
+
+def _text_issues(column, series: pd.Series, total: int) -> tuple:
+    """ Findings of a text column, and its values as numbers when it mostly holds numbers """
+    issues = []
+    text = series.dropna().astype(str).str.strip()
+    text = text[text != ""]
+    if text.empty:
+        return issues, None
+
+    for delimiter in DELIMITERS:
+        split_count = int(text.str.contains(delimiter, regex=False).sum())
+        if split_count >= PARSED_MIN_SHARE * len(text):
+            issues.append(_issue(
+                "wrong_delimiter", column, split_count, total,
+                f"{split_count} values contain {delimiter!r}, the file probably uses another delimiter "
+                "than the header or mixes delimiters",
+                text[text.str.contains(delimiter, regex=False)].unique()))
+            return issues, None
+
+    numbers = pd.to_numeric(text, errors="coerce")
+    numeric_share = numbers.notna().mean()
+    if numeric_share >= PARSED_MIN_SHARE:
+        bad = text[numbers.isna()]
+        if len(bad):
+            issues.append(_issue(
+                "mixed_types", column, len(bad), total,
+                f"{len(bad)} non-numeric values in a column of numbers", bad.unique()))
+        if numeric_share < NUMERIC_CHECK_MIN_SHARE:
+            return issues, None
+        return issues, pd.to_numeric(series, errors="coerce")
+
+    name_hint = any(hint in str(column).lower() for hint in DATE_NAME_HINTS)
+    dates = _parse_dates(text)
+    if name_hint or dates.notna().mean() >= PARSED_MIN_SHARE:
+        bad = text[dates.isna()]
+        if len(bad) and len(bad) < len(text):
+            issues.append(_issue(
+                "unparseable_dates", column, len(bad), total,
+                f"{len(bad)} values that cannot be parsed as dates", bad.unique()))
+        return issues, None
+
+    if text.nunique() <= MAX_CATEGORIES:
+        # spellings that only differ in case, spacing or punctuation
+        keys = text.str.lower().str.replace(r"[\W_]+", "", regex=True)
+        spellings = text.groupby(keys.to_numpy()).unique()
+        variants = spellings[spellings.map(len) > 1]
+        if len(variants):
+            affected = int(keys.isin(variants.index).sum())
+            examples = [" / ".join(map(str, values)) for values in variants]
+            issues.append(_issue(
+                "inconsistent_categories", column, affected, total,
+                f"{len(variants)} categories are spelled in several ways", examples))
+    return issues, None
+
+
+def check_quality(data: pd.DataFrame) -> list:
+    """ Run the data quality rules over a frame
+
+    Every rule is a vectorized pandas/NumPy check: missing values (including
+    blank strings), duplicate rows, values containing another delimiter, text
+    in numeric columns, negative values and interquartile-range outliers,
+    unparseable dates and category spellings that only differ in case or
+    punctuation. Each column is visited once.
+
+    Args:
+    ----
+        data: pd.DataFrame
+            The data to check
+
+    Returns:
+    -------
+        list: The findings, highest score first; each one has the rule, the
+        column (None for the whole table), the affected count and share, a
+        score, a message and a few examples
+    """
+    total = len(data)
+    issues = []
+    if total == 0:
+        return issues
+
+    try:
+        hashes = pd.util.hash_pandas_object(data, index=False)
+    except TypeError:
+        # unhashable cells, e.g. lists parsed from JSON
+        hashes = pd.util.hash_pandas_object(data.astype(str), index=False)
+    duplicate_count = int(hashes.duplicated().sum())
+    if duplicate_count:
+        issues.append(_issue(
+            "duplicate_rows", None, duplicate_count, total,
+            f"{duplicate_count} rows are exact copies of an earlier row"))
+
+    for column in data.columns:
+        series = data[column]
+        missing = series.isna()
+        if _is_text(series):
+            missing |= series.astype(str).str.strip().eq("") & series.notna()
+        missing_count = int(missing.sum())
+        if missing_count:
+            issues.append(_issue(
+                "missing_values", column, missing_count, total,
+                f"{missing_count} missing values ({missing_count / total:.1%})"))
+
+        numbers = None
+        if pd.api.types.is_bool_dtype(series.dtype):
+            continue
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            numbers = series
+        elif _is_text(series):
+            text_issues, numbers = _text_issues(column, series, total)
+            issues += text_issues
+        if numbers is not None:
+            issues += _numeric_issues(column, numbers, total)
+
+    return sorted(issues, key=lambda issue: (-issue["score"], issue["rule"], str(issue["column"])))
+
+
+def quality_issues(dataset: Dataset) -> list:
+    """ The findings of `check_quality` for a dataset, computed once per content hash
+
+    Column names are cleaned the way LIDA cleans them, so that they match the
+    fields of the summary.
+    """
+    key = (dataset.digest, QUALITY_VERSION)
+    with _lock:
+        if key in _findings:
+            return _findings[key]
+
+    # the rules read text columns, compacted ones are categoricals
+    issues = check_quality(plain_frame(dataset.load()))
+    for issue in issues:
+        if issue["column"] is not None:
+            issue["column"] = clean_column_name(str(issue["column"]))
+
+    with _lock:
+        _findings[key] = issues
+    return issues
+
+
+def top_issues(issues: list, field_names: list = None, k: int = TOP_ISSUES) -> list:
+    """ The k highest ranked findings, only about `field_names` (and the whole table) if given """
+    if field_names is not None:
+        fields = set(field_names)
+        issues = [issue for issue in issues if issue["column"] is None or issue["column"] in fields]
+    return issues[:k]
+
+
+def describe_issues(issues: list) -> str:
+    """ One terse line per finding, for prompts """
+    lines = []
+    for issue in issues:
+        where = issue["column"] if issue["column"] is not None else "all rows"
+        examples = f" e.g. {', '.join(repr(example) for example in issue['examples'])}" if issue["examples"] else ""
+        lines.append(f"- {issue['rule']} in {where}: {issue['message']}{examples}")
+    return "\n".join(lines)
@@ -0,0 +1,180 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from utils.dataset_store import DATA_DIR
+
+RASTERS_DIR = os.path.join(DATA_DIR, "rasters")
+# disk space of the stored rasters, the least recently used are deleted beyond it
+MAX_RASTER_BYTES = 512 << 20
+# rasters also kept in memory, so reruns don't even read the disk
+MAX_MEMORY_BYTES = 64 << 20
+THUMBNAIL_SIZE = (320, 240)
+
+# one store per process
+_store = None
+_store_lock = threading.Lock()
+
+
+def raster_key(code: str, digest: str, library: str) -> str:
+    """ Hash of what a rendered chart depends on: its code, the dataset content and the library """
+    parts = json.dumps([code, digest, library])
+    return hashlib.sha256(parts.encode("utf-8")).hexdigest()
+
+
+class RasterStore:
+    """ Content-addressed store of rendered charts (PNG bytes)
+
+    Rasters are files under `data/rasters/` named by `raster_key`, the least
+    recently used ones being deleted once they take more than `max_bytes`.
+    Recently used rasters are also kept in memory. Thumbnails are made once
+    per raster and stored next to it.
+
+    Args:
+    ----
+        directory: str
+            Where the rasters are stored
+        max_bytes: int
+            The disk space of the stored rasters
+        max_memory_bytes: int
+            The size of the in-memory copies
+    """
+
+    def __init__(self, directory: str = RASTERS_DIR, max_bytes: int = MAX_RASTER_BYTES,
+                 max_memory_bytes: int = MAX_MEMORY_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.lock = threading.Lock()
+        # file name -> size, least recently used first
+        self.files = OrderedDict()
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        entries = [entry for entry in os.scandir(directory) if entry.name.endswith(".png")]
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            self.files[entry.name] = entry.stat().st_size
+        self.disk_bytes = sum(self.files.values())
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _remember(self, name: str, png: bytes) -> None:
+        if name in self.memory:
+            self.memory_bytes -= len(self.memory.pop(name))
+        self.memory[name] = png
+        self.memory_bytes += len(png)
+        while self.memory_bytes > self.max_memory_bytes and len(self.memory) > 1:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def _read(self, name: str) -> bytes:
+        with self.lock:
+            if name in self.memory:
+                self.memory.move_to_end(name)
+                if name in self.files:
+                    self.files.move_to_end(name)
+                return self.memory[name]
+            if name not in self.files:
+                return None
+            self.files.move_to_end(name)
+        try:
+            with open(self._path(name), "rb") as file:
+                png = file.read()
+            # the file's mtime orders the LRU of the next process
+            os.utime(self._path(name))
+        except FileNotFoundError:
+            # deleted by another process sharing the directory
+            with self.lock:
+                self.disk_bytes -= self.files.pop(name, 0)
+            return None
+        with self.lock:
+            self._remember(name, png)
+        return png
+
+    def _write(self, name: str, png: bytes) -> None:
+        path = self._path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(png)
+        os.replace(tmp_path, path)
+
+        evicted = []
+        with self.lock:
+            self.disk_bytes += len(png) - self.files.pop(name, 0)
+            self.files[name] = len(png)
+            self._remember(name, png)
+            while self.disk_bytes > self.max_bytes and len(self.files) > 1:
+                old_name, size = self.files.popitem(last=False)
+                self.disk_bytes -= size
+                self.memory_bytes -= len(self.memory.pop(old_name, b""))
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(self._path(old_name))
+            except FileNotFoundError:
+                pass
+
+    def get(self, key: str) -> bytes:
+        """ The PNG bytes of a raster, or None """
+        return self._read(f"{key}.png")
+
+    def put(self, key: str, png: bytes) -> None:
+        self._write(f"{key}.png", png)
+
+    def thumbnail(self, key: str) -> bytes:
+        """ A PNG at most `THUMBNAIL_SIZE` of the raster, or None if the raster is not stored """
+        name = f"{key}.thumb.png"
+        thumbnail = self._read(name)
+        if thumbnail is not None:
+            return thumbnail
+        png = self.get(key)
+        if png is None:
+            return None
+
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(png))
+        image.thumbnail(THUMBNAIL_SIZE)
+        buf = io.BytesIO()
+        image.save(buf, format="PNG", optimize=True)
+        thumbnail = buf.getvalue()
+        self._write(name, thumbnail)
+        return thumbnail
+
+
+def raster_store() -> RasterStore:
+    """ Get the process-wide raster store """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RasterStore()
+        return _store
+
+
+def chart_png(chart, digest: str) -> bytes:
+    """ The PNG bytes of a rendered chart, from the store when it is there
+
+    Args:
+    ----
+        chart: ChartExecutorResponse
+            The rendered chart
+        digest: str
+            The content hash of the dataset the chart was rendered from
+
+    Returns:
+    -------
+        bytes: The PNG, None if the chart has no raster
+    """
+    key = raster_key(chart.code, digest, chart.library)
+    store = raster_store()
+    png = store.get(key)
+    if png is None and chart.raster:
+        png = base64.b64decode(chart.raster)
+        store.put(key, png)
+    return png
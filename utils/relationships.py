@@ -0,0 +1,280 @@
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+from lida.utils import clean_column_name
+
+from utils.dataset_store import DATA_DIR, Dataset
+from utils.instrumentation import instrumented, note, note_cache
+from utils.profiler import is_numerical_series
+
+RELATIONSHIPS_DIR = os.path.join(DATA_DIR, "relationships")
+# bump whenever the computed matrices change, cached ones of other versions are recomputed
+RELATIONSHIPS_VERSION = 1
+# rows the matrices are computed on by default, None uses every row
+SAMPLE_ROWS = 50_000
+# numeric columns per tile of the correlation matrix
+CORRELATION_TILE = 64
+# categorical columns per tile of the contingency tables
+CROSSTAB_TILE = 8
+# rows per block of the contingency tables, a block holds rows x tile**2 pair codes
+CROSSTAB_ROWS = 100_000
+# columns with 2 to this many distinct values get cross-tabs, numeric ones such as Pclass included
+MAX_LEVELS = 30
+# correlations over fewer complete rows are left out
+MIN_PAIR_ROWS = 3
+
+# (dataset hash, sample rows) -> relationships, shared by all pages and sessions
+_results = {}
+_results_lock = threading.Lock()
+
+
+def correlation_matrix(data: pd.DataFrame, tile: int = CORRELATION_TILE) -> pd.DataFrame:
+    """ Pearson correlations of the numeric columns, computed a tile of columns at a time
+
+    Each pair uses the rows where both columns are present, like
+    `DataFrame.corr()`. All the pairs of two tiles come from six matrix
+    products of the (mean-centred, zero-filled) values and presence masks,
+    so memory is bounded by rows x tile instead of one copy per pair.
+
+    Args:
+    ----
+        data: pd.DataFrame
+            The numeric columns
+        tile: int
+            The number of columns per tile
+
+    Returns:
+    -------
+        pd.DataFrame: The symmetric correlation matrix, NaN for constant or too sparse pairs
+    """
+    columns = data.columns.tolist()
+    values = data.to_numpy(dtype="float64", na_value=np.nan)
+    present = ~np.isnan(values)
+    counts = present.sum(axis=0)
+    # centred by the column means, the sums below then stay small
+    means = np.divide(np.where(present, values, 0.0).sum(axis=0), counts, out=np.zeros(len(columns)),
+                      where=counts > 0)
+    centred = np.where(present, values - means, 0.0)
+    squares = centred ** 2
+    mask = present.astype("float64")
+
+    matrix = np.full((len(columns), len(columns)), np.nan)
+    for start_a in range(0, len(columns), tile):
+        a = slice(start_a, start_a + tile)
+        for start_b in range(start_a, len(columns), tile):
+            b = slice(start_b, start_b + tile)
+            rows = mask[:, a].T @ mask[:, b]
+            sum_a = centred[:, a].T @ mask[:, b]
+            sum_b = mask[:, a].T @ centred[:, b]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                covariance = centred[:, a].T @ centred[:, b] - sum_a * sum_b / rows
+                variance_a = squares[:, a].T @ mask[:, b] - sum_a ** 2 / rows
+                variance_b = mask[:, a].T @ squares[:, b] - sum_b ** 2 / rows
+                block = covariance / np.sqrt(variance_a * variance_b)
+            block[rows < MIN_PAIR_ROWS] = np.nan
+            matrix[a, b] = block
+            matrix[b, a] = block.T
+    np.clip(matrix, -1.0, 1.0, out=matrix)
+    return pd.DataFrame(matrix, index=columns, columns=columns)
+
+
+def _codes(series: pd.Series) -> tuple:
+    codes, levels = pd.factorize(series, sort=True, use_na_sentinel=True)
+    return codes.astype("int64"), levels.tolist()
+
+
+def contingency_tables(data: pd.DataFrame, tile: int = CROSSTAB_TILE, block_rows: int = CROSSTAB_ROWS) -> tuple:
+    """ The cross-tabs of every pair of low-cardinality columns and their Cramér's V
+
+    The columns are coded as integers; for a pair of tiles, every row of a
+    block gets one code per column pair and a single `np.bincount` counts all
+    their cross-tabs, summed over the blocks. Memory is bounded by
+    block_rows x tile**2 whatever the number of rows. Rows missing either
+    value are left out of the pair.
+
+    Args:
+    ----
+        data: pd.DataFrame
+            The columns, each with at most `MAX_LEVELS` distinct values
+        tile: int
+            The number of columns per tile
+        block_rows: int
+            The number of rows per block
+
+    Returns:
+    -------
+        tuple: The symmetric Cramér's V matrix (pd.DataFrame) and a dict
+        (column, column) -> cross-tab (pd.DataFrame) for the pairs in column order
+    """
+    columns = data.columns.tolist()
+    coded = [_codes(data[column]) for column in columns]
+    width = max((len(levels) for _, levels in coded), default=1)
+    association = np.full((len(columns), len(columns)), np.nan)
+    crosstabs = {}
+    for start_a in range(0, len(columns), tile):
+        tile_a = [codes for codes, _ in coded[start_a:start_a + tile]]
+        for start_b in range(start_a, len(columns), tile):
+            tile_b = [codes for codes, _ in coded[start_b:start_b + tile]]
+            size_a, size_b = len(tile_a), len(tile_b)
+            pair = np.arange(size_a * size_b).reshape(size_a, size_b) * width * width
+            counts = np.zeros(size_a * size_b * width * width, dtype="int64")
+            for start in range(0, len(data), block_rows):
+                rows = slice(start, start + block_rows)
+                codes_a = np.stack([codes[rows] for codes in tile_a], axis=1)
+                codes_b = np.stack([codes[rows] for codes in tile_b], axis=1)
+                cells = pair + codes_a[:, :, None] * width + codes_b[:, None, :]
+                present = (codes_a[:, :, None] >= 0) & (codes_b[:, None, :] >= 0)
+                counts += np.bincount(cells[present], minlength=counts.size)
+            counts = counts.reshape(size_a, size_b, width, width).astype("float64")
+
+            # chi-squared of every table of the tile at once
+            total = counts.sum(axis=(2, 3))
+            row_sums, column_sums = counts.sum(axis=3), counts.sum(axis=2)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                expected = row_sums[..., :, None] * column_sums[..., None, :] / total[..., None, None]
+                chi2 = np.where(expected > 0, (counts - expected) ** 2 / expected, 0.0).sum(axis=(2, 3))
+                dof = np.minimum((row_sums > 0).sum(axis=2), (column_sums > 0).sum(axis=2)) - 1
+                block = np.sqrt(chi2 / (total * dof))
+            block[(dof < 1) | (total == 0)] = np.nan
+            association[start_a:start_a + size_a, start_b:start_b + size_b] = block
+            association[start_b:start_b + size_b, start_a:start_a + size_a] = block.T
+
+            for i in range(size_a):
+                for j in range(size_b):
+                    index_a, index_b = start_a + i, start_b + j
+                    if index_a >= index_b:
+                        continue
+                    levels_a, levels_b = coded[index_a][1], coded[index_b][1]
+                    crosstabs[(columns[index_a], columns[index_b])] = pd.DataFrame(
+                        counts[i, j, :len(levels_a), :len(levels_b)].astype("int64"), index=levels_a,
+                        columns=levels_b)
+    return pd.DataFrame(np.clip(association, 0.0, 1.0), index=columns, columns=columns), crosstabs
+
+
+def _relationships_path(digest: str, sample_rows: int) -> str:
+    return os.path.join(RELATIONSHIPS_DIR, f"{digest}-{sample_rows or 'all'}.pkl")
+
+
+def _hashable(data: pd.DataFrame) -> pd.DataFrame:
+    columns = {}
+    for column in data.columns:
+        try:
+            data[column].nunique()
+        except TypeError:
+            # unhashable cells, e.g. lists parsed from JSON, are compared as text
+            columns[column] = data[column].astype(str)
+    return data.assign(**columns) if columns else data
+
+
+def compute_relationships(data: pd.DataFrame, sample_rows: int = SAMPLE_ROWS) -> dict:
+    """ Correlations of the numeric columns and cross-tabs of the low-cardinality ones
+
+    Args:
+    ----
+        data: pd.DataFrame
+            The dataset
+        sample_rows: int
+            Compute on a random sample of this many rows, None for every row
+
+    Returns:
+    -------
+        dict: "rows" (used) and "total_rows", the "correlation" and "association"
+        (Cramér's V) matrices as DataFrames and the "crosstabs" of the column pairs
+    """
+    total_rows = len(data)
+    if sample_rows and total_rows > sample_rows:
+        data = data.sample(sample_rows, random_state=42)
+    data = _hashable(data)
+    numeric = [column for column in data.columns if is_numerical_series(data[column])]
+    # numbers are converted once, nullable and narrow dtypes included
+    correlation = correlation_matrix(data[numeric].apply(pd.to_numeric, errors="coerce"))
+    unique = data.nunique()
+    categorical = [column for column in data.columns if 2 <= unique[column] <= MAX_LEVELS]
+    association, crosstabs = contingency_tables(data[categorical])
+    return {
+        "version": RELATIONSHIPS_VERSION,
+        "rows": len(data),
+        "total_rows": total_rows,
+        "correlation": correlation,
+        "association": association,
+        "crosstabs": crosstabs,
+    }
+
+
+@instrumented("relationships")
+def relationships(dataset: Dataset, sample_rows: int = SAMPLE_ROWS) -> dict:
+    """ The relationships of the dataset's columns, see `compute_relationships`
+
+    Cached in memory and under `data/relationships/` by dataset hash and
+    sample size, so reruns and later sessions don't compute them again.
+    """
+    key = (dataset.digest, sample_rows)
+    with _results_lock:
+        if key in _results:
+            note_cache(hit=True)
+            return _results[key]
+
+    path = _relationships_path(*key)
+    result = None
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            result = pickle.load(file)
+        if result.get("version") != RELATIONSHIPS_VERSION:
+            result = None
+    note_cache(hit=result is not None)
+    if result is None:
+        data = dataset.load()
+        note(bytes=int(data.memory_usage(index=False, deep=True).sum()))
+        result = compute_relationships(data, sample_rows)
+        os.makedirs(RELATIONSHIPS_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(result, file)
+        os.replace(tmp_path, path)
+
+    with _results_lock:
+        _results[key] = result
+    return result
+
+
+def _pairs(matrix: pd.DataFrame, measure: str) -> pd.DataFrame:
+    upper = np.triu(np.ones(matrix.shape, dtype=bool), k=1)
+    values = matrix.where(upper).stack().dropna()
+    return pd.DataFrame({
+        "column_a": values.index.get_level_values(0),
+        "column_b": values.index.get_level_values(1),
+        "measure": measure,
+        "value": values.to_numpy(),
+    })
+
+
+def top_pairs(result: dict, k: int = 10) -> list:
+    """ The k strongest column pairs, by absolute correlation or Cramér's V
+
+    A pair in both matrices (e.g. two numeric columns with few values) is
+    listed once, with its stronger measure.
+
+    Returns:
+    -------
+        list: Dicts with the two columns, the measure ("correlation" or
+        "cramers_v") and its value, strongest first
+    """
+    pairs = pd.concat([_pairs(result["correlation"], "correlation"),
+                       _pairs(result["association"], "cramers_v")], ignore_index=True)
+    if pairs.empty:
+        return []
+    pairs["strength"] = pairs["value"].abs()
+    pairs = pairs.sort_values("strength", ascending=False, kind="stable")
+    pairs = pairs.drop_duplicates(["column_a", "column_b"]).head(k)
+    return [{"columns": [row.column_a, row.column_b], "measure": row.measure, "value": round(float(row.value), 3)}
+            for row in pairs.itertuples()]
+
+
+def with_relationships(summary: dict, pairs: list) -> dict:
+    """ A copy of the summary with the column pairs under "relationships", named like its fields """
+    relationships = [{**pair, "columns": [clean_column_name(column) for column in pair["columns"]]}
+                     for pair in pairs]
+    return {**summary, "relationships": relationships}
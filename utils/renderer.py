@@ -0,0 +1,373 @@
+import base64
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from multiprocessing.connection import wait
+
+from lida.datamodel import ChartExecutorResponse
+
+from utils.dataset_store import Dataset
+from utils.instrumentation import instrumented, note, note_cache
+from utils.raster_store import raster_key, raster_store
+
+logger = logging.getLogger("lida")
+
+RENDER_TIMEOUT = 30.0
+# time a new worker may take to import the plotting libraries, not counted in job timeouts
+WORKER_START_TIMEOUT = 120.0
+# address space limit of a worker, a snippet going over it fails with MemoryError
+RENDER_MEMORY_LIMIT = 4 << 30
+# workers are replaced after this many jobs, so leaks in plotting libraries can't pile up
+MAX_JOBS_PER_WORKER = 50
+# datasets kept loaded in each worker
+WORKER_CACHED_FRAMES = 2
+# seconds between checks that the pool is still open while waiting for a worker other sessions hold
+IDLE_POLL_INTERVAL = 1.0
+RASTER_LIBRARIES = ("matplotlib", "seaborn", "plotly")
+
+# one pool per process, recreated when the worker count changes
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def default_render_workers() -> int:
+    return min(os.cpu_count() or 1, 4)
+
+
+def _limit_memory(memory_limit: int) -> None:
+    try:
+        import resource
+    except ImportError:
+        # not available on Windows, the worker still runs, only without a limit
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        memory_limit = min(memory_limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+
+
+def _render_png(code: str, data, library: str, plt, pio) -> bytes:
+    from lida.components.executor import get_globals_dict
+
+    ex_locals = get_globals_dict(code, data)
+    exec(code, ex_locals)
+    chart = ex_locals["chart"]
+    if library == "plotly":
+        return pio.to_image(chart, "png")
+
+    # same styling as lida's ChartExecutor
+    buf = io.BytesIO()
+    plt.box(False)
+    plt.grid(color="lightgray", linestyle="dashed", zorder=-10)
+    plt.savefig(buf, format="png", dpi=100, pad_inches=0.2)
+    return buf.getvalue()
+
+
+def _worker_main(conn, memory_limit: int) -> None:
+    """ Render loop of a worker process
+
+    Once the plotting libraries are imported the worker sends "ready". Then
+    messages are ("load", path, digest) and ("render", path, digest, code,
+    library), and every message gets exactly one reply. Frames are cached by
+    path and content hash, so a file changed in place is loaded again, and a
+    version that is no longer on disk is an error rather than another
+    version's chart. matplotlib's settings are restored after every job.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import pandas  # noqa: F401
+    import plotly.io as pio
+    import seaborn  # noqa: F401
+    from lida.components.executor import get_globals_dict  # noqa: F401
+
+    from utils.dataset_store import lida_frame
+
+    default_rc = matplotlib.rcParams.copy()
+    frames = OrderedDict()
+
+    def frame(path: str, digest: str):
+        key = (path, digest)
+        if key not in frames:
+            dataset = Dataset(path)
+            if dataset.digest != digest:
+                # the chart would be stored under the hash the caller asked for
+                raise ValueError(f"{path} changed, the version to render is gone")
+            frames[key] = lida_frame(dataset)
+            while len(frames) > WORKER_CACHED_FRAMES:
+                frames.popitem(last=False)
+        frames.move_to_end(key)
+        # pandas copy-on-write: snippets modifying `data` don't change the cached frame
+        return frames[key].copy(deep=False)
+
+    _limit_memory(memory_limit)
+    conn.send(("ready", None))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        kind, path, digest = message[:3]
+        try:
+            data = frame(path, digest)
+            if kind == "load":
+                conn.send(("ok", None))
+                continue
+            _, _, _, code, library = message
+            conn.send(("ok", _render_png(code, data, library, plt, pio)))
+        except BaseException as error:
+            conn.send(("error", {"message": str(error), "traceback": traceback.format_exc()}))
+        finally:
+            plt.close("all")
+            matplotlib.rcParams.update(default_rc)
+
+
+def _pool_error(message: str) -> tuple:
+    # the snippet may well render on another try, unlike one that raised
+    return "error", {"message": message, "traceback": "", "transient": True}
+
+
+class RenderWorker:
+    """ A worker process and its end of the pipe """
+
+    def __init__(self, context, memory_limit: int) -> None:
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+        self.ready = False
+
+    def wait_ready(self, timeout: float) -> bool:
+        """ Wait until the worker has imported its libraries """
+        if not self.ready:
+            try:
+                self.ready = self.conn.poll(timeout) and self.conn.recv()[0] == "ready"
+            except (EOFError, OSError):
+                self.ready = False
+        return self.ready
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class RenderPool:
+    """ Pool of pre-warmed processes executing generated visualization code
+
+    Charts already in the raster store are not rendered again. Each worker
+    imports pandas, matplotlib, seaborn and plotly when it starts and keeps
+    the last datasets it used loaded, so a job only pays for the snippet
+    itself. Jobs of one call run in parallel on the idle workers, each with
+    its own timeout; a worker that times out or crashes is killed and
+    replaced, and workers are recycled after `max_jobs` jobs. Several
+    sessions can render at the same time, they share the workers.
+
+    Args:
+    ----
+        workers: int
+            The number of worker processes
+        memory_limit: int
+            The address space limit of each worker in bytes
+        max_jobs: int
+            The number of jobs after which a worker is replaced
+    """
+
+    def __init__(self, workers: int, memory_limit: int = RENDER_MEMORY_LIMIT,
+                 max_jobs: int = MAX_JOBS_PER_WORKER) -> None:
+        # spawn: the Streamlit server is multi-threaded, forking it is unsafe
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = workers
+        self.memory_limit = memory_limit
+        self.max_jobs = max_jobs
+        self.closed = False
+        self.warmed = set()
+        self.warm_lock = threading.Lock()
+        self.idle = queue.Queue()
+        for _ in range(workers):
+            self.idle.put(self._new_worker())
+
+    def _new_worker(self) -> RenderWorker:
+        return RenderWorker(self.context, self.memory_limit)
+
+    def _release(self, worker: RenderWorker, healthy: bool) -> None:
+        worker.jobs += 1
+        if self.closed:
+            worker.kill()
+            return
+        if not healthy or worker.jobs >= self.max_jobs or not worker.process.is_alive():
+            worker.kill()
+            worker = self._new_worker()
+        self.idle.put(worker)
+
+    def _run(self, messages: list, timeout: float) -> list:
+        """ Send the messages to idle workers, at most one per worker at a time
+
+        With every worker busy with other sessions' jobs, the messages wait for
+        one to come back however long that takes; `timeout` only bounds each job.
+
+        Returns:
+        -------
+            list: ("ok", payload) or ("error", error dict) for each message, the
+            error dict has "transient" set when the pool failed rather than the snippet
+        """
+        pending = list(enumerate(messages))
+        results = [None] * len(messages)
+        busy = {}
+        while pending or busy:
+            while pending:
+                if self.closed:
+                    # replaced by a pool of another size, no worker comes back to this one
+                    for index, _ in pending:
+                        results[index] = _pool_error("The render pool was shut down")
+                    pending = []
+                    break
+                try:
+                    # wait for a worker only if none of ours is running, for as long as other
+                    # sessions hold them: their jobs finish or time out, and the workers come back
+                    worker = self.idle.get(block=not busy, timeout=IDLE_POLL_INTERVAL)
+                except queue.Empty:
+                    if busy:
+                        break
+                    continue
+                index, message = pending.pop(0)
+                if not worker.wait_ready(WORKER_START_TIMEOUT):
+                    results[index] = _pool_error("The render worker could not start")
+                    self._release(worker, healthy=False)
+                    continue
+                worker.conn.send(message)
+                busy[worker.conn] = (worker, index, time.monotonic() + timeout)
+            if not busy:
+                # the remaining workers could not start
+                continue
+
+            next_deadline = min(deadline for _, _, deadline in busy.values())
+            for conn in wait(list(busy), timeout=max(next_deadline - time.monotonic(), 0)):
+                worker, index, _ = busy.pop(conn)
+                try:
+                    results[index] = conn.recv()
+                    self._release(worker, healthy=True)
+                except (EOFError, OSError):
+                    # the process died, e.g. killed by the OS
+                    results[index] = _pool_error("The render worker crashed")
+                    self._release(worker, healthy=False)
+
+            now = time.monotonic()
+            for conn, (worker, index, deadline) in list(busy.items()):
+                if now >= deadline:
+                    del busy[conn]
+                    results[index] = _pool_error(f"Rendering did not finish within {timeout:g}s")
+                    self._release(worker, healthy=False)
+        return results
+
+    def warm(self, dataset: Dataset, timeout: float = RENDER_TIMEOUT) -> None:
+        """ Load the dataset in the idle workers ahead of the first render """
+        if not os.path.exists(dataset.columnar_path):
+            # workers memory-map the columnar copy instead of parsing the source
+            dataset.load()
+        self._run([("load", dataset.path, dataset.digest)] * self.idle.qsize(), timeout)
+
+    def warm_async(self, dataset: Dataset) -> None:
+        """ Warm the workers for a dataset in the background, once per dataset version """
+        key = (dataset.path, dataset.digest)
+        with self.warm_lock:
+            if key in self.warmed:
+                return
+            self.warmed.add(key)
+        threading.Thread(target=self._warm_quietly, args=(dataset,), daemon=True, name="render-warm").start()
+
+    def _warm_quietly(self, dataset: Dataset) -> None:
+        try:
+            self.warm(dataset)
+        except Exception as error:
+            # the first render loads the dataset instead
+            logger.info(f"Could not warm the render workers: {error}")
+
+    @instrumented("render")
+    def render(self, code_specs: list, dataset: Dataset, library: str = "seaborn",
+               timeout: float = RENDER_TIMEOUT, return_error: bool = False) -> list:
+        """ Execute generated visualization code like `lida.execute`, in parallel
+
+        Args:
+        ----
+            code_specs: list
+                The generated code snippets
+            dataset: Dataset
+                The dataset handle, workers use the same frame as `lida.data`
+            library: str
+                "matplotlib", "seaborn" or "plotly"
+            timeout: float
+                The timeout of each snippet in seconds
+            return_error: bool
+                Whether failed snippets are returned (with status False) or dropped; the
+                `error` of one that timed out or whose worker failed has "transient" set
+
+        Returns:
+        -------
+            list: ChartExecutorResponse objects, in the order of `code_specs`
+        """
+        from lida.components.executor import preprocess_code
+
+        if library not in RASTER_LIBRARIES:
+            raise ValueError(f"Unsupported library {library}, the renderer supports {', '.join(RASTER_LIBRARIES)}")
+        codes = [preprocess_code(code) for code in code_specs]
+        digest = dataset.digest
+        keys = [raster_key(code, digest, library) for code in codes]
+
+        # charts rendered before, by any session or an earlier process, are not executed again
+        store = raster_store()
+        results = [("ok", png) if png is not None else None for png in map(store.get, keys)]
+        missing = [index for index, result in enumerate(results) if result is None]
+        note_cache(hit=True, count=len(results) - len(missing))
+        note_cache(hit=False, count=len(missing))
+        rendered = self._run([("render", dataset.path, digest, codes[index], library) for index in missing],
+                             timeout)
+        for index, result in zip(missing, rendered):
+            results[index] = result
+            if result[0] == "ok":
+                store.put(keys[index], result[1])
+                note(bytes=len(result[1]))
+
+        charts = []
+        for code, (status, payload) in zip(codes, results):
+            if status == "ok":
+                charts.append(ChartExecutorResponse(
+                    spec=None, status=True, raster=base64.b64encode(payload).decode("ascii"),
+                    code=code, library=library))
+            else:
+                logger.info(f"Could not render a visualization: {payload['message']}")
+                if return_error:
+                    charts.append(ChartExecutorResponse(
+                        spec=None, status=False, raster=None, code=code, library=library, error=payload))
+        return charts
+
+    def shutdown(self) -> None:
+        """ Stop the idle workers, busy ones stop when their job is done """
+        self.closed = True
+        while not self.idle.empty():
+            self.idle.get().kill()
+
+
+def render_pool(workers: int = None) -> RenderPool:
+    """ Get the shared render pool with `workers` processes """
+    global _pool
+    workers = workers or default_render_workers()
+    with _pool_lock:
+        if _pool is None or _pool.workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = RenderPool(workers)
+        return _pool
+
+
+def execute_charts(code_specs: list, dataset: Dataset, library: str = "seaborn",
+                  timeout: float = RENDER_TIMEOUT, workers: int = None) -> list:
+    """ Execute generated visualization code on the shared render pool """
+    return render_pool(workers).render(code_specs, dataset, library=library, timeout=timeout)
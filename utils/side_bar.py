@@ -1,7 +1,11 @@
 import streamlit as st
 import os
-import pandas as pd
 
+from utils.dataset_store import COMPRESSIONS, open_dataset
+from utils.ingest import UPLOAD_TYPES, ingest_upload
+from utils.instrumentation import instrumented, note
+
+@instrumented("side_bar")
 def side_bar(openai_key= None, temperature=0.0, use_cache=True, selected_dataset=None, selected_model="gpt-3.5-turbo-0125", selected_method="columns"):
     """
     Function to display the sidebar and get the user input for the OpenAI API key, dataset, and summarization method.
@@ -17,7 +21,8 @@ def side_bar(openai_key= None, temperature=0.0, use_cache=True, selected_dataset
 
     Returns:
     -------
-    None
+    tuple: The OpenAI API key, temperature, use_cache, a `Dataset` handle for the selected dataset (or None),
+    the selected model and the selected summarization method.
     """
     
     st.sidebar.write("## Setup")
@@ -77,21 +82,26 @@ def side_bar(openai_key= None, temperature=0.0, use_cache=True, selected_dataset
         upload_own_data = st.sidebar.checkbox("Upload your own data")
 
         if upload_own_data:
-            uploaded_file = st.sidebar.file_uploader("Choose a CSV or JSON file", type=["csv", "json"])
+            uploaded_file = st.sidebar.file_uploader(
+                "Choose a CSV, JSON, JSON Lines or Parquet file (optionally .gz or .zst)", type=UPLOAD_TYPES)
 
             if uploaded_file is not None:
-                # Get the original file name and extension
+                # Get the original file name without its extensions
                 file_name, file_extension = os.path.splitext(uploaded_file.name)
-
-                # Load the data depending on the file type
-                if file_extension.lower() == ".csv":
-                    data = pd.read_csv(uploaded_file)
-                elif file_extension.lower() == ".json":
-                    data = pd.read_json(uploaded_file)
-
-                # Save the data using the original file name in the data dir
-                uploaded_file_path = os.path.join("data", uploaded_file.name)
-                data.to_csv(uploaded_file_path, index=False)
+                if file_extension.lower() in COMPRESSIONS:
+                    file_name = os.path.splitext(file_name)[0]
+
+                # stored once per content, reruns with the same upload don't even hash it again
+                uploads = st.session_state.setdefault("uploads", {})
+                upload_key = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+                uploaded_file_path = uploads.get(upload_key)
+                if uploaded_file_path is None:
+                    note(bytes=uploaded_file.size)
+                    try:
+                        uploaded_file_path = ingest_upload(uploaded_file)
+                        uploads[upload_key] = uploaded_file_path
+                    except ValueError as error:
+                        st.sidebar.error(str(error))
 
                 selected_dataset = uploaded_file_path
 
@@ -134,5 +144,7 @@ def side_bar(openai_key= None, temperature=0.0, use_cache=True, selected_dataset
             st.sidebar.markdown(
                 f"<span> {selected_summary_method_description} </span>",
                 unsafe_allow_html=True)
-            
+
+        selected_dataset = open_dataset(selected_dataset)
+
     return openai_key, temperature, use_cache, selected_dataset, selected_model, selected_method
@@ -0,0 +1,224 @@
+import numpy as np
+import pandas as pd
+
+
+class Moments:
+    """ Count, mean, variance, min and max of a stream of numbers
+
+    Batches are folded in with Welford/Chan's parallel update, so two
+    `Moments` can be merged exactly.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values: np.ndarray) -> None:
+        if values.size == 0:
+            return
+        other = Moments()
+        other.count = values.size
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        self.merge(other)
+
+    def merge(self, other: "Moments") -> None:
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else np.nan
+
+
+class KLLSketch:
+    """ KLL quantile sketch
+
+    Keeps a stack of compactors; level `h` holds items of weight `2**h`. When
+    a level overflows it is sorted and every other item (random offset) is
+    promoted, so memory stays O(k log(n / k)).
+
+    Args:
+    ----
+        k: int
+            The size of the top compactor, the rank error is about 2.3 / k**0.97
+    """
+
+    def __init__(self, k: int = 200, seed: int = 42) -> None:
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def rank_error(self) -> float:
+        """ Normalized rank error at 99% confidence (empirical KLL bound) """
+        return 2.296 / self.k ** 0.9723
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, values: np.ndarray) -> None:
+        if values.size == 0:
+            return
+        self.count += values.size
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: "KLLSketch") -> None:
+        self.count += other.count
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+
+    def _compress(self) -> None:
+        # adding a level shrinks the capacity of the ones below, so sweep until nothing overflows
+        overflowing = True
+        while overflowing:
+            overflowing = False
+            for level in range(len(self.levels)):
+                items = self.levels[level]
+                if items.size <= self._capacity(level):
+                    continue
+                overflowing = True
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # an odd item out stays at this level so no weight is lost
+                keep = items[-1:] if items.size % 2 else items[:0]
+                paired = items[:items.size - keep.size]
+                promoted = paired[self._rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+    def _weighted(self) -> tuple:
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.size, 2 ** h, dtype="float64")
+                                  for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def quantiles(self, fractions: list) -> list:
+        items, cumulative = self._weighted()
+        if items.size == 0:
+            return [np.nan] * len(fractions)
+        targets = np.asarray(fractions) * cumulative[-1]
+        positions = np.minimum(np.searchsorted(cumulative, targets, side="left"), items.size - 1)
+        return items[positions].tolist()
+
+    def cdf(self, points: np.ndarray) -> np.ndarray:
+        """ Estimated fraction of the values strictly below each point """
+        items, cumulative = self._weighted()
+        if items.size == 0:
+            return np.zeros(len(points))
+        positions = np.searchsorted(items, points, side="left")
+        below = np.where(positions > 0, cumulative[np.maximum(positions - 1, 0)], 0.0)
+        return below / cumulative[-1]
+
+
+def _leading_zeros(words: np.ndarray) -> np.ndarray:
+    words = words.copy()
+    zeros = np.zeros(words.shape, dtype="int64")
+    for shift in (32, 16, 8, 4, 2, 1):
+        empty = (words >> np.uint64(64 - shift)) == 0
+        zeros[empty] += shift
+        words[empty] <<= np.uint64(shift)
+    zeros[words == 0] = 64
+    return zeros
+
+
+class HyperLogLog:
+    """ HyperLogLog distinct counter over `pd.util.hash_array` hashes
+
+    Args:
+    ----
+        p: int
+            2**p registers, the relative standard error is 1.04 / sqrt(2**p)
+    """
+
+    def __init__(self, p: int = 12) -> None:
+        self.p = p
+        self.registers = np.zeros(2 ** p, dtype="uint8")
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / np.sqrt(self.registers.size)
+
+    def update(self, values: np.ndarray) -> None:
+        if values.size == 0:
+            return
+        hashes = pd.util.hash_array(values)
+        index = (hashes >> np.uint64(64 - self.p)).astype("int64")
+        rest = hashes << np.uint64(self.p)
+        rank = np.minimum(_leading_zeros(rest) + 1, 64 - self.p + 1).astype("uint8")
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = self.registers.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(2.0 ** -self.registers.astype("float64"))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and empty:
+            # linear counting is more accurate for small cardinalities
+            return int(round(m * np.log(m / empty)))
+        return int(round(raw))
+
+
+class FrequentItems:
+    """ Misra-Gries heavy hitters, mergeable across chunks
+
+    Counts are underestimated by at most `error`, which never exceeds
+    n / (k + 1).
+
+    Args:
+    ----
+        k: int
+            The number of counters kept
+    """
+
+    def __init__(self, k: int = 256) -> None:
+        self.k = k
+        self.counters = {}
+        self.error = 0
+
+    def update(self, series: pd.Series) -> None:
+        counts = series.value_counts(dropna=True, sort=False)
+        self._merge_counts(dict(zip(counts.index.tolist(), counts.tolist())), 0)
+
+    def merge(self, other: "FrequentItems") -> None:
+        self._merge_counts(other.counters, other.error)
+
+    def _merge_counts(self, counts: dict, error: int) -> None:
+        for value, count in counts.items():
+            self.counters[value] = self.counters.get(value, 0) + count
+        self.error += error
+        if len(self.counters) > self.k:
+            # subtract the (k+1)-th largest count from every counter, drop the non-positive ones
+            cut = sorted(self.counters.values(), reverse=True)[self.k]
+            self.counters = {value: count - cut for value, count in self.counters.items() if count > cut}
+            self.error += cut
+
+    def most_common(self) -> tuple:
+        """ The values with the highest estimated count and that count """
+        if not self.counters:
+            return [], 0
+        top = max(self.counters.values())
+        return [value for value, count in self.counters.items() if count == top], top
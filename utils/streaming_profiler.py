@@ -0,0 +1,234 @@
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from utils.dataset_store import source_format
+from utils.profiler import N_SAMPLES, QUANTILES, histogram_labels, is_numerical_series, summary_dtype
+from utils.sketches import FrequentItems, HyperLogLog, KLLSketch, Moments
+
+STREAMING_CHUNKSIZE = 100_000
+# files above this size are profiled in streaming mode by default
+STREAMING_MIN_BYTES = 200 * 1024 * 1024
+
+
+def is_json_lines(path: str) -> bool:
+    """ Check if a .json file holds one record per line rather than a single array """
+    with open(path, "rb") as file:
+        for line in file:
+            stripped = line.strip()
+            if stripped:
+                return not stripped.startswith(b"[")
+    return True
+
+
+def read_chunks(path: str, chunksize: int = STREAMING_CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """ Read a CSV, JSON, JSON Lines or Parquet file in chunks of `chunksize` rows
+
+    CSV, JSON Lines (compressed or not) and Parquet files are streamed; a
+    JSON array can't be split without parsing it, so it is read in one go
+    and then sliced.
+
+    Args:
+    ----
+        path: str
+            The path to the file
+        chunksize: int
+            The number of rows per chunk
+
+    Returns:
+    -------
+        Iterator[pd.DataFrame]: The chunks
+    """
+    format, compression = source_format(path)
+    if format == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+    if format in ("json", "jsonl"):
+        # compressed files aren't sniffed, a compressed .json is read as an array
+        if format == "jsonl" or (compression is None and is_json_lines(path)):
+            with pd.read_json(path, lines=True, chunksize=chunksize, compression=compression) as reader:
+                yield from reader
+        else:
+            data = pd.read_json(path, compression=compression)
+            for start in range(0, len(data), chunksize):
+                yield data.iloc[start:start + chunksize]
+        return
+    with pd.read_csv(path, chunksize=chunksize, compression=compression) as reader:
+        yield from reader
+
+
+def source_columns(path: str) -> list:
+    """ The columns of a CSV or JSON file, reading only its first chunk """
+    for chunk in read_chunks(path, chunksize=1):
+        return chunk.columns.tolist()
+    return []
+
+
+class ColumnSketch:
+    """ Mergeable, bounded-memory summary of one column
+
+    Exact counts (rows, missing, valid), Welford moments and a KLL quantile
+    sketch for numbers, HyperLogLog for the unique count and Misra-Gries for
+    the most common values. A column stays numerical only as long as every
+    chunk is numerical.
+
+    Args:
+    ----
+        name: str
+            The column name
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.rows = 0
+        self.missing = 0
+        self.numerical = True
+        self.integer = True
+        self.nominal_dtype = None
+        self.moments = Moments()
+        self.quantiles = KLLSketch()
+        self.distinct = HyperLogLog()
+        self.frequent = FrequentItems()
+        self.samples = []
+
+    def update(self, series: pd.Series) -> None:
+        self.rows += len(series)
+        is_missing = series.isna()
+        self.missing += int(is_missing.sum())
+        valid = series[~is_missing]
+        if valid.empty:
+            return
+
+        chunk_numerical = is_numerical_series(series)
+        if self.numerical and not chunk_numerical:
+            self.numerical = False
+            self.moments, self.quantiles = None, None
+        if self.numerical:
+            values = pd.to_numeric(valid, errors="coerce").to_numpy(dtype="float64")
+            self.integer = self.integer and pd.api.types.is_integer_dtype(series.dtype)
+            self.moments.update(values)
+            self.quantiles.update(values)
+        elif chunk_numerical:
+            # numbers in a column that also holds text are read back as text
+            valid = valid.astype(str)
+
+        if len(self.samples) < N_SAMPLES:
+            uniques = pd.Series(valid.unique())
+            self.samples += uniques.sample(min(N_SAMPLES - len(self.samples), len(uniques)), random_state=42).tolist()
+        if self.nominal_dtype is None and not chunk_numerical:
+            self.nominal_dtype = summary_dtype(valid, valid.value_counts(sort=False))
+
+        self.distinct.update(valid.to_numpy())
+        self.frequent.update(valid)
+
+    def merge(self, other: "ColumnSketch") -> None:
+        self.rows += other.rows
+        self.missing += other.missing
+        self.integer = self.integer and other.integer
+        self.nominal_dtype = self.nominal_dtype or other.nominal_dtype
+        if self.numerical and other.numerical:
+            self.moments.merge(other.moments)
+            self.quantiles.merge(other.quantiles)
+        else:
+            self.numerical = False
+            self.moments, self.quantiles = None, None
+        self.distinct.merge(other.distinct)
+        self.frequent.merge(other.frequent)
+        self.samples = (self.samples + other.samples)[:N_SAMPLES]
+
+    def describe(self) -> tuple:
+        """ The (type, description) of the column, shaped like `profile_column`, plus an `error` entry """
+        valid = self.rows - self.missing
+        # the estimate can overshoot, there are never more distinct values than values
+        unique = min(self.distinct.estimate(), valid)
+        unique_error = int(np.ceil(self.distinct.relative_error * unique))
+
+        if self.numerical:
+            if valid == 0:
+                return "numerical", {
+                    "id": self.name, "quantiles": [np.nan] * len(QUANTILES), "chart_columns": [],
+                    "chart_data": [], "valid": 0, "missing": self.missing, "mean": np.nan,
+                    "std_dev": np.nan, "dtype": "number", "unique": 0, "min": np.nan, "max": np.nan,
+                    "samples": [], "error": {"quantile_rank": 0.0, "histogram_count": 0, "unique": 0},
+                }
+            as_python = int if self.integer else float
+            low, high = self.moments.min, self.moments.max
+            # the extremes are tracked exactly, the inner quantiles come from the sketch
+            quantiles = [low] + self.quantiles.quantiles(QUANTILES[1:-1]) + [high]
+            bins_count = unique if unique <= 5 else 10
+            if low == high:
+                low, high = low - 0.5, high + 0.5
+            edges = np.linspace(low, high, bins_count + 1)
+            below = np.append(self.quantiles.cdf(edges[:-1]), 1.0)
+            counts = np.diff(np.round(below * valid)).astype(int)
+            rank_error = self.quantiles.rank_error
+            return "numerical", {
+                "id": self.name,
+                "quantiles": [round(float(q), 0) for q in quantiles],
+                "chart_columns": histogram_labels(edges),
+                "chart_data": counts.tolist(),
+                "valid": valid,
+                "missing": self.missing,
+                "mean": round(self.moments.mean, 2),
+                "std_dev": round(self.moments.std, 2),
+                "dtype": "number",
+                "unique": unique,
+                "min": as_python(self.moments.min),
+                "max": as_python(self.moments.max),
+                "samples": [as_python(sample) for sample in self.samples],
+                "error": {
+                    "quantile_rank": rank_error,
+                    "histogram_count": int(np.ceil(2 * rank_error * valid)),
+                    "unique": unique_error,
+                },
+            }
+
+        most_com, most_com_count = self.frequent.most_common()
+        dtype = self.nominal_dtype
+        if dtype not in ("boolean", "date"):
+            dtype = "category" if self.rows and unique / self.rows < 0.5 else "string"
+        return "nominal", {
+            "id": self.name,
+            "valid": valid,
+            "missing": self.missing,
+            "unique": unique,
+            "most_com": str(most_com)[1:-1],
+            "most_com_count": most_com_count,
+            "dtype": dtype,
+            "samples": self.samples,
+            "error": {"unique": unique_error, "most_com_count": self.frequent.error},
+        }
+
+
+def stream_profiles(path: str, columns: list = None,
+                    chunksize: int = STREAMING_CHUNKSIZE) -> Iterator[tuple]:
+    """ Profile a file chunk by chunk with bounded memory
+
+    Args:
+    ----
+        path: str
+            The path to the CSV or JSON file
+        columns: list
+            The columns to profile, all of them by default
+        chunksize: int
+            The number of rows per chunk
+
+    Returns:
+    -------
+        Iterator[tuple]: After every chunk, the number of rows read so far and
+        the partial profiles as a dict column -> (type, description)
+    """
+    sketches = None
+    rows = 0
+    for chunk in read_chunks(path, chunksize):
+        if sketches is None:
+            columns = chunk.columns.tolist() if columns is None else columns
+            sketches = {column: ColumnSketch(column) for column in columns}
+        for column, sketch in sketches.items():
+            sketch.update(chunk[column])
+        rows += len(chunk)
+        yield rows, {column: sketch.describe() for column, sketch in sketches.items()}
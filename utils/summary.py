@@ -0,0 +1,104 @@
+from lida import Manager, TextGenerationConfig
+from lida.utils import clean_column_name
+
+from utils.data_explorer import dataset_columns, load_profiles
+from utils.dataset_store import Dataset, lida_frame
+from utils.incremental import extends_sketches, incremental_profiles, sketch_in_background
+from utils.instrumentation import instrumented, note_cache
+from utils.summary_cache import get_summary, invalidate_stale, put_summary
+
+
+def profile_fields(dataset: Dataset) -> list:
+    """ LIDA summary fields built from the stored column profiles
+
+    A CSV or JSON Lines file that grew by appending rows to a sketched
+    version uses the column sketches of `incremental` instead, so only its
+    new rows are read; the sketches of other versions are made in the
+    background.
+
+    Args:
+    ----
+        dataset: Dataset
+            The dataset handle
+
+    Returns:
+    -------
+        list: The `fields` of a LIDA summary, with the same properties as LIDA's default summary
+    """
+    columns = dataset_columns(dataset)
+    if extends_sketches(dataset):
+        profiles = incremental_profiles(dataset, columns)
+    else:
+        profiles = load_profiles(dataset, columns)
+        # ready for the rows appended to this version
+        sketch_in_background(dataset)
+    fields = []
+    for column in columns:
+        type, description = profiles[column]
+        properties = {"dtype": description["dtype"]}
+        if type == "numerical":
+            properties["std"] = description["std_dev"]
+            properties["min"] = description["min"]
+            properties["max"] = description["max"]
+        properties["samples"] = description["samples"]
+        properties["num_unique_values"] = description["unique"]
+        properties["semantic_type"] = ""
+        properties["description"] = ""
+        fields.append({"column": clean_column_name(column), "properties": properties})
+    return fields
+
+
+@instrumented("summarize")
+def summarize(lida: Manager, dataset: Dataset, summary_method: str,
+              textgen_config: TextGenerationConfig) -> dict:
+    """ Summarize the dataset like `lida.summarize`, reusing the Data Explorer profiles
+
+    The "default" and "llm" methods start from the stored column profiles
+    instead of recomputing the statistics. Summaries are cached in memory and
+    under `data/summaries/` by (dataset hash, method, model, temperature), so
+    all pages and later sessions reuse them; `use_cache=False` forces a new
+    one. The LIDA manager still gets the (sampled) data so that visualizations
+    can be executed.
+
+    Args:
+    ----
+        lida: Manager
+            The LIDA manager
+        dataset: Dataset
+            The dataset handle
+        summary_method: str
+            "default", "llm" or "columns"
+        textgen_config: TextGenerationConfig
+            The text generation config used by the "llm" method
+
+    Returns:
+    -------
+        dict: The summary
+    """
+    lida.check_textgen(config=textgen_config)
+    lida.data = lida_frame(dataset)
+    file_name = dataset.file_name
+
+    invalidate_stale(dataset)
+    cache_parts = (summary_method, textgen_config.model, textgen_config.temperature)
+    if textgen_config.use_cache:
+        summary = get_summary(dataset, *cache_parts)
+        if summary is not None:
+            note_cache(hit=True)
+            return summary
+    note_cache(hit=False)
+
+    summary = {
+        "name": file_name,
+        "file_name": file_name,
+        "dataset_description": "",
+    }
+    if summary_method != "columns":
+        summary["fields"] = profile_fields(dataset)
+    if summary_method == "llm":
+        summary = lida.summarizer.enrich(summary, text_gen=lida.text_gen, textgen_config=textgen_config)
+
+    summary["field_names"] = lida.data.columns.tolist()
+    summary["file_name"] = file_name
+    put_summary(dataset, *cache_parts, summary)
+    return summary
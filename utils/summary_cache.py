@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from utils.dataset_store import DATA_DIR, Dataset
+
+SUMMARIES_DIR = os.path.join(DATA_DIR, "summaries")
+# dataset path -> content hash of the version the cached summaries belong to
+INDEX_PATH = os.path.join(SUMMARIES_DIR, "index.json")
+
+# cache key -> summary, shared by all pages and sessions
+_summaries = {}
+_lock = threading.Lock()
+
+
+def summary_key(digest: str, summary_method: str, model: str, temperature: float) -> str:
+    parts = json.dumps([digest, summary_method, model, float(temperature)])
+    return hashlib.sha256(parts.encode("utf-8")).hexdigest()
+
+
+def _summary_path(digest: str, key: str) -> str:
+    return os.path.join(SUMMARIES_DIR, digest, f"{key}.json")
+
+
+def _write_json(path: str, content) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(content, file, default=str)
+    os.replace(tmp_path, path)
+
+
+def invalidate_stale(dataset: Dataset) -> None:
+    """ Drop the summaries of older versions of the dataset file
+
+    Summaries are keyed by content hash, so a changed file never hits an old
+    entry; this only reclaims the space of the entries it made obsolete.
+    """
+    path = os.path.abspath(dataset.path)
+    digest = dataset.digest
+    with _lock:
+        index = {}
+        if os.path.exists(INDEX_PATH):
+            with open(INDEX_PATH) as file:
+                index = json.load(file)
+        previous = index.get(path)
+        if previous == digest:
+            return
+        still_used = any(other == previous for other_path, other in index.items() if other_path != path)
+        if previous and not still_used:
+            shutil.rmtree(os.path.join(SUMMARIES_DIR, previous), ignore_errors=True)
+            for key in [key for key, (owner, _) in _summaries.items() if owner == previous]:
+                del _summaries[key]
+        index[path] = digest
+        _write_json(INDEX_PATH, index)
+
+
+def get_summary(dataset: Dataset, summary_method: str, model: str, temperature: float):
+    """ The cached summary, from memory or disk, or None """
+    digest = dataset.digest
+    key = summary_key(digest, summary_method, model, temperature)
+    with _lock:
+        if key in _summaries:
+            return _summaries[key][1]
+    path = _summary_path(digest, key)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        summary = json.load(file)
+    with _lock:
+        _summaries[key] = (digest, summary)
+    return summary
+
+
+def put_summary(dataset: Dataset, summary_method: str, model: str, temperature: float, summary: dict) -> None:
+    digest = dataset.digest
+    key = summary_key(digest, summary_method, model, temperature)
+    with _lock:
+        _summaries[key] = (digest, summary)
+        _write_json(_summary_path(digest, key), summary)
@@ -0,0 +1,163 @@
+import json
+import math
+
+from utils.tokens import count_tokens
+
+# default token budget of the summary inside a prompt
+PROMPT_SUMMARY_TOKENS = 1500
+
+# field properties each LLM stage reads, in column order of the encoded table
+STAGE_PROPERTIES = {
+    "goals": ("dtype", "semantic_type", "num_unique_values", "min", "max", "std", "samples", "description"),
+    "visualize": ("dtype", "semantic_type", "num_unique_values", "min", "max", "samples"),
+    "prep": ("dtype", "num_unique_values", "min", "max", "std", "samples"),
+}
+
+# richest first; `properties` None keeps all the properties of the stage
+FIDELITY_LEVELS = {
+    "full": {"digits": 6, "samples": 3, "sample_chars": 60, "text_chars": 200, "properties": None},
+    "compact": {"digits": 3, "samples": 2, "sample_chars": 24, "text_chars": 80, "properties": None},
+    "minimal": {"digits": 3, "samples": 0, "sample_chars": 0, "text_chars": 40,
+                "properties": ("dtype", "num_unique_values")},
+}
+
+# table headers of the properties
+HEADERS = {
+    "dtype": "dtype",
+    "semantic_type": "type",
+    "num_unique_values": "unique",
+    "min": "min",
+    "max": "max",
+    "std": "std",
+    "samples": "samples",
+    "description": "desc",
+}
+
+# short names of the relationship measures, see `utils.relationships.top_pairs`
+MEASURES = {"correlation": "r", "cramers_v": "V"}
+
+# summary keys that are part of the table or the header lines
+_LAYOUT_KEYS = {"name", "file_name", "dataset_description", "fields", "field_names", "relationships"}
+
+
+def _round(value, digits: int) -> str:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, int) or not math.isfinite(value):
+        return str(value)
+    return f"{value:.{digits}g}"
+
+
+def _clean(text: str) -> str:
+    # the table separators must not appear inside a cell
+    return " ".join(str(text).replace("|", "/").replace(";", ",").split())
+
+
+def _cell(value, level: dict) -> str:
+    if value is None or value == "":
+        return ""
+    if isinstance(value, (list, tuple)):
+        samples = [_cell(sample, level) for sample in value[:level["samples"]]]
+        return ";".join(sample[:level["sample_chars"]] for sample in samples)
+    text = _round(value, level["digits"])
+    if isinstance(value, str):
+        text = text[:level["text_chars"]]
+    return _clean(text)
+
+
+def _properties(level: str, stage: str) -> tuple:
+    properties = STAGE_PROPERTIES[stage]
+    kept = FIDELITY_LEVELS[level]["properties"]
+    if kept is not None:
+        properties = tuple(prop for prop in properties if prop in kept)
+    return properties
+
+
+def encode_field(field: dict, level: str = "compact", stage: str = "goals") -> str:
+    """ The table row of one summary field """
+    settings = FIDELITY_LEVELS[level]
+    properties = field.get("properties", {})
+    cells = [_clean(field.get("column"))]
+    cells += [_cell(properties.get(prop), settings) for prop in _properties(level, stage)]
+    return "|".join(cells)
+
+
+def encode_relationships(pairs: list) -> str:
+    """ The column pairs as one line, e.g. "Pclass~Fare r=-0.549; Survived~Sex V=0.543" """
+    return "; ".join(f"{_clean(pair['columns'][0])}~{_clean(pair['columns'][1])} "
+                     f"{MEASURES.get(pair['measure'], pair['measure'])}={_round(pair['value'], 3)}"
+                     for pair in pairs)
+
+
+def encode_summary(summary: dict, level: str = "compact", stage: str = "goals") -> str:
+    """ Encode a LIDA summary as a terse table for prompts
+
+    The Python repr of the summary repeats every property name per field and
+    carries full-precision floats and raw samples. The encoding has one header
+    line of property names and one `|` separated row per field, numbers rounded
+    and samples truncated according to the fidelity level, and only the
+    properties the stage reads. Column relationships, if any, take one more
+    line (except at the "minimal" level).
+
+    Args:
+    ----
+        summary: dict
+            The summary, as returned by `utils.summary.summarize`
+        level: str
+            A key of `FIDELITY_LEVELS`, from "full" to "minimal"
+        stage: str
+            A key of `STAGE_PROPERTIES`: "goals", "visualize" or "prep"
+
+    Returns:
+    -------
+        str: The encoded summary
+    """
+    settings = FIDELITY_LEVELS[level]
+    lines = [f"dataset: {summary.get('name') or summary.get('file_name')}"]
+    description = _cell(summary.get("dataset_description"), settings)
+    if description:
+        lines.append(f"description: {description}")
+
+    fields = summary.get("fields")
+    if fields:
+        headers = ["column"] + [HEADERS.get(prop, prop) for prop in _properties(level, stage)]
+        lines.append(f"fields ({len(fields)}):")
+        lines.append("|".join(headers))
+        lines += [encode_field(field, level, stage) for field in fields]
+    else:
+        lines.append(f"columns: {', '.join(_clean(name) for name in summary.get('field_names', []))}")
+
+    if summary.get("relationships") and level != "minimal":
+        lines.append(f"relationships: {encode_relationships(summary['relationships'])}")
+    if level == "full":
+        # anything else added to the summary, e.g. data quality findings
+        for key, value in summary.items():
+            if key not in _LAYOUT_KEYS:
+                lines.append(f"{key}: {json.dumps(value, default=str, separators=(',', ':'))}")
+    return "\n".join(lines)
+
+
+def fit_summary(summary: dict, token_budget: int = PROMPT_SUMMARY_TOKENS, stage: str = "goals",
+                model: str = "gpt-3.5-turbo") -> str:
+    """ The richest encoding of the summary that fits the token budget
+
+    Args:
+    ----
+        summary: dict
+            The summary
+        token_budget: int
+            The maximum number of tokens of the encoded summary
+        stage: str
+            A key of `STAGE_PROPERTIES`
+        model: str
+            The model whose tokenizer counts the tokens
+
+    Returns:
+    -------
+        str: The encoded summary, the "minimal" one when none fits
+    """
+    for level in FIDELITY_LEVELS:
+        encoded = encode_summary(summary, level, stage)
+        if count_tokens(encoded, model) <= token_budget:
+            return encoded
+    return encoded
@@ -0,0 +1,168 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+from utils.profiler import is_numerical_series
+
+# width in pixels of a rendered chart: matplotlib's default 6.4in figure at the 100 dpi of the renderer
+CHART_WIDTH = 640
+# distinct values parsed to decide whether a text column holds dates
+DETECT_VALUES = 1000
+# share of the rows of a downsampled time series that are bucket extremes, the others are a random sample
+EXTREMES_SHARE = 0.1
+# time series are bucketed only with at least this many distinct times per bucket on average
+MIN_TIMES_PER_BUCKET = 4
+
+
+def date_format(values: pd.Series) -> str:
+    """ The strftime format all the values are written in, if it is a full date, else None
+
+    The format is inferred from the first value like pandas does, and has to
+    have a year, a month and a day; every value must then parse with it.
+    dateutil's lenient parsing is not used, it reads "1st", "Jan", "10:30"
+    or "2020/2021" as dates.
+    """
+    values = values.astype(str)
+    if values.empty:
+        return None
+    with warnings.catch_warnings():
+        # day-first formats are guessed with a warning, every value is checked against them below
+        warnings.simplefilter("ignore")
+        format = guess_datetime_format(values.iloc[0])
+    if format is None or not ("%Y" in format or "%y" in format) or "%d" not in format or not any(
+            directive in format for directive in ("%m", "%b", "%B")):
+        return None
+    try:
+        pd.to_datetime(values, format=format, errors="raise")
+    except (ValueError, TypeError, OverflowError):
+        return None
+    return format
+
+
+def is_time_series(series: pd.Series) -> bool:
+    """ Whether the column holds dates: a datetime dtype, or text whose distinct values all are full dates
+
+    Numbers (e.g. years) are not taken as dates, see `date_format` for text.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return True
+    if is_numerical_series(series) or pd.api.types.is_bool_dtype(series.dtype):
+        return False
+    values = pd.Series(series.dropna().unique()[:DETECT_VALUES])
+    if len(values) < 2:
+        return False
+    return date_format(values) is not None
+
+
+def time_column(data: pd.DataFrame) -> str:
+    """ The first column of the frame holding dates, or None """
+    for column in data.columns:
+        if is_time_series(data[column]):
+            return column
+    return None
+
+
+def _as_times(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series
+    format = date_format(pd.Series(series.dropna().unique()[:DETECT_VALUES]))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return pd.to_datetime(series, format=format, errors="coerce")
+
+
+def _group_firsts(order: np.ndarray, sorted_buckets: np.ndarray) -> tuple:
+    starts = np.flatnonzero(np.diff(sorted_buckets)) + 1
+    starts = np.concatenate([[0], starts])
+    ends = np.append(starts[1:], len(order)) - 1
+    return order[starts], order[ends]
+
+
+def minmax_rows(times: pd.Series, values: pd.DataFrame, buckets: int) -> np.ndarray:
+    """ The rows holding the first, last, min and max value of every column in every time bucket
+
+    The time range is cut into `buckets` equal intervals, one per pixel
+    column of the chart; drawn at that width, the kept rows look like all of
+    them (min/max bucketing, M4). Rows without a time form one more bucket.
+
+    Args:
+    ----
+        times: pd.Series
+            The times of the rows
+        values: pd.DataFrame
+            The numeric columns whose extremes are kept
+        buckets: int
+            The number of time intervals
+
+    Returns:
+    -------
+        np.ndarray: The positions of the kept rows, in time order
+    """
+    if len(times) == 0:
+        return np.empty(0, dtype="int64")
+    times = _as_times(times)
+    present = times.notna().to_numpy()
+    nanos = times.to_numpy(dtype="datetime64[ns]").astype("int64")
+    bucket = np.full(len(nanos), -1, dtype="int64")
+    if present.any():
+        low, high = nanos[present].min(), nanos[present].max()
+        position = (nanos[present] - low) / max(high - low, 1)
+        bucket[present] = np.minimum((position * buckets).astype("int64"), buckets - 1)
+
+    # every sort is by bucket first, so the groups start at the same positions
+    order = np.lexsort((nanos, bucket))
+    sorted_buckets = bucket[order]
+    kept = list(_group_firsts(order, sorted_buckets))
+    for column in values.columns:
+        numbers = pd.to_numeric(values[column], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        missing = np.isnan(numbers)
+        kept.append(_group_firsts(np.lexsort((np.where(missing, np.inf, numbers), bucket)), sorted_buckets)[0])
+        kept.append(_group_firsts(np.lexsort((np.where(missing, np.inf, -numbers), bucket)), sorted_buckets)[0])
+    rows = np.unique(np.concatenate(kept))
+    # in time order, rows without a time first
+    return rows[np.lexsort((nanos[rows], bucket[rows]))]
+
+
+def downsample_time_series(data: pd.DataFrame, column: str, max_rows: int, width: int = CHART_WIDTH) -> pd.DataFrame:
+    """ At most `max_rows` rows of a time-indexed frame: a random sample plus the extremes of every time bucket
+
+    `EXTREMES_SHARE` of the rows are those with the first, last, min and max
+    of every numeric column in each of at most `width` time buckets (see
+    `minmax_rows`), so the spikes and the range of every series survive; the
+    others are a random sample of the remaining rows, so counts and means
+    stay close to those of the whole frame. A column with too few distinct
+    times for the buckets is not a series worth bucketing, and only the
+    random sample is returned.
+
+    Args:
+    ----
+        data: pd.DataFrame
+            The dataset
+        column: str
+            Its time column
+        max_rows: int
+            The maximum number of rows returned
+        width: int
+            The chart width in pixels, the maximum number of buckets
+
+    Returns:
+    -------
+        pd.DataFrame: The kept rows, all the columns, in time order when bucketed
+    """
+    if len(data) <= max_rows:
+        return data
+    numeric = [name for name in data.columns if name != column and is_numerical_series(data[name])]
+    # a bucket keeps up to 2 rows (first, last) plus 2 per numeric column (min, max), and rows
+    # without a time take one more bucket
+    buckets = min(width, int(max_rows * EXTREMES_SHARE) // (2 + 2 * len(numeric)) - 1)
+    times = _as_times(data[column])
+    if buckets < 1 or times.nunique() < MIN_TIMES_PER_BUCKET * buckets:
+        return data.sample(max_rows, random_state=42)
+    rows = minmax_rows(times, data[numeric], buckets)
+    rest = np.setdiff1d(np.arange(len(data)), rows, assume_unique=True)
+    sampled = np.random.default_rng(42).choice(rest, size=min(max_rows - len(rows), len(rest)), replace=False)
+    rows = np.concatenate([rows, sampled])
+    nanos = times.iloc[rows].to_numpy(dtype="datetime64[ns]").astype("int64")
+    return data.iloc[rows[np.argsort(nanos, kind="stable")]]
@@ -0,0 +1,42 @@
+import logging
+from functools import lru_cache
+
+import tiktoken
+
+logger = logging.getLogger("lida")
+
+# rough characters per token for English and JSON text, used when no tokenizer can be loaded
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as error:
+        # tiktoken downloads its vocabularies on first use
+        logger.info(f"No tokenizer available, estimating token counts: {error}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """ Count the tokens of `text` with the tokenizer of `model`
+
+    Args:
+    ----
+        text: str
+            The text to count
+        model: str
+            The model whose tokenizer is used, cl100k_base when it is unknown
+
+    Returns:
+    -------
+        int: The number of tokens, estimated from the length when no tokenizer is available
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))